@@ -0,0 +1,45 @@
+"""
+SQLite connection settings for serving concurrent predictions (see DATABASES in settings.py).
+"""
+
+# Run on every new connection, in this order
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',  # Readers no longer block the writer, nor the writer readers; persists in the file
+    'synchronous': 'NORMAL',  # fsync at checkpoints rather than every commit; safe from corruption in WAL mode
+    'busy_timeout': 5000,  # ms a connection waits for the write lock before "database is locked"
+    'cache_size': -64000,  # Page cache per connection, in KiB when negative (64 MB)
+    'mmap_size': 256 * 1024 * 1024,  # Read pages through a memory map instead of read() calls
+    'temp_store': 'MEMORY',  # Sorts and temporary indexes stay off disk
+}
+
+# Persistent connections: a connection is kept for this many seconds instead of opened per request
+SQLITE_CONN_MAX_AGE = 600
+
+
+def sqlite_init_command(pragmas=None):
+    """PRAGMA statements for OPTIONS['init_command']"""
+    pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+    return ';'.join(f'PRAGMA {name}={value}' for name, value in pragmas.items())
+
+
+def sqlite_database(name, pragmas=None, conn_max_age=SQLITE_CONN_MAX_AGE):
+    """A DATABASES entry for a SQLite file shared by concurrent request threads and workers
+
+    Transactions begin IMMEDIATE, taking the write lock up front: a transaction
+    that reads and then writes cannot be refused halfway through (SQLite skips
+    the busy timeout when a read lock has to be upgraded), it waits its turn.
+    """
+    pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+        'CONN_MAX_AGE': conn_max_age,
+        # A persistent connection broken since the last request is replaced rather than failing that request
+        'CONN_HEALTH_CHECKS': conn_max_age != 0,
+        'OPTIONS': {
+            'init_command': sqlite_init_command(pragmas),
+            'transaction_mode': 'IMMEDIATE',
+            # Seconds, for Python's sqlite3 module; kept in step with busy_timeout
+            'timeout': pragmas.get('busy_timeout', 5000) / 1000,
+        },
+    }
@@ -3,6 +3,7 @@ Django settings for KindeyStoneClassification project.
 """
 import os
 from pathlib import Path
+from .database import sqlite_database
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -63,11 +64,9 @@ TEMPLATES = [
 WSGI_APPLICATION = 'KindeyStoneClassification.wsgi.application'
 
 # Database
+# WAL, busy timeout and persistent connections for concurrent prediction writes (see database.py)
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': sqlite_database(BASE_DIR / 'db.sqlite3')
 }
 
 # Password validation
@@ -107,4 +106,83 @@ LOGIN_URL = 'user:login'
 LOGOUT_REDIRECT_URL = 'user:login'
 
 # Default primary key field type
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Prediction batching
+PREDICTION_MAX_BATCH_FILES = 200  # Max images accepted by the batch predict endpoint
+DATA_UPLOAD_MAX_NUMBER_FILES = PREDICTION_MAX_BATCH_FILES  # Django refuses more files than this (default 100) before the view runs
+PREDICTION_MAX_BATCH_SIZE = 64  # Max rows per micro-batched model.predict call
+PREDICTION_BATCH_WINDOW_MS = 10  # How long the micro-batcher waits for concurrent requests
+
+# Background prediction jobs
+PREDICTION_JOB_WORKERS = 2  # Worker threads running queued predictions
+PREDICTION_JOB_QUEUE_SIZE = 32  # Jobs allowed to wait for a worker before new ones are rejected
+PREDICTION_JOB_STALE_SECONDS = 300  # A queued or running job untouched this long is failed when polled (its worker restarted)
+
+# Ensemble prediction
+ENSEMBLE_MAX_WORKERS = 5  # Threads running ensemble members in parallel
+
+# Model warm-up
+MODEL_WARMUP_MODELS = ['cnn_model', 'decision_tree', 'random_forest', 'xgboost', 'knn']  # Preloaded and traced before a worker reports ready
+MODEL_WARMUP_ON_STARTUP = os.environ.get('MODEL_WARMUP_ON_STARTUP') == '1'  # Warm up from AppConfig.ready() (set it for uvicorn/daphne; gunicorn.conf.py warms each worker itself)
+
+# Loaded model cache
+MODEL_CACHE_MAX_BYTES = 2 * 1024 ** 3  # Memory budget per worker; least recently used models are evicted beyond it (None = unbounded)
+MODEL_CACHE_PINNED = ['scaler', 'feature_extractor']  # Never evicted; every classical model needs them
+
+# Shared model memory across gunicorn workers
+MODEL_MMAP_MODE = 'r'  # joblib mmap_mode for artefacts written by export_mmap_models (None always loads the pickles)
+MODEL_PRELOAD_BEFORE_FORK = ['scaler', 'decision_tree', 'random_forest', 'xgboost', 'knn']  # Loaded in the gunicorn master when GUNICORN_PRELOAD=1
+
+# Content-hash prediction cache
+PREDICTION_CACHE_MAX_ENTRIES = 4096  # Cached (image, model, artefact versions) results per worker
+PREDICTION_CACHE_TTL_SECONDS = 3600  # How long a cached result is served
+
+# Classical model features
+ML_FEATURE_SET = 'raw'  # 'reduced' uses the artefacts written by train_reduced_models to models_consolidated/reduced/
+
+# Approximate nearest-neighbour KNN (knn_ann), built by the build_knn_index command
+ANN_KNN_NPROBE = 8  # Inverted lists scanned per query; higher raises recall and latency (n_lists is exact)
+
+# Tree models (decision_tree, random_forest, xgboost)
+TREE_ENGINE_ENABLED = True  # Serve them from flat numpy node tables (ml_utils/tree_engine.py) instead of the pickles
+
+# CNN runtime
+CNN_PREFER_TFLITE = True  # Serve models_consolidated/tflite/*.tflite (export_tflite_model) instead of the .h5 when present
+TFLITE_NUM_THREADS = None  # Interpreter threads per worker (None lets TensorFlow Lite decide)
+
+# Out-of-process inference (manage.py runinference)
+INFERENCE_SERVER = None  # 'unix:/path/inference.sock' or '127.0.0.1:8765'; None predicts in the web worker
+INFERENCE_POOL_SIZE = 4  # Pipelined connections per web worker
+INFERENCE_TIMEOUT_SECONDS = 30  # Per request, after which predict/ answers 504 (only an unreachable server is retried in-process)
+INFERENCE_RETRY_SECONDS = 5  # How long a server that refused a connection is skipped
+INFERENCE_SERVER_WORKERS = 8  # Request threads in the inference server
+
+# ASGI
+ASYNC_VIEWS = False  # Route predict/, models/ and history/ to the async views (enable under uvicorn/daphne)
+ASYNC_INFERENCE_WORKERS = 4  # Executor threads that run inference for the async views
+
+# Streaming uploads (predict/)
+PREDICTION_MAX_UPLOAD_BYTES = 10 * 1024 * 1024  # Larger uploads are refused while they stream in (matches the 10MB shown on the dashboard)
+PREDICTION_MAX_IMAGE_PIXELS = 50_000_000  # Refused as soon as the image header is parsed, before the pixels are decoded
+
+# Image preprocessing (shared by training commands and serving)
+PREPROCESSING_RESAMPLE = 'bicubic'  # Filter used to resize to 224x224: nearest, box, bilinear, hamming, bicubic or lanczos
+PREPROCESSING_FAST_DECODE = False  # Decode JPEGs at a reduced DCT scale and box-reduce before the filter (benchmark_decode); changes model inputs, so check held-out accuracy before enabling
+
+# Metrics (classification/metrics/, Prometheus text format, one worker="<pid>" series per process)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # When set, scrapers must send 'Authorization: Bearer <token>' and METRICS_ALLOWED_IPS is not used
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']  # Scrapers allowed without a token; requests relayed by a proxy (X-Forwarded-For) are refused, as their address is the proxy's
+METRICS_DIR = os.environ.get('METRICS_DIR')  # Each process exports its metrics here so any gunicorn worker can serve all of them; unset serves only the worker scraped
+METRICS_EXPORT_INTERVAL_SECONDS = 5  # How stale the other workers' series may be in a scrape
+
+# History API (history/)
+HISTORY_PAGE_MAX_SIZE = 100  # Largest ?limit= a client may ask for
+
+# History writes (classification/history_writer.py)
+HISTORY_WRITE_MODE = 'group'  # 'immediate' inserts per request; 'group' shares a commit between concurrent requests; 'deferred' answers before the commit (queued rows are lost on a crash)
+HISTORY_WRITE_BATCH_SIZE = 500  # Most rows per bulk insert
+HISTORY_FLUSH_INTERVAL_MS = 200  # How long 'deferred' mode waits for a batch to fill before committing
+
+# Analytics API (analytics/, served from DailyHistoryRollup; rebuild with backfill_history_rollups)
+ANALYTICS_MAX_DAYS = 365  # Longest ?days= window a client may ask for
@@ -0,0 +1,168 @@
+from collections import defaultdict
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, IntegerField, Sum, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import ClassificationHistory, DailyHistoryRollup, normalize_confidence
+
+# CLASS_DETAILS[1]['name'] in prediction.py: the class counted as stone-positive
+STONE_CLASS = 'Stone'
+
+
+def _add_increment(increments, user_id, day, model_used, values):
+    # Every row also counts towards the all-users bucket, keyed by user id None
+    for bucket_user_id in (user_id, None):
+        totals = increments[(bucket_user_id, day, model_used)]
+        for index, value in enumerate(values):
+            totals[index] += value
+
+
+def rollup_increments(entries, sign=1):
+    """Per (user id, day, model) changes to the rollups for added (sign=1) or removed (-1) history rows"""
+    increments = defaultdict(lambda: [0, 0, 0.0])
+    for entry in entries:
+        _add_increment(increments, entry.user_id, timezone.localdate(entry.timestamp), entry.model_used, (
+            sign,
+            sign if entry.predicted_class == STONE_CLASS else 0,
+            sign * normalize_confidence(entry.prediction_confidence)
+        ))
+    return increments
+
+
+def apply_rollup_increments(increments):
+    """Add increments to the rollups, creating the buckets seen for the first time
+
+    Runs in the caller's transaction when there is one; with transaction_mode
+    IMMEDIATE the write lock is already held, so the update-or-create cannot race.
+    """
+    with transaction.atomic():
+        for (user_id, day, model_used), (analyses, stone_positive, confidence_sum) in increments.items():
+            updated = DailyHistoryRollup.objects.filter(user_id=user_id, day=day, model_used=model_used).update(
+                analyses=F('analyses') + analyses,
+                stone_positive=F('stone_positive') + stone_positive,
+                confidence_sum=F('confidence_sum') + confidence_sum
+            )
+            # A bucket already gone (its user was deleted) has nothing left to subtract from
+            if not updated and analyses > 0:
+                DailyHistoryRollup.objects.create(
+                    user_id=user_id, day=day, model_used=model_used, analyses=analyses,
+                    stone_positive=stone_positive, confidence_sum=confidence_sum
+                )
+
+
+def record_history_rows(entries, sign=1):
+    """Fold newly written (or, with sign=-1, deleted) history rows into the rollups"""
+    if entries:
+        apply_rollup_increments(rollup_increments(entries, sign))
+
+
+def _aggregate_increments(history, sign=1):
+    """rollup_increments() computed by the database for a ClassificationHistory queryset"""
+    rows = (
+        history.annotate(day=TruncDate('timestamp'))
+        .values('user_id', 'day', 'model_used')
+        .annotate(
+            analyses=Count('id'),
+            stone_positive=Sum(Case(When(predicted_class=STONE_CLASS, then=1), default=0,
+                                    output_field=IntegerField())),
+            # normalize_confidence(), for the percentages older dashboard saves stored
+            confidence_sum=Sum(Case(When(prediction_confidence__gt=1, then=F('prediction_confidence') / 100.0),
+                                    default=F('prediction_confidence'), output_field=FloatField()))
+        )
+        .order_by()
+    )
+    increments = defaultdict(lambda: [0, 0, 0.0])
+    for row in rows:
+        _add_increment(increments, row['user_id'], row['day'], row['model_used'], (
+            sign * row['analyses'], sign * row['stone_positive'], sign * row['confidence_sum']
+        ))
+    return increments
+
+
+def remove_history_rows(history):
+    """Take the rows of a ClassificationHistory queryset out of the rollups before they are deleted"""
+    apply_rollup_increments(_aggregate_increments(history, sign=-1))
+
+
+def remove_user_from_rollups(user):
+    """Take a user's rows out of the rollups before the user is deleted
+
+    The user's own rollups hold exactly what their rows added, so this is one
+    update per day and model rather than one per history row. The user's
+    history rows then go with the cascade without touching the rollups again.
+    """
+    increments = {
+        (None, day, model_used): [-analyses, -stone_positive, -confidence_sum]
+        for day, model_used, analyses, stone_positive, confidence_sum in DailyHistoryRollup.objects.filter(
+            user=user
+        ).values_list('day', 'model_used', 'analyses', 'stone_positive', 'confidence_sum')
+    }
+    apply_rollup_increments(increments)
+    DailyHistoryRollup.objects.filter(user=user).delete()
+
+
+def rebuild_rollups(chunk_size=10000, stdout=None):
+    """Recompute every rollup from ClassificationHistory, reading it in primary-key chunks
+
+    Everything runs in one transaction: a row written or deleted while the
+    rollups were half rebuilt would otherwise be counted twice or subtracted
+    from a bucket it was never added back to. With transaction_mode IMMEDIATE
+    history writes wait for the rebuild to commit; the chunks only bound how
+    many rows each aggregate query reads.
+    """
+    with transaction.atomic():
+        last_id = ClassificationHistory.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        DailyHistoryRollup.objects.all().delete()
+
+        for start in range(0, last_id, chunk_size):
+            end = min(start + chunk_size, last_id)
+            apply_rollup_increments(_aggregate_increments(
+                ClassificationHistory.objects.filter(id__gt=start, id__lte=end)
+            ))
+            if stdout is not None:
+                stdout.write(f"Rolled up history rows {start + 1}-{end} of {last_id}")
+
+
+def _rate(part, whole):
+    return round(part / whole * 100, 2) if whole else None
+
+
+def _summary(analyses, stone_positive, confidence_sum):
+    return {
+        'analyses': analyses,
+        'stone_positive': stone_positive,
+        'stone_positive_rate': _rate(stone_positive, analyses),
+        'average_confidence': round(confidence_sum / analyses, 4) if analyses else None,
+    }
+
+
+def history_statistics(user=None, days=30):
+    """Statistics over the last ``days`` days for one user, or all users when ``user`` is None
+
+    Reads at most ``days`` x models rollup rows, however long the history is.
+    """
+    since = timezone.localdate() - timedelta(days=days - 1)
+    rollups = DailyHistoryRollup.objects.filter(day__gte=since)
+    rollups = rollups.filter(user=user) if user is not None else rollups.filter(user__isnull=True)
+
+    totals = [0, 0, 0.0]
+    per_model = defaultdict(lambda: [0, 0, 0.0])
+    per_day = defaultdict(lambda: [0, 0, 0.0])
+    for rollup in rollups.values_list('day', 'model_used', 'analyses', 'stone_positive', 'confidence_sum'):
+        day, model_used, values = rollup[0], rollup[1], rollup[2:]
+        for bucket in (totals, per_model[model_used], per_day[day]):
+            for index, value in enumerate(values):
+                bucket[index] += value
+
+    return {
+        'since': since.isoformat(),
+        'days': days,
+        'totals': _summary(*totals),
+        'per_model': [
+            {'model': model_used, **_summary(*values)} for model_used, values in sorted(per_model.items())
+        ],
+        'per_day': [
+            {'day': day.isoformat(), **_summary(*values)} for day, values in sorted(per_day.items())
+        ],
+    }
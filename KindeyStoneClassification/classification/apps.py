@@ -1,6 +1,21 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 class ClassificationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'classification'
-    verbose_name = 'Classification'
\ No newline at end of file
+    verbose_name = 'Classification'
+    
+    def ready(self):
+        # Keeps the analytics rollups in step with history rows saved or deleted one at a time
+        from . import signals
+        
+        # Both are opted into by the server's environment, so management commands, tests and
+        # other one-off processes never start them
+        if getattr(settings, 'METRICS_DIR', None):
+            from .ml_utils.metrics import registry
+            registry.start_export(settings.METRICS_DIR, getattr(settings, 'METRICS_EXPORT_INTERVAL_SECONDS', 5))
+        
+        if getattr(settings, 'MODEL_WARMUP_ON_STARTUP', False):
+            from .ml_utils.model_loader import model_manager
+            model_manager.start_warm_up(getattr(settings, 'MODEL_WARMUP_MODELS', []))
@@ -0,0 +1,117 @@
+import base64
+import hashlib
+from datetime import datetime
+from django.db.models import Q
+from .models import ClassificationHistory
+
+# Newest first, with the primary key breaking ties between equal timestamps
+HISTORY_ORDERING = ('-timestamp', '-id')
+
+
+class InvalidCursor(ValueError):
+    """A before/since parameter that was not produced by encode_cursor"""
+
+
+def encode_cursor(item):
+    """Opaque keyset position of a history row: its (timestamp, id)"""
+    raw = f"{item.timestamp.isoformat()}|{item.id}".encode('ascii')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('ascii')
+        timestamp, item_id = raw.split('|')
+        return datetime.fromisoformat(timestamp), int(item_id)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor(f"Invalid history cursor: {cursor}")
+
+
+def user_history(user):
+    return ClassificationHistory.objects.filter(user=user)
+
+
+def history_etag(user, query_string):
+    """Changes whenever the user's newest row does
+
+    One index seek, so a poll that ends in a 304 stays cheap however long the
+    history is. Deleting an older row (admin only) does not change it.
+    """
+    latest = _latest_id(user).first()
+    return _etag(user, latest, query_string)
+
+
+async def ahistory_etag(user, query_string):
+    """history_etag() for async views"""
+    latest = await _latest_id(user).afirst()
+    return _etag(user, latest, query_string)
+
+
+def _latest_id(user):
+    return user_history(user).order_by(*HISTORY_ORDERING).values_list('id', flat=True)
+
+
+def _etag(user, latest, query_string):
+    key = f"{user.pk}|{latest}|{query_string}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def serialize_history_item(item):
+    return {
+        'id': item.id,
+        'predicted_class': item.predicted_class,
+        'model_used': item.model_used,
+        'confidence': round(item.confidence_percent, 1),
+        'timestamp': item.timestamp.isoformat(),
+        'image_url': item.uploaded_image.url if item.uploaded_image else '',
+        'cursor': encode_cursor(item),
+    }
+
+
+def history_page(user, before=None, since=None, limit=10):
+    """One page of a user's history, newest first
+
+    ``before`` pages back through older rows; ``since`` returns only rows
+    newer than a cursor the client already holds. Both seek on
+    (timestamp, id), so a page costs the same however deep it is.
+    ``has_more`` means another request with ``next_cursor`` (older rows)
+    or ``latest_cursor`` (newer rows, for ``since``) has more to return.
+    """
+    queryset = _page_queryset(user, before, since, limit)
+    return _page(list(queryset), before, since, limit)
+
+
+async def ahistory_page(user, before=None, since=None, limit=10):
+    """history_page() for async views, read with the async ORM"""
+    queryset = _page_queryset(user, before, since, limit)
+    return _page([item async for item in queryset], before, since, limit)
+
+
+def _page_queryset(user, before, since, limit):
+    """The rows of a page plus one, which tells whether there are more"""
+    queryset = user_history(user)
+    if before is not None:
+        timestamp, item_id = decode_cursor(before)
+        # The redundant bound on timestamp lets the database seek instead of filtering the whole history
+        queryset = queryset.filter(
+            Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=item_id), timestamp__lte=timestamp
+        )
+    if since is not None:
+        timestamp, item_id = decode_cursor(since)
+        queryset = queryset.filter(
+            Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=item_id), timestamp__gte=timestamp
+        )
+        # Oldest new rows first, so a burst larger than one page is caught up on in order
+        return queryset.order_by('timestamp', 'id')[:limit + 1]
+    return queryset.order_by(*HISTORY_ORDERING)[:limit + 1]
+
+
+def _page(items, before, since, limit):
+    has_more = len(items) > limit
+    items = items[:limit][::-1] if since is not None else items[:limit]
+    return {
+        'items': [serialize_history_item(item) for item in items],
+        'has_more': has_more,
+        'next_cursor': encode_cursor(items[-1]) if items and since is None and has_more else None,
+        'latest_cursor': encode_cursor(items[0]) if items and before is None else since,
+    }
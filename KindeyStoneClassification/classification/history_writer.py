@@ -0,0 +1,225 @@
+import asyncio
+import atexit
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import OperationalError, close_old_connections, transaction
+from .analytics import record_history_rows
+from .ml_utils.metrics import HISTORY_WRITE_BATCH_ROWS, HISTORY_WRITE_SECONDS
+from .models import ClassificationHistory
+
+HISTORY_WRITE_MODES = ('immediate', 'group', 'deferred')
+
+# Attempts per batch while another process holds the SQLite write lock
+WRITE_ATTEMPTS = 3
+
+_STOP = object()
+
+
+class PredictionOwnerMismatch(Exception):
+    """An entry reused the prediction_id of a row that belongs to another user"""
+
+
+class HistoryWriter:
+    """Insert ClassificationHistory rows in batches, one bulk_create and transaction per batch
+
+    ``mode`` decides when a prediction's row is durable:
+
+    immediate: the request inserts its own row before it responds.
+    group: the request queues its row and waits for the commit of the batch
+        holding it, so concurrent predictions share one transaction (group commit).
+    deferred: the request returns as soon as its row is queued; rows are
+        committed once ``max_batch_size`` are waiting or ``flush_interval_ms``
+        has passed. Rows still queued if the process dies are lost, and
+        responses carry no history id.
+
+    Rows are keyed by ``prediction_id``: saving one prediction twice returns
+    the id of the existing row instead of adding another. Only the row's own
+    user can resolve to it; an entry from anyone else fails with
+    PredictionOwnerMismatch (in deferred mode it is logged and dropped). Rows
+    that are new are added to the analytics rollups in the same transaction.
+    """
+
+    def __init__(self, mode='group', max_batch_size=500, flush_interval_ms=200):
+        if mode not in HISTORY_WRITE_MODES:
+            raise ValueError(f"HISTORY_WRITE_MODE must be one of {', '.join(HISTORY_WRITE_MODES)}, not {mode!r}")
+        self.mode = mode
+        self._max_batch_size = max_batch_size
+        # A group commit takes whatever queued while the last batch was written, without waiting for more
+        self._window = flush_interval_ms / 1000.0 if mode == 'deferred' else 0.0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def save(self, entry):
+        """Record an unsaved ClassificationHistory; returns its id, or None in deferred mode"""
+        if self.mode == 'immediate':
+            return _unwrap(self._insert([entry]))[0]
+        future = self.submit(entry)
+        return future.result() if self.mode == 'group' else None
+
+    async def asave(self, entry):
+        """save() for async views; a group commit is awaited without holding a thread"""
+        if self.mode == 'immediate':
+            return _unwrap(await sync_to_async(self._insert)([entry]))[0]
+        future = self.submit(entry)
+        return await asyncio.wrap_future(future) if self.mode == 'group' else None
+
+    def save_many(self, entries):
+        """save() for several entries; outside deferred mode they share one transaction"""
+        if self.mode != 'deferred':
+            return _unwrap(self._insert(entries))
+        for entry in entries:
+            self.submit(entry)
+        return [None] * len(entries)
+
+    def submit(self, entry):
+        """Queue an entry for the writer thread; the future resolves to its id"""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((entry, future))
+        return future
+
+    def close(self, timeout=10):
+        """Commit every queued row and stop the writer thread"""
+        with self._worker_lock:
+            worker, self._worker = self._worker, None
+        if worker is not None:
+            self._queue.put(_STOP)
+            worker.join(timeout)
+
+    def _ensure_worker(self):
+        # Started on first use, so each gunicorn worker gets its own thread after the fork
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='history-writer', daemon=True)
+                self._worker.start()
+
+    def _collect(self):
+        """Wait for the first entry, then keep gathering until the batch is full or the window closes"""
+        first = self._queue.get()
+        if first is _STOP:
+            return [], True
+        pending = [first]
+        deadline = time.monotonic() + self._window
+
+        while len(pending) < self._max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return pending, True
+            pending.append(item)
+
+        return pending, False
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            pending, stopping = self._collect()
+            if not pending:
+                continue
+            try:
+                ids = self._insert([entry for entry, _ in pending])
+            except Exception as e:
+                print(f"✗ Could not write {len(pending)} history entries: {str(e)}")
+                for _, future in pending:
+                    future.set_exception(e)
+            else:
+                for (_, future), history_id in zip(pending, ids):
+                    if isinstance(history_id, PredictionOwnerMismatch):
+                        print(f"✗ Dropped history entry: {str(history_id)}")
+                        future.set_exception(history_id)
+                    else:
+                        future.set_result(history_id)
+            finally:
+                close_old_connections()
+
+    def _insert(self, entries):
+        """Insert a batch in one transaction and return the id of each entry's row
+
+        An entry whose prediction_id belongs to another user's row gets a
+        PredictionOwnerMismatch in place of its id; the rest of the batch is written.
+        """
+        # Two saves of one prediction in the same batch become one row
+        rows = {}
+        for entry in entries:
+            if entry.prediction_id is None:
+                entry.prediction_id = uuid.uuid4()
+            rows.setdefault((entry.prediction_id, entry.user_id), entry)
+
+        start = time.perf_counter()
+        for attempt in range(1, WRITE_ATTEMPTS + 1):
+            try:
+                with transaction.atomic():
+                    owners = dict(
+                        ClassificationHistory.objects.filter(prediction_id__in={key[0] for key in rows})
+                        .values_list('prediction_id', 'user_id')
+                    )
+                    existing = set(owners)
+                    # A new prediction_id goes to the first user in the batch that saves it
+                    owned = [row for (prediction_id, user_id), row in rows.items()
+                             if owners.setdefault(prediction_id, user_id) == user_id]
+                    # A prediction that already has a row conflicts on prediction_id; the no-op update
+                    # makes the insert return the existing row's id instead of failing
+                    ClassificationHistory.objects.bulk_create(
+                        owned,
+                        update_conflicts=True,
+                        unique_fields=['prediction_id'],
+                        update_fields=['prediction_id']
+                    )
+                    record_history_rows([row for row in owned if row.prediction_id not in existing])
+                break
+            except OperationalError:
+                if attempt == WRITE_ATTEMPTS:
+                    raise
+                time.sleep(0.05 * attempt)
+
+        HISTORY_WRITE_SECONDS.observe(time.perf_counter() - start, mode=self.mode)
+        HISTORY_WRITE_BATCH_ROWS.observe(len(owned), mode=self.mode)
+        return [
+            rows[entry.prediction_id, entry.user_id].pk if owners[entry.prediction_id] == entry.user_id
+            else PredictionOwnerMismatch(f'Prediction {entry.prediction_id} belongs to another user')
+            for entry in entries
+        ]
+
+
+def _unwrap(ids):
+    """Raise the first PredictionOwnerMismatch among the ids _insert returned"""
+    for history_id in ids:
+        if isinstance(history_id, PredictionOwnerMismatch):
+            raise history_id
+    return ids
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_history_writer():
+    """The process-wide writer configured by settings.HISTORY_WRITE_MODE"""
+    global _writer
+    mode = getattr(settings, 'HISTORY_WRITE_MODE', 'group')
+    with _writer_lock:
+        if _writer is None or _writer.mode != mode:
+            if _writer is not None:
+                _writer.close()
+            _writer = HistoryWriter(
+                mode,
+                max_batch_size=getattr(settings, 'HISTORY_WRITE_BATCH_SIZE', 500),
+                flush_interval_ms=getattr(settings, 'HISTORY_FLUSH_INTERVAL_MS', 200)
+            )
+        return _writer
+
+
+@atexit.register
+def _flush_on_exit():
+    # Deferred rows still queued at a clean shutdown are committed rather than dropped
+    if _writer is not None:
+        _writer.close()
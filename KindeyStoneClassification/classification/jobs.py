@@ -0,0 +1,99 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from .models import PredictionJob
+from .ml_utils.inference_rpc import get_inference_client
+from .ml_utils.model_loader import model_manager
+from .prediction import ENSEMBLE_MODEL_ID, run_prediction
+
+
+class JobQueueFull(Exception):
+    """Raised when the worker pool has no free slot for another job"""
+
+
+_max_workers = getattr(settings, 'PREDICTION_JOB_WORKERS', 2)
+_executor = ThreadPoolExecutor(max_workers=_max_workers, thread_name_prefix='prediction-job')
+
+# Running plus queued jobs are bounded so a burst cannot pile up unbounded work
+_slots = threading.BoundedSemaphore(_max_workers + getattr(settings, 'PREDICTION_JOB_QUEUE_SIZE', 32))
+
+
+def submit_prediction_job(job, image=None):
+    """Hand a saved PredictionJob to the worker pool
+
+    ``image`` is the upload still in memory, which saves the worker decoding
+    the saved file again; see run_prediction.
+    """
+    if not _slots.acquire(blocking=False):
+        raise JobQueueFull('Prediction queue is full, please retry shortly')
+
+    future = _executor.submit(_run_job, job.id, image)
+    future.add_done_callback(lambda _: _slots.release())
+
+
+def fail_if_stale(job):
+    """Mark a queued or running job failed once no worker has touched it for PREDICTION_JOB_STALE_SECONDS
+    
+    Jobs only live in the executor of the process that accepted them, so a
+    job caught by a restart of that process would otherwise never finish.
+    """
+    if job.status not in (PredictionJob.STATUS_PENDING, PredictionJob.STATUS_RUNNING):
+        return job
+    stale_after = timedelta(seconds=getattr(settings, 'PREDICTION_JOB_STALE_SECONDS', 300))
+    if timezone.now() - job.updated_at < stale_after:
+        return job
+    
+    # Only if the worker has not moved it on since it was read
+    PredictionJob.objects.filter(pk=job.pk, status=job.status, updated_at=job.updated_at).update(
+        status=PredictionJob.STATUS_FAILED, error='Prediction was interrupted, please try again'
+    )
+    job.refresh_from_db()
+    return job
+
+
+def _update_job(job, **fields):
+    for field, value in fields.items():
+        setattr(job, field, value)
+    job.save(update_fields=list(fields) + ['updated_at'])
+
+
+def _run_job(job_id, image=None):
+    """Worker entry point: load the model, predict and store the result"""
+    close_old_connections()
+    try:
+        job = PredictionJob.objects.get(pk=job_id)
+        _update_job(job, status=PredictionJob.STATUS_RUNNING, progress=10)
+
+        # A cold model is loaded here, off the request thread (the inference server loads its own)
+        if job.model_choice != ENSEMBLE_MODEL_ID and get_inference_client() is None:
+            model_manager.get_model(job.model_choice)
+        _update_job(job, progress=50)
+
+        result_data = run_prediction(
+            job.user,
+            job.model_choice,
+            job.uploaded_image.name.split('/')[-1],
+            job.original_name,
+            job.image_size,
+            image=image,
+            ensemble_models=job.ensemble_models,
+            ensemble_strategy=job.ensemble_strategy
+        )
+        _update_job(
+            job,
+            status=PredictionJob.STATUS_COMPLETED,
+            progress=100,
+            result=result_data,
+            history_id=result_data['history_id']
+        )
+
+    except Exception as e:
+        print(f"✗ Prediction job {job_id} failed: {str(e)}")
+        PredictionJob.objects.filter(pk=job_id).update(
+            status=PredictionJob.STATUS_FAILED, error=str(e)
+        )
+    finally:
+        close_old_connections()
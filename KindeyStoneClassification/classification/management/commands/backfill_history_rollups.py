@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from classification.analytics import rebuild_rollups
+from classification.models import DailyHistoryRollup
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the DailyHistoryRollup rows behind the analytics API from ClassificationHistory '
+        'in one transaction. History writes wait for it to finish, so run it while the site is quiet. '
+        'Needed once after migration 0005, and to repair the rollups after history rows were edited.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000, help='History rows read per aggregate query')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+
+        start = time.perf_counter()
+        rebuild_rollups(options['chunk_size'], stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Rebuilt {DailyHistoryRollup.objects.count()} rollup rows in {time.perf_counter() - start:.1f}s"
+        ))
@@ -0,0 +1,79 @@
+import os
+import statistics
+import time
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from classification.ml_utils.features import list_labelled_images
+from classification.ml_utils.model_loader import model_manager
+from classification.ml_utils.preprocessing import PreprocessedImage
+from classification.ml_utils.tflite_model import TFLiteModel
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the Keras CNN with its TensorFlow Lite export on a labelled held-out set: '
+        'accuracy and prediction drift, per-image latency and the memory each runtime adds.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--data-dir', required=True, help='One sub-directory of held-out images per class')
+        parser.add_argument('--classes', nargs='+', default=['Normal', 'Stone'])
+        parser.add_argument('--limit', type=int, default=500)
+
+    def handle(self, *args, **options):
+        from tensorflow.keras.models import load_model
+
+        cnn_info = model_manager.model_paths['cnn_model']
+        paths = {'keras': cnn_info.get('keras_path', cnn_info['path']), 'tflite': cnn_info['tflite_path']}
+        for path in paths.values():
+            if not os.path.exists(path):
+                raise CommandError(f"Model file not found: {path} (run export_tflite_model first)")
+
+        samples = list_labelled_images(options['data_dir'], options['classes'])[:options['limit']]
+        if not samples:
+            raise CommandError(f"No images found under {options['data_dir']}")
+        batches = [PreprocessedImage.from_file(path).batch for path, _ in samples]
+        labels = np.array([label for _, label in samples])
+
+        loaders = {
+            'keras': lambda: load_model(paths['keras']),
+            'tflite': lambda: TFLiteModel.load(paths['tflite'], num_threads=getattr(settings, 'TFLITE_NUM_THREADS', None)),
+        }
+
+        outputs = {}
+        self.stdout.write(
+            f"{'runtime':<8} {'file MB':>8} {'RSS +MB':>8} {'mean ms':>8} {'p95 ms':>8} {'accuracy':>9}"
+        )
+        for runtime, loader in loaders.items():
+            rss_before = self._rss_mb()
+            model = loader()
+            model.predict(batches[0], verbose=0)  # First call builds the graph / allocates tensors
+            rss_added = self._rss_mb() - rss_before
+
+            latencies = []
+            probabilities = []
+            for batch in batches:
+                start = time.perf_counter()
+                probabilities.append(model.predict(batch, verbose=0)[0])
+                latencies.append((time.perf_counter() - start) * 1000)
+            outputs[runtime] = np.array(probabilities)
+
+            p95 = statistics.quantiles(latencies, n=100)[94] if len(latencies) > 1 else latencies[0]
+            accuracy = (outputs[runtime].argmax(axis=1) == labels).mean()
+            self.stdout.write(
+                f"{runtime:<8} {os.path.getsize(paths[runtime]) / 1024 ** 2:>8.1f} {rss_added:>8.1f} "
+                f"{statistics.mean(latencies):>8.2f} {p95:>8.2f} {accuracy:>9.4f}"
+            )
+
+        drift = np.abs(outputs['keras'] - outputs['tflite'])
+        agreement = (outputs['keras'].argmax(axis=1) == outputs['tflite'].argmax(axis=1)).mean()
+        self.stdout.write(
+            f"Drift over {len(samples)} images: {agreement:.2%} same class, "
+            f"mean |dp| {drift.mean():.5f}, max |dp| {drift.max():.5f}"
+        )
+
+    def _rss_mb(self):
+        # Loading order matters: memory freed by the first runtime is not returned to the OS
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
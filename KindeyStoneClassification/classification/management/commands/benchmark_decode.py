@@ -0,0 +1,92 @@
+import io
+import random
+import statistics
+import time
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image, ImageDraw, ImageFilter
+from classification.ml_utils.preprocessing import PreprocessedImage, fast_decode_enabled
+
+FORMATS = {
+    'jpeg-gray': ('L', 'JPEG'),
+    'jpeg-rgb': ('RGB', 'JPEG'),
+    'png-gray': ('L', 'PNG'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Time decode + resize to 224x224 on synthetic large scan-like images, decoding at full '
+        'resolution and with the fast path (JPEG draft() scaling and reduce()), and report how far '
+        'the fast pixels drift from the full-resolution ones.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', default=['1024x1024', '2048x2048', '3000x2400', '4096x4096'])
+        parser.add_argument('--formats', nargs='+', default=list(FORMATS), choices=list(FORMATS))
+        parser.add_argument('--count', type=int, default=4, help='Distinct images per size and format')
+        parser.add_argument('--repeat', type=int, default=3, help='Timed decodes per image')
+        parser.add_argument('--quality', type=int, default=90, help='JPEG quality of the synthetic images')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [tuple(int(side) for side in size.lower().split('x')) for size in options['sizes']]
+        except ValueError:
+            raise CommandError('Sizes look like 2048x2048')
+
+        self.stdout.write(
+            f"Resample filter: {getattr(settings, 'PREPROCESSING_RESAMPLE', 'bicubic')}, "
+            f"fast decode {'on' if fast_decode_enabled() else 'off'} in serving"
+        )
+        self.stdout.write(
+            f"{'format':<10} {'size':>10} {'file KB':>8} {'full ms':>8} {'fast ms':>8} {'speedup':>8} "
+            f"{'mean |dp|':>10} {'max |dp|':>9}"
+        )
+        for format_name in options['formats']:
+            mode, image_format = FORMATS[format_name]
+            for width, height in sizes:
+                encoded = [
+                    self._synthetic_image((width, height), mode, image_format, options['quality'], seed)
+                    for seed in range(options['count'])
+                ]
+                full_ms, full_pixels = self._time_decodes(encoded, False, options['repeat'])
+                fast_ms, fast_pixels = self._time_decodes(encoded, True, options['repeat'])
+                drift = np.abs(np.stack(full_pixels) - np.stack(fast_pixels))
+
+                self.stdout.write(
+                    f"{format_name:<10} {f'{width}x{height}':>10} "
+                    f"{statistics.mean(len(data) for data in encoded) / 1024:>8.0f} "
+                    f"{full_ms:>8.2f} {fast_ms:>8.2f} {full_ms / fast_ms:>7.1f}x "
+                    f"{drift.mean():>10.5f} {drift.max():>9.5f}"
+                )
+
+    def _time_decodes(self, encoded, fast, repeat):
+        """Median ms per image over every decode, plus one set of resulting pixels"""
+        latencies = []
+        pixels = []
+        for data in encoded:
+            for attempt in range(repeat):
+                start = time.perf_counter()
+                image = PreprocessedImage.from_file(io.BytesIO(data), fast=fast)
+                latencies.append((time.perf_counter() - start) * 1000)
+            pixels.append(image.pixels)
+        return statistics.median(latencies), pixels
+
+    def _synthetic_image(self, size, mode, image_format, quality, seed):
+        """Soft gradients, blurred organ-like ellipses and sensor noise, roughly like a scan export"""
+        rng = random.Random(seed)
+        img = Image.radial_gradient('L').resize(size)
+        draw = ImageDraw.Draw(img)
+        for _ in range(12):
+            x, y = rng.randrange(size[0]), rng.randrange(size[1])
+            rx, ry = rng.randrange(size[0] // 20, size[0] // 5), rng.randrange(size[1] // 20, size[1] // 5)
+            draw.ellipse((x - rx, y - ry, x + rx, y + ry), fill=rng.randrange(40, 255))
+        img = img.filter(ImageFilter.GaussianBlur(max(size) / 400))
+        img = Image.blend(img, Image.effect_noise(size, 40), 0.15)
+
+        if mode == 'RGB':
+            img = Image.merge('RGB', (img, img.point(lambda v: v * 0.9), img.point(lambda v: v * 0.8)))
+        buffer = io.BytesIO()
+        img.save(buffer, image_format, **({'quality': quality} if image_format == 'JPEG' else {}))
+        return buffer.getvalue()
@@ -0,0 +1,87 @@
+import json
+import os
+import statistics
+import time
+import joblib
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from classification.ml_utils.features import list_labelled_images
+from classification.ml_utils.model_loader import INTERNAL_MODELS, model_manager
+from classification.ml_utils.preprocessing import PreprocessedImage
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare per-image latency and accuracy of the classical models on raw 150,528-pixel '
+        'features against the reduced-feature artefacts from train_reduced_models.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--data-dir', help='Labelled images to evaluate on (default: the held-out split '
+                                               'recorded by train_reduced_models)')
+        parser.add_argument('--classes', nargs='+', default=['Normal', 'Stone'])
+        parser.add_argument('--limit', type=int, default=200, help='Maximum number of images to evaluate')
+        parser.add_argument('--reduced-dir', default=None)
+
+    def handle(self, *args, **options):
+        models_dir = os.path.dirname(model_manager.model_paths['scaler'].get('raw_path', model_manager.model_paths['scaler']['path']))
+        reduced_dir = options['reduced_dir'] or os.path.join(models_dir, 'reduced')
+
+        if options['data_dir']:
+            samples = list_labelled_images(options['data_dir'], options['classes'])
+        else:
+            metadata_path = os.path.join(reduced_dir, 'metadata.json')
+            if not os.path.exists(metadata_path):
+                raise CommandError('Pass --data-dir or run train_reduced_models first')
+            with open(metadata_path) as f:
+                samples = [tuple(sample) for sample in json.load(f)['test_files']]
+
+        samples = samples[:options['limit']]
+        images = [PreprocessedImage.from_file(path) for path, _ in samples]
+        labels = np.array([label for _, label in samples])
+        self.stdout.write(f"Evaluating on {len(images)} images")
+
+        classical_models = [
+            model_name for model_name, model_info in model_manager.model_paths.items()
+            if model_info['type'] == 'sklearn' and model_name not in INTERNAL_MODELS
+        ]
+
+        paths = {
+            'raw': {
+                'extractor': None,
+                'scaler': joblib.load(self._raw_path('scaler')),
+                'models': {name: joblib.load(self._raw_path(name)) for name in classical_models},
+            },
+            'reduced': {
+                'extractor': joblib.load(os.path.join(reduced_dir, 'feature_extractor.joblib')),
+                'scaler': joblib.load(os.path.join(reduced_dir, 'scaler.joblib')),
+                'models': {
+                    name: joblib.load(os.path.join(reduced_dir, f'{name}.joblib')) for name in classical_models
+                },
+            },
+        }
+
+        self.stdout.write(f"{'path':<8} {'model':<15} {'mean ms':>9} {'p95 ms':>9} {'accuracy':>9}")
+        for path_name, path in paths.items():
+            for model_name, model in path['models'].items():
+                latencies = []
+                predictions = []
+                for image in images:
+                    start = time.perf_counter()
+                    if path['extractor'] is None:
+                        features = image.flat
+                    else:
+                        features = path['extractor'].transform(image.batch)
+                    probabilities = model.predict_proba(path['scaler'].transform(features))
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    predictions.append(int(np.argmax(probabilities)))
+
+                p95 = statistics.quantiles(latencies, n=100)[94] if len(latencies) > 1 else latencies[0]
+                self.stdout.write(
+                    f"{path_name:<8} {model_name:<15} {statistics.mean(latencies):>9.2f} {p95:>9.2f} "
+                    f"{(np.array(predictions) == labels).mean():>9.4f}"
+                )
+
+    def _raw_path(self, model_name):
+        model_info = model_manager.model_paths[model_name]
+        return model_info.get('raw_path', model_info['path'])
@@ -0,0 +1,167 @@
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q
+from django.db.utils import ConnectionHandler
+from django.utils import timezone
+from classification.models import ClassificationHistory
+
+PREDICTED_CLASSES = ['Normal (no stone)', 'Stone']
+MODEL_NAMES = ['CNN Model', 'Decision Tree', 'Random Forest', 'XGBoost', 'K-Nearest Neighbors', 'Ensemble (soft voting)']
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a scratch SQLite database with millions of synthetic ClassificationHistory rows and time '
+        'the dashboard/history queries with EXPLAIN QUERY PLAN output, first with only the user '
+        'foreign-key index (before migration 0003) and then with the composite indexes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2_000_000, help='Rows spread over --users users')
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--heavy-user-rows', type=int, default=100_000,
+                            help='Extra rows for user 1, a user with a long history')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--db-path', default=None,
+                            help='Scratch database file (default: a temporary file, removed afterwards)')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        db_path = options['db_path'] or os.path.join(tempfile.mkdtemp(), 'history_benchmark.sqlite3')
+        if os.path.exists(db_path):
+            os.remove(db_path)
+
+        # A separate connection, so the project database never receives the synthetic rows
+        connection = ConnectionHandler({
+            'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': db_path}
+        })['default']
+        try:
+            self._create_table(connection)
+            self._seed(connection, options)
+            queries = self._queries(connection)
+
+            results = {}
+            for phase in ('before', 'after'):
+                self._set_indexes(connection, phase)
+                results[phase] = self._run_queries(connection, queries, phase, options['repeat'])
+
+            self.stdout.write(f"\n{'query':<28} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+            for name in queries:
+                before, after = results['before'][name], results['after'][name]
+                self.stdout.write(f"{name:<28} {before:>10.3f} {after:>10.3f} {before / after:>7.1f}x")
+        finally:
+            connection.close()
+            if not options['db_path']:
+                os.remove(db_path)
+                os.rmdir(os.path.dirname(db_path))
+
+    def _create_table(self, connection):
+        with connection.schema_editor() as editor:
+            editor.create_model(ClassificationHistory)
+        # Meta.indexes are created when the editor exits; each phase adds the ones it measures
+        with connection.schema_editor() as editor:
+            for index in ClassificationHistory._meta.indexes:
+                editor.remove_index(ClassificationHistory, index)
+
+    def _seed(self, connection, options):
+        rng = random.Random(options['seed'])
+        now = timezone.now()
+        table = ClassificationHistory._meta.db_table
+        columns = 'user_id, uploaded_image, predicted_class, model_used, prediction_confidence, timestamp'
+        insert = f"INSERT INTO {table} ({columns}) VALUES (%s, %s, %s, %s, %s, %s)"
+
+        def rows(count, user_ids):
+            for _ in range(count):
+                timestamp = now - timedelta(seconds=rng.randrange(365 * 24 * 3600))
+                yield (
+                    rng.choice(user_ids),
+                    f'uploads/{rng.getrandbits(128):032x}.png',
+                    rng.choice(PREDICTED_CLASSES),
+                    rng.choice(MODEL_NAMES),
+                    round(rng.uniform(50, 100), 2),
+                    connection.ops.adapt_datetimefield_value(timestamp),
+                )
+
+        start = time.perf_counter()
+        batch_size = 50_000
+        with connection.cursor() as cursor:
+            # Only the history table exists (the user ids are synthetic) and the file is disposable
+            cursor.execute('PRAGMA foreign_keys = OFF')
+            cursor.execute('PRAGMA synchronous = OFF')
+            connection.set_autocommit(False)
+            for user_ids, count in ((range(1, options['users'] + 1), options['rows']), ([1], options['heavy_user_rows'])):
+                remaining = count
+                while remaining > 0:
+                    cursor.executemany(insert, list(rows(min(batch_size, remaining), user_ids)))
+                    connection.commit()
+                    remaining -= batch_size
+            connection.set_autocommit(True)
+        total = options['rows'] + options['heavy_user_rows']
+        self.stdout.write(f"Seeded {total:,} rows in {time.perf_counter() - start:.1f}s")
+
+    def _set_indexes(self, connection, phase):
+        """'before': the foreign-key index of migration 0002; 'after': the indexes of 0003"""
+        table = ClassificationHistory._meta.db_table
+        # Not entered as a context manager: on exit it would check the synthetic foreign keys
+        editor = connection.schema_editor()
+        with connection.cursor() as cursor:
+            if phase == 'before':
+                cursor.execute(f'CREATE INDEX history_benchmark_user_fk ON {table} (user_id)')
+            else:
+                cursor.execute('DROP INDEX history_benchmark_user_fk')
+                for index in ClassificationHistory._meta.indexes:
+                    cursor.execute(str(index.create_sql(ClassificationHistory, editor)))
+            cursor.execute('ANALYZE')
+
+    def _queries(self, connection):
+        """SQL for the hot history queries, compiled by the ORM for the scratch connection"""
+        history = ClassificationHistory.objects
+        with connection.cursor() as cursor:
+            # A cursor halfway down the heavy user's history, as deep pagination would reach
+            cursor.execute(
+                f"SELECT timestamp, id FROM {ClassificationHistory._meta.db_table} "
+                f"WHERE user_id = 1 ORDER BY timestamp DESC, id DESC LIMIT 1 OFFSET 50000"
+            )
+            row = cursor.fetchone()
+        middle_timestamp, middle_id = connection.ops.convert_datetimefield_value(row[0], None, connection), row[1]
+        newest = history.filter(user_id=1).order_by('-timestamp', '-id')
+
+        querysets = {
+            'dashboard (heavy user)': history.filter(user_id=1).order_by('-timestamp', '-id')[:10],
+            'dashboard (typical user)': history.filter(user_id=2).order_by('-timestamp', '-id')[:10],
+            'history page (deep)': history.filter(user_id=1).filter(
+                Q(timestamp__lt=middle_timestamp) | Q(timestamp=middle_timestamp, id__lt=middle_id),
+                timestamp__lte=middle_timestamp
+            ).order_by('-timestamp', '-id')[:11],
+            'history since (no news)': history.filter(user_id=1, timestamp__gt=timezone.now()).order_by('timestamp', 'id')[:11],
+            'history etag': newest.values_list('id', flat=True)[:1],
+            'user model/class counts': history.filter(user_id=1).values('model_used', 'predicted_class').annotate(n=Count('id')),
+            'model/class counts': history.values('model_used', 'predicted_class').annotate(n=Count('id')),
+        }
+        return {
+            name: queryset.query.get_compiler(connection=connection).as_sql()
+            for name, queryset in querysets.items()
+        }
+
+    def _run_queries(self, connection, queries, phase, repeat):
+        self.stdout.write(f"\n== {phase} ==")
+        timings = {}
+        with connection.cursor() as cursor:
+            for name, (sql, params) in queries.items():
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                plan = '; '.join(row[-1] for row in cursor.fetchall())
+                self.stdout.write(f"{name:<28} {plan}")
+
+                samples = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    cursor.execute(sql, params)
+                    cursor.fetchall()
+                    samples.append((time.perf_counter() - start) * 1000)
+                timings[name] = statistics.median(samples)
+        return timings
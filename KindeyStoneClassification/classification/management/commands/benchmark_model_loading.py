@@ -0,0 +1,119 @@
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from django.core.management.base import BaseCommand
+from classification.ml_utils.model_loader import CNN_MODEL_TYPES, model_manager
+from classification.ml_utils.preprocessing import PreprocessedImage
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark a mixed-model workload across many threads with cold models, '
+        'comparing per-model loading locks against a single global loading lock.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--requests', type=int, default=400)
+        parser.add_argument(
+            '--models', nargs='+',
+            default=['cnn_model', 'decision_tree', 'random_forest', 'xgboost', 'knn'],
+        )
+        parser.add_argument(
+            '--synthetic', action='store_true',
+            help='Replace disk loads and inference with sleeps, so no model files are needed',
+        )
+        parser.add_argument('--keras-load-ms', type=int, default=3000)
+        parser.add_argument('--sklearn-load-ms', type=int, default=300)
+        parser.add_argument('--inference-ms', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        workload = [rng.choice(options['models']) for _ in range(options['requests'])]
+
+        if options['synthetic']:
+            model_manager._load_from_disk = self._synthetic_loader(options)
+
+        try:
+            results = {}
+            for mode in ('global', 'per-model'):
+                results[mode] = self._run(mode, workload, options)
+        finally:
+            if options['synthetic']:
+                del model_manager._load_from_disk
+            self._reset(options['models'])
+
+        for mode, (elapsed, latencies) in results.items():
+            all_latencies = [latency for model_latencies in latencies.values() for latency in model_latencies]
+            self.stdout.write(
+                f"{mode:>10}: {elapsed:.2f}s total, "
+                f"{len(workload) / elapsed:.1f} req/s, "
+                f"p50 {self._percentile(all_latencies, 50):.1f}ms, "
+                f"p95 {self._percentile(all_latencies, 95):.1f}ms"
+            )
+            for model_name in options['models']:
+                if latencies[model_name]:
+                    self.stdout.write(
+                        f"{'':>12}{model_name:<15} "
+                        f"p50 {self._percentile(latencies[model_name], 50):8.1f}ms "
+                        f"p95 {self._percentile(latencies[model_name], 95):8.1f}ms"
+                    )
+
+        speedup = results['global'][0] / results['per-model'][0]
+        self.stdout.write(self.style.SUCCESS(f"Per-model locks: {speedup:.2f}x throughput"))
+
+    def _synthetic_loader(self, options):
+        def load(model_info):
+            delay_ms = options['keras_load_ms'] if model_info['type'] in CNN_MODEL_TYPES else options['sklearn_load_ms']
+            time.sleep(delay_ms / 1000.0)
+            return object()
+        return load
+
+    def _reset(self, model_names):
+        for model_name in model_names + ['scaler']:
+            model_manager.unload_model(model_name)
+
+    def _run(self, mode, workload, options):
+        """Run the workload from cold, optionally emulating the old global loading lock"""
+        self._reset(options['models'])
+        image = PreprocessedImage(np.random.default_rng(options['seed']).random((224, 224, 3), dtype=np.float32))
+
+        original_load = model_manager.load_model
+        if mode == 'global':
+            global_lock = threading.Lock()
+
+            def load_model(model_name):
+                with global_lock:
+                    return original_load(model_name)
+            model_manager.load_model = load_model
+
+        latencies = {model_name: [] for model_name in options['models']}
+
+        def request(model_name):
+            start = time.perf_counter()
+            if options['synthetic']:
+                model_manager.get_model(model_name)
+                time.sleep(options['inference_ms'] / 1000.0)
+            else:
+                model_manager.predict_with_model(model_name, image)
+            latencies[model_name].append((time.perf_counter() - start) * 1000)
+
+        try:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+                list(pool.map(request, workload))
+            elapsed = time.perf_counter() - start
+        finally:
+            if mode == 'global':
+                del model_manager.load_model
+
+        return elapsed, latencies
+
+    def _percentile(self, values, percentile):
+        if len(values) < 2:
+            return values[0] if values else 0.0
+        return statistics.quantiles(values, n=100)[percentile - 1]
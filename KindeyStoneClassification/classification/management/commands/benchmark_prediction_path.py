@@ -0,0 +1,71 @@
+import statistics
+import time
+import joblib
+import numpy as np
+from django.core.management.base import BaseCommand
+from classification.ml_utils.model_loader import CNN_MODEL_TYPES, INTERNAL_MODELS, model_manager
+from classification.ml_utils.preprocessing import PreprocessedImage
+
+
+class Command(BaseCommand):
+    help = (
+        'Micro-benchmark the classical models: the old predict_proba + predict pair against '
+        'the single predict_proba call of the current prediction path, per model.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--models', nargs='+', default=None, help='Model ids (default: every classical model)')
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--batch-size', type=int, default=1, help='Images per call')
+        parser.add_argument('--image', help='Image to predict on (default: random pixels)')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        model_names = options['models'] or [
+            model_name for model_name, model_info in model_manager.model_paths.items()
+            if model_info['type'] not in CNN_MODEL_TYPES and model_name not in INTERNAL_MODELS
+        ]
+
+        if options['image']:
+            pixels = PreprocessedImage.from_file(options['image']).pixels
+        else:
+            pixels = np.random.default_rng(options['seed']).random((224, 224, 3), dtype=np.float32)
+        features = model_manager._ml_features(np.stack([pixels] * options['batch_size']))
+
+        self.stdout.write(
+            f"{'model':<15} {'proba+predict':>14} {'single call':>12} {'saved':>8} {'disagree':>9}  (ms per call)"
+        )
+        for model_name in model_names:
+            model_info = model_manager.model_paths[model_name]
+            # The pickled estimator, as served before the single output contract
+            original = joblib.load(model_info['path']) if model_info['type'] == 'sklearn' else model_manager.get_model(model_name)
+            if not hasattr(original, 'predict_proba'):
+                self.stdout.write(f"{model_name:<15} no predict_proba, skipped")
+                continue
+
+            def proba_and_predict():
+                return original.predict_proba(features), original.predict(features)
+
+            def single_call():
+                return model_manager._predict_probabilities(model_name, features)
+
+            before = self._time(proba_and_predict, options['repeat'])
+            after = self._time(single_call, options['repeat'])
+
+            # Rows where the separate predict call disagreed with the argmax of predict_proba
+            probabilities, predicted = proba_and_predict()
+            disagreements = int((original.classes_[np.argmax(probabilities, axis=1)] != predicted).sum())
+
+            self.stdout.write(
+                f"{model_name:<15} {before:>14.3f} {after:>12.3f} "
+                f"{(before - after) / before:>8.1%} {disagreements:>9}"
+            )
+
+    def _time(self, fn, repeat):
+        fn()  # Warm caches and lazy loads before timing
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,102 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Run in a fresh interpreter per sample; the last line printed is a JSON report
+SCENARIO_SCRIPT = '''
+import json, os, sys
+{preimport}
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'KindeyStoneClassification.settings')
+import django
+django.setup()
+{body}
+print(json.dumps({{'modules': [m for m in ('tensorflow', 'joblib', 'sklearn', 'xgboost') if m in sys.modules]}}))
+'''
+
+CHECK_BODY = '''
+from django.core.management import call_command
+call_command('check', verbosity=0)
+'''
+
+DASHBOARD_BODY = '''
+from django.contrib.auth import get_user_model
+from django.test import Client
+client = Client()
+email = {email!r}
+if email:
+    client.force_login(get_user_model().objects.get(email=email))
+response = client.get('/classification/', HTTP_HOST='localhost')
+assert response.status_code in (200, 302), response.status_code
+'''
+
+EAGER_IMPORTS = '''
+import tensorflow, joblib, sklearn.ensemble
+try:
+    import xgboost
+except ImportError:
+    pass
+'''
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure cold-process wall time and peak RSS of "manage.py check" and of the first '
+        'dashboard request, with the ML frameworks imported lazily (current behaviour) and '
+        'eagerly (the previous module-level imports).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument(
+            '--user-email',
+            help='Log this existing user in for the dashboard request (default: anonymous, which '
+                 'still resolves the URLconf and imports the views)'
+        )
+        parser.add_argument('--skip-eager', action='store_true', help='Only measure the lazy imports')
+
+    def handle(self, *args, **options):
+        dashboard_body = DASHBOARD_BODY.format(email=options['user_email'])
+        scenarios = [('check', CHECK_BODY), ('dashboard', dashboard_body)]
+        modes = ['lazy'] if options['skip_eager'] else ['lazy', 'eager']
+
+        self.stdout.write(f"{'scenario':<10} {'imports':<6} {'median s':>9} {'peak RSS MB':>12}  frameworks loaded")
+        for name, body in scenarios:
+            for mode in modes:
+                script = SCENARIO_SCRIPT.format(preimport=EAGER_IMPORTS if mode == 'eager' else '', body=body)
+                samples = [self._run(script) for _ in range(options['repeat'])]
+                if any(sample is None for sample in samples):
+                    self.stdout.write(self.style.ERROR(f"{name:<10} {mode:<6} failed"))
+                    continue
+
+                self.stdout.write(
+                    f"{name:<10} {mode:<6} {statistics.median(s['seconds'] for s in samples):>9.2f} "
+                    f"{max(s['max_rss_mb'] for s in samples):>12.1f}  {', '.join(samples[-1]['modules']) or '-'}"
+                )
+
+    def _run(self, script):
+        """Time one interpreter from exec to exit and read its peak RSS from wait4"""
+        start = time.perf_counter()
+        # One pipe for both streams, so chatty framework logging cannot fill an unread pipe
+        process = subprocess.Popen(
+            [sys.executable, '-c', script], cwd=settings.BASE_DIR,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+        )
+        lines = process.stdout.read().strip().splitlines()
+        _, status, usage = os.wait4(process.pid, 0)
+        elapsed = time.perf_counter() - start
+
+        exit_code = process.returncode = os.waitstatus_to_exitcode(status)  # Reaped by wait4, not Popen
+        process.stdout.close()
+        if exit_code != 0:
+            self.stderr.write(lines[-1] if lines else f"exit {exit_code}")
+            return None
+
+        report = json.loads(lines[-1])
+        # ru_maxrss is reported in kilobytes on Linux
+        report.update(seconds=elapsed, max_rss_mb=usage.ru_maxrss / 1024)
+        return report
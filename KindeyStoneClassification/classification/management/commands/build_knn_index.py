@@ -0,0 +1,100 @@
+import os
+import time
+import joblib
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from classification.ml_utils.ann_index import IVFIndex
+from classification.ml_utils.features import list_labelled_images
+from classification.ml_utils.model_loader import model_manager
+from classification.ml_utils.preprocessing import PreprocessedImage
+
+
+class Command(BaseCommand):
+    help = (
+        'Build the inverted-file ANN index behind the knn_ann model, either from the training '
+        'set stored in the pickled KNN or from a directory of labelled images, and report '
+        'recall/latency for a range of ANN_KNN_NPROBE values.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--data-dir', help='Build from one sub-directory of images per class instead of the KNN pickle')
+        parser.add_argument('--classes', nargs='+', default=['Normal', 'Stone'])
+        parser.add_argument('--lists', type=int, default=0, help='Inverted lists (default: 4 * sqrt(training rows))')
+        parser.add_argument('--neighbors', type=int, default=None, help='k (default: the pickled KNN\'s n_neighbors, else 5)')
+        parser.add_argument('--iterations', type=int, default=20, help='k-means iterations')
+        parser.add_argument('--sample-size', type=int, default=100000, help='Rows used to fit the k-means centroids')
+        parser.add_argument('--batch-size', type=int, default=64)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--evaluate', type=int, default=200, help='Training rows used as recall queries (0 skips)')
+        parser.add_argument('--output-dir', default=None)
+
+    def handle(self, *args, **options):
+        if options['data_dir']:
+            vectors, labels = self._features_from_images(options)
+            n_neighbors = options['neighbors'] or 5
+        else:
+            vectors, labels, n_neighbors = self._features_from_knn()
+            n_neighbors = options['neighbors'] or n_neighbors
+
+        n_lists = options['lists'] or max(1, int(4 * np.sqrt(len(vectors))))
+        self.stdout.write(f"Clustering {len(vectors)} x {vectors.shape[1]} vectors into {n_lists} lists")
+
+        start = time.perf_counter()
+        index = IVFIndex.build(
+            vectors, labels, n_lists=n_lists, n_neighbors=n_neighbors,
+            iterations=options['iterations'], seed=options['seed'], sample_size=options['sample_size']
+        )
+        output_dir = options['output_dir'] or os.path.dirname(model_manager.model_paths['knn_ann']['path'])
+        index.save(output_dir)
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Built knn_ann index in {time.perf_counter() - start:.1f}s -> {output_dir}"
+        ))
+
+        if options['evaluate']:
+            self._evaluate(index, options['evaluate'], options['seed'])
+
+    def _features_from_knn(self):
+        """Take the training rows straight out of the fitted KNeighborsClassifier"""
+        knn_info = model_manager.model_paths['knn']
+        if not os.path.exists(knn_info['path']):
+            raise CommandError(f"Model file not found: {knn_info['path']} (pass --data-dir instead)")
+
+        knn = joblib.load(knn_info['path'])
+        # _fit_X holds the scaled training features, _y their indices into classes_
+        return np.asarray(knn._fit_X, dtype=np.float32), knn.classes_[knn._y], knn.n_neighbors
+
+    def _features_from_images(self, options):
+        """Decode and scale labelled images with the same features the served models use"""
+        samples = list_labelled_images(options['data_dir'], options['classes'])
+        if not samples:
+            raise CommandError(f"No images found under {options['data_dir']}")
+
+        features = []
+        for start in range(0, len(samples), options['batch_size']):
+            pixels = np.stack([
+                PreprocessedImage.from_file(path).pixels
+                for path, _ in samples[start:start + options['batch_size']]
+            ])
+            features.append(model_manager._ml_features(pixels).astype(np.float32))
+        return np.concatenate(features), np.array([label for _, label in samples])
+
+    def _evaluate(self, index, n_queries, seed):
+        """Recall@k against an exact scan for increasing nprobe"""
+        rng = np.random.default_rng(seed)
+        queries = np.asarray(index.vectors[rng.choice(len(index.vectors), min(n_queries, len(index.vectors)), replace=False)])
+
+        _, exact = index.search(queries, nprobe=index.n_lists)
+        self.stdout.write(f"{'nprobe':>7} {'recall@k':>9} {'ms/query':>9}")
+        nprobe = 1
+        while True:
+            start = time.perf_counter()
+            _, approximate = index.search(queries, nprobe=nprobe)
+            elapsed_ms = (time.perf_counter() - start) * 1000 / len(queries)
+            recall = np.mean([
+                len(np.intersect1d(found[found >= 0], truth)) / len(truth)
+                for found, truth in zip(approximate, exact)
+            ])
+            self.stdout.write(f"{nprobe:>7} {recall:>9.4f} {elapsed_ms:>9.3f}")
+            if nprobe >= index.n_lists:
+                break
+            nprobe = min(nprobe * 2, index.n_lists)
@@ -0,0 +1,37 @@
+import os
+import joblib
+from django.core.management.base import BaseCommand, CommandError
+from classification.ml_utils.model_loader import model_manager
+
+
+class Command(BaseCommand):
+    help = (
+        'Re-save the scikit-learn/XGBoost pickles uncompressed under models_consolidated/mmap/ '
+        'so workers can load them with joblib mmap_mode and share the array pages.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help='Model ids to export (default: every sklearn model)')
+
+    def handle(self, *args, **options):
+        model_names = options['models'] or [
+            model_name for model_name, model_info in model_manager.model_paths.items()
+            if 'mmap_path' in model_info
+        ]
+
+        for model_name in model_names:
+            model_info = model_manager.model_paths.get(model_name)
+            if model_info is None or 'mmap_path' not in model_info:
+                raise CommandError(f"{model_name} is not a memory-mappable model")
+            if not os.path.exists(model_info['path']):
+                raise CommandError(f"Model file not found: {model_info['path']}")
+
+            model = joblib.load(model_info['path'])
+            os.makedirs(os.path.dirname(model_info['mmap_path']), exist_ok=True)
+            # compress=0 keeps numpy arrays as raw buffers that np.memmap can map
+            joblib.dump(model, model_info['mmap_path'], compress=0)
+
+            self.stdout.write(self.style.SUCCESS(
+                f"✓ {model_name}: {os.path.getsize(model_info['path']) / 1024 ** 2:.1f} MB -> "
+                f"{model_info['mmap_path']} ({os.path.getsize(model_info['mmap_path']) / 1024 ** 2:.1f} MB)"
+            ))
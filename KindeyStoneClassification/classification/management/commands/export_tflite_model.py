@@ -0,0 +1,67 @@
+import os
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from classification.ml_utils.features import list_labelled_images
+from classification.ml_utils.model_loader import model_manager
+from classification.ml_utils.preprocessing import PreprocessedImage
+
+
+class Command(BaseCommand):
+    help = (
+        'Convert the Keras CNN to a quantized TensorFlow Lite model under models_consolidated/tflite/. '
+        'ModelManager serves it instead of the .h5 whenever the file exists (see CNN_PREFER_TFLITE).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--quantization', choices=['float16', 'dynamic', 'int8', 'none'], default='float16',
+            help='float16 halves the file; dynamic stores int8 weights; int8 also quantizes '
+                 'activations and needs --data-dir for calibration'
+        )
+        parser.add_argument('--data-dir', help='Labelled images used as the int8 representative dataset')
+        parser.add_argument('--classes', nargs='+', default=['Normal', 'Stone'])
+        parser.add_argument('--calibration-samples', type=int, default=200)
+        parser.add_argument('--output', default=None)
+
+    def handle(self, *args, **options):
+        import tensorflow as tf
+
+        cnn_info = model_manager.model_paths['cnn_model']
+        keras_path = cnn_info.get('keras_path', cnn_info['path'])
+        if not os.path.exists(keras_path):
+            raise CommandError(f"Model file not found: {keras_path}")
+        if options['quantization'] == 'int8' and not options['data_dir']:
+            raise CommandError('int8 quantization needs --data-dir for calibration images')
+
+        converter = tf.lite.TFLiteConverter.from_keras_model(tf.keras.models.load_model(keras_path))
+        if options['quantization'] != 'none':
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        if options['quantization'] == 'float16':
+            converter.target_spec.supported_types = [tf.float16]
+        elif options['quantization'] == 'int8':
+            converter.representative_dataset = self._representative_dataset(options)
+            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+        model_content = converter.convert()
+
+        output = options['output'] or cnn_info['tflite_path']
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        with open(output, 'wb') as f:
+            f.write(model_content)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {options['quantization']} model: {os.path.getsize(keras_path) / 1024 ** 2:.1f} MB -> "
+            f"{output} ({len(model_content) / 1024 ** 2:.1f} MB)"
+        ))
+
+    def _representative_dataset(self, options):
+        samples = list_labelled_images(options['data_dir'], options['classes'])
+        if not samples:
+            raise CommandError(f"No images found under {options['data_dir']}")
+        rng = np.random.default_rng(0)
+        paths = [samples[i][0] for i in rng.permutation(len(samples))[:options['calibration_samples']]]
+
+        def generator():
+            for path in paths:
+                yield [PreprocessedImage.from_file(path).batch]
+        return generator
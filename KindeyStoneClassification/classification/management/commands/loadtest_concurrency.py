@@ -0,0 +1,121 @@
+import http.client
+import io
+import secrets
+import statistics
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test a running server with many concurrent connections posting images to '
+        '/classification/predict/. Point --wsgi-url at e.g. gunicorn and --asgi-url at uvicorn '
+        '(with ASYNC_VIEWS = True) to compare how many connections each sustains.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi-url', help='Base URL of the WSGI deployment, e.g. http://127.0.0.1:8000')
+        parser.add_argument('--asgi-url', help='Base URL of the ASGI deployment, e.g. http://127.0.0.1:8001')
+        parser.add_argument('--user-email', required=True, help='Existing user the requests are made as')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[8, 32, 128])
+        parser.add_argument('--duration', type=float, default=15.0, help='Seconds per concurrency level')
+        parser.add_argument('--model', default='decision_tree')
+        parser.add_argument('--upload-delay-ms', type=int, default=0,
+                            help='Pause between body chunks to emulate slow client uploads')
+        parser.add_argument('--timeout', type=float, default=60.0)
+
+    def handle(self, *args, **options):
+        targets = [(name, options[f'{name}_url']) for name in ('wsgi', 'asgi') if options[f'{name}_url']]
+        if not targets:
+            raise CommandError('Pass --wsgi-url and/or --asgi-url')
+
+        cookies = self._login_cookies(options['user_email'])
+        body, content_type = self._multipart_body(options['model'], cookies['csrftoken'])
+
+        self.stdout.write(
+            f"{'server':<6} {'conns':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'errors':>7}"
+        )
+        for name, base_url in targets:
+            for concurrency in options['concurrency']:
+                latencies, errors, elapsed = self._run_level(base_url, concurrency, body, content_type, cookies, options)
+                p50 = statistics.median(latencies) if latencies else 0.0
+                p95 = statistics.quantiles(latencies, n=100)[94] if len(latencies) > 1 else p50
+                self.stdout.write(
+                    f"{name:<6} {concurrency:>6} {len(latencies) / elapsed:>8.1f} {p50:>9.1f} {p95:>9.1f} {errors:>7}"
+                )
+
+    def _login_cookies(self, email):
+        """A session for the user plus a CSRF token, as a browser would hold after logging in"""
+        user = get_user_model().objects.get(email=email)
+        session = SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return {settings.SESSION_COOKIE_NAME: session.session_key, 'csrftoken': secrets.token_hex(16)}
+
+    def _multipart_body(self, model_choice, csrf_token):
+        image = io.BytesIO()
+        Image.new('RGB', (512, 512), (128, 64, 32)).save(image, 'PNG')
+        boundary = uuid.uuid4().hex
+        parts = [
+            f'--{boundary}\r\nContent-Disposition: form-data; name="model_choice"\r\n\r\n{model_choice}\r\n'.encode(),
+            f'--{boundary}\r\nContent-Disposition: form-data; name="csrfmiddlewaretoken"\r\n\r\n{csrf_token}\r\n'.encode(),
+            f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="load.png"\r\n'
+            f'Content-Type: image/png\r\n\r\n'.encode() + image.getvalue() + b'\r\n',
+            f'--{boundary}--\r\n'.encode(),
+        ]
+        return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+    def _run_level(self, base_url, concurrency, body, content_type, cookies, options):
+        url = urlsplit(base_url)
+        deadline = time.monotonic() + options['duration']
+        latencies = []
+        errors = [0]
+        lock = threading.Lock()
+        cookie_header = '; '.join(f'{name}={value}' for name, value in cookies.items())
+        chunk_size = max(1, len(body) // 4)
+
+        def client():
+            connection = None
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    if connection is None:
+                        connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=options['timeout'])
+                    connection.putrequest('POST', '/classification/predict/')
+                    connection.putheader('Content-Type', content_type)
+                    connection.putheader('Content-Length', str(len(body)))
+                    connection.putheader('Cookie', cookie_header)
+                    connection.putheader('Referer', base_url)
+                    connection.endheaders()
+                    for offset in range(0, len(body), chunk_size):
+                        if options['upload_delay_ms'] and offset:
+                            time.sleep(options['upload_delay_ms'] / 1000.0)
+                        connection.send(body[offset:offset + chunk_size])
+                    response = connection.getresponse()
+                    response.read()
+                    ok = response.status == 200
+                except (OSError, http.client.HTTPException):
+                    ok = False
+                    connection = None
+                with lock:
+                    if ok:
+                        latencies.append((time.perf_counter() - start) * 1000)
+                    else:
+                        errors[0] += 1
+
+        threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies, errors[0], time.monotonic() - start
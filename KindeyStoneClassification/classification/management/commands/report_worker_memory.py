@@ -0,0 +1,54 @@
+import os
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        'Report RSS, PSS and shared/private memory for every process whose command line '
+        'matches a pattern (gunicorn workers by default), read from /proc.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--match', default='gunicorn', help='Substring of the process command line')
+
+    def handle(self, *args, **options):
+        rows = []
+        for pid in filter(str.isdigit, os.listdir('/proc')):
+            cmdline = ' '.join(self._read(f'/proc/{pid}/cmdline').replace('\0', ' ').split())
+            if options['match'] not in cmdline or int(pid) == os.getpid():
+                continue
+            memory = self._smaps_rollup(pid)
+            if memory:
+                rows.append((int(pid), memory, cmdline))
+
+        if not rows:
+            self.stdout.write(f"No processes matching '{options['match']}'")
+            return
+
+        self.stdout.write(f"{'PID':>8} {'RSS MB':>9} {'PSS MB':>9} {'Shared MB':>10} {'Private MB':>11}  Command")
+        for pid, memory, cmdline in sorted(rows):
+            shared = memory.get('Shared_Clean', 0) + memory.get('Shared_Dirty', 0)
+            private = memory.get('Private_Clean', 0) + memory.get('Private_Dirty', 0)
+            self.stdout.write(
+                f"{pid:>8} {memory.get('Rss', 0) / 1024:>9.1f} {memory.get('Pss', 0) / 1024:>9.1f} "
+                f"{shared / 1024:>10.1f} {private / 1024:>11.1f}  {cmdline[:60]}"
+            )
+
+        total_pss = sum(memory.get('Pss', 0) for _, memory, _ in rows)
+        self.stdout.write(f"Total PSS: {total_pss / 1024:.1f} MB across {len(rows)} processes")
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return f.read()
+        except OSError:
+            return ''
+
+    def _smaps_rollup(self, pid):
+        """Parse /proc/<pid>/smaps_rollup into {field: kB}"""
+        memory = {}
+        for line in self._read(f'/proc/{pid}/smaps_rollup').splitlines()[1:]:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                memory[parts[0].rstrip(':')] = int(parts[1])
+        return memory
@@ -0,0 +1,76 @@
+import io
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from classification.ml_utils.inference_rpc import InferenceServer
+from classification.ml_utils.model_loader import model_manager
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the inference server that owns the models. Web workers send it uploads when '
+        'INFERENCE_SERVER points at the same address, and predict in-process while it is down.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--address', default=None,
+                            help="'unix:/path/inference.sock' or 'host:port' (default: INFERENCE_SERVER or 127.0.0.1:8765)")
+        parser.add_argument('--workers', type=int, default=None, help='Request threads (default: INFERENCE_SERVER_WORKERS)')
+        parser.add_argument('--max-batch-size', type=int, default=None, help='CNN micro-batch size')
+        parser.add_argument('--batch-window-ms', type=int, default=None, help='CNN micro-batch window')
+        parser.add_argument('--tflite-threads', type=int, default=None)
+        parser.add_argument('--intra-op-threads', type=int, default=None, help='TensorFlow intra-op threads')
+        parser.add_argument('--inter-op-threads', type=int, default=None, help='TensorFlow inter-op threads')
+        parser.add_argument('--warm-up', nargs='*', default=None,
+                            help='Models to warm up before serving (default: MODEL_WARMUP_MODELS)')
+
+    def handle(self, *args, **options):
+        address = options['address'] or getattr(settings, 'INFERENCE_SERVER', None) or '127.0.0.1:8765'
+
+        # This process is the only one running models, so its own batching/thread settings apply
+        if options['max_batch_size'] is not None:
+            settings.PREDICTION_MAX_BATCH_SIZE = options['max_batch_size']
+        if options['batch_window_ms'] is not None:
+            settings.PREDICTION_BATCH_WINDOW_MS = options['batch_window_ms']
+        if options['tflite_threads'] is not None:
+            settings.TFLITE_NUM_THREADS = options['tflite_threads']
+        if options['intra_op_threads'] is not None or options['inter_op_threads'] is not None:
+            import tensorflow as tf
+            if options['intra_op_threads'] is not None:
+                tf.config.threading.set_intra_op_parallelism_threads(options['intra_op_threads'])
+            if options['inter_op_threads'] is not None:
+                tf.config.threading.set_inter_op_parallelism_threads(options['inter_op_threads'])
+
+        warm_up = options['warm_up']
+        if warm_up is None:
+            warm_up = getattr(settings, 'MODEL_WARMUP_MODELS', [])
+        model_manager.warm_up(warm_up)
+
+        server = InferenceServer(
+            address,
+            self._handle_request,
+            workers=options['workers'] or getattr(settings, 'INFERENCE_SERVER_WORKERS', 8)
+        )
+        self.stdout.write(self.style.SUCCESS(f"✓ Inference server listening on {address}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.shutdown()
+
+    def _handle_request(self, header, payload):
+        op = header.get('op')
+        if op == 'ping':
+            return model_manager.get_readiness(getattr(settings, 'MODEL_WARMUP_MODELS', []))
+
+        # Wrapped, not decoded: a prediction cache hit never needs the pixels
+        image = io.BytesIO(payload)
+        if op == 'predict':
+            return model_manager.predict_with_model(header['model'], image, content_hash=header.get('content_hash'))
+        if op == 'ensemble':
+            return model_manager.predict_ensemble(
+                header['models'], image,
+                strategy=header.get('strategy', 'soft'),
+                content_hash=header.get('content_hash')
+            )
+        raise ValueError(f"Unknown inference operation {op}")
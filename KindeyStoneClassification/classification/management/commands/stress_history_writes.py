@@ -0,0 +1,179 @@
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import OperationalError
+from django.db.utils import ConnectionHandler
+from django.utils import timezone
+from KindeyStoneClassification.database import sqlite_database
+from classification.models import ClassificationHistory
+
+# The scratch databases have no user table; the synthetic user ids are not checked
+NO_FOREIGN_KEYS = 'PRAGMA foreign_keys=OFF'
+
+
+class Command(BaseCommand):
+    help = (
+        'Hammer scratch SQLite databases from many threads with dashboard reads and prediction '
+        'history writes, once with the Django defaults (rollback journal, a connection per request, '
+        'deferred transactions) and once with KindeyStoneClassification.database.sqlite_database, '
+        'and compare throughput, latency and "database is locked" errors.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help='Concurrent request threads')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds per configuration')
+        parser.add_argument('--write-ratio', type=float, default=0.25,
+                            help='Share of requests that record a prediction; the rest read a history page')
+        parser.add_argument('--seed-rows', type=int, default=50_000)
+        parser.add_argument('--users', type=int, default=100)
+
+    def handle(self, *args, **options):
+        scratch_dir = tempfile.mkdtemp(prefix='history_stress_')
+        try:
+            default = {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(scratch_dir, 'default.sqlite3'),
+                'OPTIONS': {'init_command': NO_FOREIGN_KEYS},
+            }
+            tuned = sqlite_database(os.path.join(scratch_dir, 'tuned.sqlite3'))
+            tuned['OPTIONS']['init_command'] += f';{NO_FOREIGN_KEYS}'
+
+            results = {}
+            for name, settings_dict in (('default', default), ('tuned', tuned)):
+                connections = ConnectionHandler({'default': settings_dict})
+                self._prepare(connections['default'], options)
+                results[name] = self._stress(connections, options)
+                self._report(name, results[name], options['duration'])
+
+            before, after = results['default'], results['tuned']
+            self.stdout.write(
+                f"\nWrites/s {self._rate(before['write'], options['duration']):.0f} -> "
+                f"{self._rate(after['write'], options['duration']):.0f}, "
+                f"reads/s {self._rate(before['read'], options['duration']):.0f} -> "
+                f"{self._rate(after['read'], options['duration']):.0f}, "
+                f"locked errors {before['locked']} -> {after['locked']}"
+            )
+        finally:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    def _prepare(self, connection, options):
+        """Create the history table with its indexes and seed it"""
+        with connection.schema_editor() as editor:
+            editor.create_model(ClassificationHistory)
+
+        rng = random.Random(0)
+        now = timezone.now()
+        with connection.cursor() as cursor:
+            # The schema editor turned foreign key checks back on when it exited
+            cursor.execute(NO_FOREIGN_KEYS)
+            cursor.execute('BEGIN')
+            cursor.executemany(
+                self._insert_sql(),
+                [self._row(rng, options['users'], now - timedelta(seconds=rng.randrange(30 * 24 * 3600)), connection)
+                 for _ in range(options['seed_rows'])]
+            )
+            cursor.execute('COMMIT')
+            cursor.execute('ANALYZE')
+        connection.close()
+
+    def _stress(self, connections, options):
+        deadline = time.monotonic() + options['duration']
+        results = {'read': [], 'write': [], 'locked': 0, 'errors': 0}
+        lock = threading.Lock()
+
+        def request_thread(seed):
+            rng = random.Random(seed)
+            local = {'read': [], 'write': [], 'locked': 0, 'errors': 0}
+            connection = connections['default']
+            while time.monotonic() < deadline:
+                kind = 'write' if rng.random() < options['write_ratio'] else 'read'
+                start = time.perf_counter()
+                try:
+                    if kind == 'write':
+                        self._record_prediction(connection, rng, options['users'])
+                    else:
+                        self._read_history(connection, rng, options['users'])
+                    local[kind].append((time.perf_counter() - start) * 1000)
+                except OperationalError as e:
+                    local['locked' if 'locked' in str(e) else 'errors'] += 1
+                finally:
+                    # What Django does when a request finishes: closed unless CONN_MAX_AGE keeps it
+                    connection.close_if_unusable_or_obsolete()
+            connection.close()
+            with lock:
+                for key, value in local.items():
+                    results[key] += value
+
+        threads = [threading.Thread(target=request_thread, args=(seed,)) for seed in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def _read_history(self, connection, rng, users):
+        """The dashboard sidebar query"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT * FROM {ClassificationHistory._meta.db_table} WHERE user_id = %s "
+                f"ORDER BY timestamp DESC, id DESC LIMIT 10",
+                [rng.randrange(1, users + 1)]
+            )
+            cursor.fetchall()
+
+    def _record_prediction(self, connection, rng, users):
+        """One transaction that reads the user's newest row, then inserts a new one"""
+        table = ClassificationHistory._meta.db_table
+        connection.ensure_connection()
+        # The BEGIN that transaction.atomic() issues for this connection's transaction_mode
+        begin = f'BEGIN {connection.transaction_mode}' if connection.transaction_mode else 'BEGIN'
+        with connection.cursor() as cursor:
+            cursor.execute(begin)
+            try:
+                row = self._row(rng, users, timezone.now(), connection)
+                cursor.execute(
+                    f"SELECT id FROM {table} WHERE user_id = %s ORDER BY timestamp DESC, id DESC LIMIT 1", [row[0]]
+                )
+                cursor.fetchone()
+                cursor.execute(self._insert_sql(), row)
+                cursor.execute('COMMIT')
+            except Exception:
+                cursor.execute('ROLLBACK')
+                raise
+
+    def _insert_sql(self):
+        columns = 'user_id, uploaded_image, predicted_class, model_used, prediction_confidence, timestamp'
+        return f"INSERT INTO {ClassificationHistory._meta.db_table} ({columns}) VALUES (%s, %s, %s, %s, %s, %s)"
+
+    def _row(self, rng, users, timestamp, connection):
+        return (
+            rng.randrange(1, users + 1),
+            f'uploads/{rng.getrandbits(128):032x}.png',
+            rng.choice(['Normal (no stone)', 'Stone']),
+            'Random Forest',
+            round(rng.uniform(50, 100), 2),
+            connection.ops.adapt_datetimefield_value(timestamp),
+        )
+
+    def _rate(self, latencies, duration):
+        return len(latencies) / duration
+
+    def _report(self, name, results, duration):
+        self.stdout.write(f"\n== {name} ==")
+        for kind in ('write', 'read'):
+            latencies = results[kind]
+            if not latencies:
+                self.stdout.write(f"{kind:<6} none completed")
+                continue
+            quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+            self.stdout.write(
+                f"{kind:<6} {len(latencies):>8} ok {self._rate(latencies, duration):>9.0f}/s   "
+                f"p50 {quantiles[49]:>7.2f} ms   p95 {quantiles[94]:>7.2f} ms   p99 {quantiles[98]:>7.2f} ms"
+            )
+        self.stdout.write(f"database is locked: {results['locked']}   other errors: {results['errors']}")
@@ -0,0 +1,112 @@
+import json
+import os
+import joblib
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from sklearn.decomposition import PCA
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import train_test_split
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.preprocessing import StandardScaler
+from sklearn.tree import DecisionTreeClassifier
+from classification.ml_utils.features import FeatureExtractor, list_labelled_images
+from classification.ml_utils.preprocessing import PreprocessedImage
+
+
+class Command(BaseCommand):
+    help = (
+        'Retrain the scaler and classical models on downsampled/PCA features and write them, '
+        'with the fitted feature extractor, to models_consolidated/reduced/. '
+        'Set ML_FEATURE_SET = "reduced" to serve them.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--data-dir', required=True, help='Directory with one sub-directory of images per class')
+        parser.add_argument('--classes', nargs='+', default=['Normal', 'Stone'],
+                            help='Class sub-directories in class index order')
+        parser.add_argument('--downsample', type=int, default=4, help='Average-pooling factor before PCA')
+        parser.add_argument('--components', type=int, default=256, help='PCA components (0 disables PCA)')
+        parser.add_argument('--test-size', type=float, default=0.2)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=64)
+        parser.add_argument('--output-dir', default=os.path.join(settings.BASE_DIR, 'models_consolidated', 'reduced'))
+
+    def handle(self, *args, **options):
+        try:
+            from xgboost import XGBClassifier
+        except ImportError:
+            raise CommandError('xgboost is required to retrain the XGBoost model')
+
+        samples = list_labelled_images(options['data_dir'], options['classes'])
+        if not samples:
+            raise CommandError(f"No images found under {options['data_dir']}")
+
+        paths, labels = zip(*samples)
+        train_paths, test_paths, y_train, y_test = train_test_split(
+            list(paths), np.array(labels), test_size=options['test_size'],
+            random_state=options['seed'], stratify=labels
+        )
+        self.stdout.write(f"Training on {len(train_paths)} images, holding out {len(test_paths)}")
+
+        extractor = FeatureExtractor(downsample=options['downsample'])
+        pooled_train = self._pool(extractor, train_paths, options['batch_size'])
+        pooled_test = self._pool(extractor, test_paths, options['batch_size'])
+
+        if options['components']:
+            pca = PCA(n_components=options['components'], svd_solver='randomized', random_state=options['seed'])
+            pca.fit(pooled_train)
+            extractor.pca_mean = pca.mean_.astype(np.float32)
+            extractor.pca_components = pca.components_.astype(np.float32)
+            self.stdout.write(f"PCA keeps {pca.explained_variance_ratio_.sum():.1%} of the variance")
+
+        scaler = StandardScaler().fit(extractor.project(pooled_train))
+        x_train = scaler.transform(extractor.project(pooled_train))
+        x_test = scaler.transform(extractor.project(pooled_test))
+        self.stdout.write(f"{pooled_train.shape[1]} pooled pixels -> {x_train.shape[1]} features")
+
+        models = {
+            'decision_tree': DecisionTreeClassifier(random_state=options['seed']),
+            'random_forest': RandomForestClassifier(n_estimators=100, n_jobs=-1, random_state=options['seed']),
+            'xgboost': XGBClassifier(n_estimators=200, random_state=options['seed']),
+            'knn': KNeighborsClassifier(n_neighbors=5),
+        }
+
+        os.makedirs(options['output_dir'], exist_ok=True)
+        accuracy = {}
+        for model_name, model in models.items():
+            model.fit(x_train, y_train)
+            accuracy[model_name] = float((model.predict(x_test) == y_test).mean())
+            # Uncompressed so the artefacts can be memory-mapped
+            joblib.dump(model, os.path.join(options['output_dir'], f'{model_name}.joblib'), compress=0)
+            self.stdout.write(f"  {model_name:<15} held-out accuracy {accuracy[model_name]:.4f}")
+
+        joblib.dump(scaler, os.path.join(options['output_dir'], 'scaler.joblib'), compress=0)
+        joblib.dump(extractor, os.path.join(options['output_dir'], 'feature_extractor.joblib'), compress=0)
+
+        with open(os.path.join(options['output_dir'], 'metadata.json'), 'w') as f:
+            json.dump({
+                'created': timezone.now().isoformat(),
+                'method': extractor.method,
+                'downsample': options['downsample'],
+                'components': options['components'],
+                'n_features': int(x_train.shape[1]),
+                'classes': options['classes'],
+                'train_size': len(train_paths),
+                'accuracy': accuracy,
+                # Kept so benchmark_feature_paths compares both paths on the same held-out images
+                'test_files': [[path, int(label)] for path, label in zip(test_paths, y_test)],
+            }, f, indent=2)
+
+        self.stdout.write(self.style.SUCCESS(f"✓ Reduced-feature artefacts written to {options['output_dir']}"))
+
+    def _pool(self, extractor, paths, batch_size):
+        """Decode and average-pool images in batches so the raw pixels are never all in memory"""
+        pooled = []
+        for start in range(0, len(paths), batch_size):
+            pixels = np.stack([
+                PreprocessedImage.from_file(path).pixels for path in paths[start:start + batch_size]
+            ])
+            pooled.append(extractor.pool(pixels))
+        return np.concatenate(pooled)
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classification', '0002_predictionjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='classificationhistory',
+            options={'ordering': ['-timestamp', '-id'], 'verbose_name_plural': 'Classification Histories'},
+        ),
+        migrations.AlterField(
+            model_name='classificationhistory',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='classificationhistory',
+            index=models.Index(fields=['user', '-timestamp', '-id'], name='history_user_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='classificationhistory',
+            index=models.Index(fields=['user', 'model_used', 'predicted_class'], name='history_user_model_class_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='classificationhistory',
+            index=models.Index(fields=['model_used', 'predicted_class'], name='history_model_class_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classification', '0003_history_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='classificationhistory',
+            name='prediction_id',
+            field=models.UUIDField(blank=True, editable=False, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classification', '0004_history_prediction_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyHistoryRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('model_used', models.CharField(max_length=100)),
+                ('analyses', models.PositiveIntegerField(default=0)),
+                ('stone_positive', models.PositiveIntegerField(default=0)),
+                ('confidence_sum', models.FloatField(default=0)),
+                ('user', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['day', 'model_used'],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('user__isnull', False)), fields=('user', 'day', 'model_used'), name='rollup_user_day_model_uniq'), models.UniqueConstraint(condition=models.Q(('user__isnull', True)), fields=('day', 'model_used'), name='rollup_all_users_day_model_uniq')],
+            },
+        ),
+    ]
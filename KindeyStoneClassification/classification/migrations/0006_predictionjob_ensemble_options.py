@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classification', '0005_daily_history_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='predictionjob',
+            name='ensemble_models',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='predictionjob',
+            name='ensemble_strategy',
+            field=models.CharField(default='soft', max_length=20),
+        ),
+    ]
@@ -0,0 +1,181 @@
+import json
+import os
+import numpy as np
+
+INDEX_FILE = 'index.json'
+INDEX_ARRAYS = ('centroids', 'vectors', 'norms', 'labels', 'offsets', 'classes')
+
+
+def _squared_distances(queries, points, point_norms):
+    """Squared euclidean distances between every query row and every point row"""
+    query_norms = np.einsum('ij,ij->i', queries, queries)
+    distances = query_norms[:, None] - 2 * (queries @ points.T) + point_norms[None, :]
+    return np.maximum(distances, 0)
+
+
+def kmeans(vectors, n_clusters, iterations=20, seed=0, chunk_size=4096):
+    """Plain Lloyd's k-means, returns float32 centroids of shape (n_clusters, d)"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].astype(np.float32)
+
+    for _ in range(iterations):
+        assignments = assign_clusters(vectors, centroids, chunk_size)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=n_clusters)
+
+        # Empty clusters keep their previous centroid
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+def assign_clusters(vectors, centroids, chunk_size=4096):
+    """Index of the nearest centroid for every vector, computed in chunks"""
+    centroid_norms = np.einsum('ij,ij->i', centroids, centroids)
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk_size):
+        chunk = vectors[start:start + chunk_size]
+        assignments[start:start + chunk_size] = np.argmin(
+            _squared_distances(chunk, centroids, centroid_norms), axis=1
+        )
+    return assignments
+
+
+class IVFIndex:
+    """Inverted-file approximate nearest-neighbour KNN classifier
+
+    Training vectors are grouped by their nearest k-means centroid and stored
+    contiguously, so a query only scans the ``nprobe`` lists closest to it
+    instead of the whole training set. ``nprobe`` trades recall for latency:
+    ``nprobe == n_lists`` is an exact search. Arrays are plain ``.npy`` files,
+    so ``load`` can memory-map them and every worker shares the pages.
+
+    Exposes ``predict_proba``/``predict``/``classes_`` like the sklearn
+    KNeighborsClassifier it replaces (uniform weights, euclidean distance).
+    """
+
+    def __init__(self, centroids, vectors, norms, labels, offsets, classes, n_neighbors=5, nprobe=8):
+        self.centroids = centroids
+        self.vectors = vectors
+        self.norms = norms
+        self.labels = labels
+        self.offsets = offsets
+        self.classes_ = classes
+        self.n_neighbors = n_neighbors
+        self.nprobe = nprobe
+        self._centroid_norms = np.einsum('ij,ij->i', centroids, centroids)
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    @property
+    def n_features(self):
+        return self.centroids.shape[1]
+
+    @classmethod
+    def build(cls, vectors, labels, n_lists=256, n_neighbors=5, iterations=20, seed=0, sample_size=None):
+        """Cluster ``vectors`` into ``n_lists`` inverted lists
+
+        ``labels`` are the training targets; k-means is fitted on at most
+        ``sample_size`` rows and every row is then assigned to its list.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        classes, label_indices = np.unique(labels, return_inverse=True)
+        n_lists = min(n_lists, len(vectors))
+
+        rng = np.random.default_rng(seed)
+        sample = vectors
+        if sample_size and len(vectors) > sample_size:
+            sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        centroids = kmeans(sample, n_lists, iterations=iterations, seed=seed)
+
+        # Sort rows by list so each list is one contiguous slice
+        assignments = assign_clusters(vectors, centroids)
+        order = np.argsort(assignments, kind='stable')
+        offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assignments, minlength=n_lists))
+
+        vectors = vectors[order]
+        return cls(
+            centroids=centroids,
+            vectors=vectors,
+            norms=np.einsum('ij,ij->i', vectors, vectors),
+            labels=label_indices[order].astype(np.int64),
+            offsets=offsets,
+            classes=classes,
+            n_neighbors=n_neighbors,
+        )
+
+    def save(self, index_dir):
+        """Write each array to its own uncompressed ``.npy`` file, then the metadata"""
+        os.makedirs(index_dir, exist_ok=True)
+        for name in INDEX_ARRAYS:
+            np.save(os.path.join(index_dir, f'{name}.npy'), getattr(self, 'classes_' if name == 'classes' else name))
+
+        # Written last: its mtime is the index version used by the prediction cache
+        with open(os.path.join(index_dir, INDEX_FILE), 'w') as f:
+            json.dump({
+                'n_lists': self.n_lists,
+                'n_features': self.n_features,
+                'n_vectors': len(self.vectors),
+                'n_neighbors': self.n_neighbors,
+                'metric': 'euclidean',
+            }, f, indent=2)
+
+    @classmethod
+    def load(cls, index_dir, mmap_mode=None, nprobe=8):
+        with open(os.path.join(index_dir, INDEX_FILE)) as f:
+            meta = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(index_dir, f'{name}.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+            for name in INDEX_ARRAYS
+        }
+        return cls(n_neighbors=meta['n_neighbors'], nprobe=nprobe, **arrays)
+
+    def search(self, queries, k=None, nprobe=None):
+        """Return (distances, row indices) of the ``k`` approximate nearest rows per query
+
+        Queries whose probed lists hold fewer than ``k`` rows get ``-1``
+        indices and ``inf`` distances in the missing slots.
+        """
+        k = k or self.n_neighbors
+        nprobe = min(nprobe or self.nprobe, self.n_lists)
+        queries = np.asarray(queries, dtype=np.float32).reshape(len(queries), -1)
+        if queries.shape[1] != self.n_features:
+            raise ValueError(f"Index expects {self.n_features} features, got {queries.shape[1]}")
+
+        centroid_distances = _squared_distances(queries, self.centroids, self._centroid_norms)
+        probes = np.argpartition(centroid_distances, nprobe - 1, axis=1)[:, :nprobe]
+
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        for row, query in enumerate(queries):
+            candidates = np.concatenate([
+                np.arange(self.offsets[list_id], self.offsets[list_id + 1]) for list_id in probes[row]
+            ])
+            if not len(candidates):
+                continue
+
+            candidate_distances = _squared_distances(
+                query[None, :], self.vectors[candidates], self.norms[candidates]
+            )[0]
+            found = min(k, len(candidates))
+            nearest = np.argpartition(candidate_distances, found - 1)[:found]
+            nearest = nearest[np.argsort(candidate_distances[nearest], kind='stable')]
+            distances[row, :found] = candidate_distances[nearest]
+            indices[row, :found] = candidates[nearest]
+        return distances, indices
+
+    def predict_proba(self, queries):
+        _, indices = self.search(queries)
+        probabilities = np.zeros((len(indices), len(self.classes_)))
+        for row, neighbours in enumerate(indices):
+            neighbours = neighbours[neighbours >= 0]
+            if len(neighbours):
+                probabilities[row] = np.bincount(self.labels[neighbours], minlength=len(self.classes_)) / len(neighbours)
+        return probabilities
+
+    def predict(self, queries):
+        return self.classes_[np.argmax(self.predict_proba(queries), axis=1)]
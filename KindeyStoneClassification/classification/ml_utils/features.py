@@ -0,0 +1,55 @@
+import os
+import numpy as np
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+
+class FeatureExtractor:
+    """Reduce a batch of 224x224x3 images to a short feature vector for the classical models
+
+    ``downsample`` average-pools the image by that factor (4 turns 150,528
+    raw pixels into 9,408). If PCA arrays are set, the pooled pixels are then
+    projected onto ``components`` principal axes. Only numpy arrays are kept,
+    so the fitted extractor can be saved with joblib and memory-mapped like any
+    other artefact.
+    """
+
+    def __init__(self, downsample=4, pca_mean=None, pca_components=None):
+        self.downsample = downsample
+        self.pca_mean = pca_mean
+        self.pca_components = pca_components
+
+    @property
+    def method(self):
+        return 'pca' if self.pca_components is not None else 'downsample'
+
+    def pool(self, pixels):
+        """Average-pool an (n, H, W, C) batch by the downsample factor and flatten it"""
+        n, height, width, channels = pixels.shape
+        factor = self.downsample
+        if factor > 1:
+            pixels = pixels.reshape(
+                n, height // factor, factor, width // factor, factor, channels
+            ).mean(axis=(2, 4), dtype=np.float32)
+        return pixels.reshape(n, -1)
+
+    def project(self, pooled):
+        """Apply the PCA projection, if fitted, to already pooled rows"""
+        if self.pca_components is None:
+            return pooled
+        return (pooled - self.pca_mean) @ self.pca_components.T
+
+    def transform(self, pixels):
+        """Map an (n, H, W, C) float32 batch to (n, n_features)"""
+        return self.project(self.pool(pixels))
+
+
+def list_labelled_images(data_dir, class_names):
+    """Return (path, class index) pairs from one sub-directory per class"""
+    samples = []
+    for label, class_name in enumerate(class_names):
+        class_dir = os.path.join(data_dir, class_name)
+        for filename in sorted(os.listdir(class_dir)):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                samples.append((os.path.join(class_dir, filename), label))
+    return samples
@@ -0,0 +1,280 @@
+import itertools
+import json
+import os
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from django.conf import settings
+
+# Every frame is two big-endian lengths, a JSON header and an opaque payload (the image bytes)
+FRAME_PREFIX = struct.Struct('!II')
+
+
+class InferenceUnavailable(Exception):
+    """The inference server could not be reached; callers fall back to in-process inference"""
+
+
+class InferenceTimeout(Exception):
+    """The inference server is up but did not answer in time
+
+    Not retried in-process: the server is most likely still working on the
+    request, and predicting again in the web worker would double the load
+    exactly when the server is overloaded.
+    """
+
+
+class RemoteInferenceError(Exception):
+    """The inference server handled the request but the prediction itself failed"""
+
+
+def parse_address(address):
+    """'unix:/path/to.sock' or 'host:port' -> (socket family, address)"""
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[len('unix:'):]
+    host, _, port = address.rpartition(':')
+    return socket.AF_INET, (host or '127.0.0.1', int(port))
+
+
+def send_frame(sock, header, payload=b''):
+    header_bytes = json.dumps(header).encode('utf-8')
+    sock.sendall(FRAME_PREFIX.pack(len(header_bytes), len(payload)) + header_bytes + payload)
+
+
+def _recv_exactly(sock, size):
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = sock.recv(min(size - len(buffer), 1 << 20))
+        if not chunk:
+            return None
+        buffer.extend(chunk)
+    return bytes(buffer)
+
+
+def recv_frame(sock):
+    """Return (header, payload), or None once the peer closes the connection"""
+    prefix = _recv_exactly(sock, FRAME_PREFIX.size)
+    if prefix is None:
+        return None
+    header_size, payload_size = FRAME_PREFIX.unpack(prefix)
+    header = _recv_exactly(sock, header_size)
+    payload = _recv_exactly(sock, payload_size) if payload_size else b''
+    if header is None or payload is None:
+        return None
+    return json.loads(header), payload
+
+
+class InferenceServer:
+    """Serve ``handler(header, payload) -> dict`` over a Unix or TCP socket
+
+    Each connection has one reader thread. Requests are handed to a shared
+    worker pool as soon as they are read, so a client may pipeline many
+    requests on one connection; responses carry the request ``id`` and are
+    written back in completion order.
+    """
+
+    def __init__(self, address, handler, workers=8, backlog=128):
+        self.address = address
+        self.handler = handler
+        self.backlog = backlog
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='inference')
+        self._socket = None
+
+    def serve_forever(self):
+        family, bind_address = parse_address(self.address)
+        if family == socket.AF_UNIX and os.path.exists(bind_address):
+            os.remove(bind_address)  # Left behind by a previous server
+
+        self._socket = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(bind_address)
+        self._socket.listen(self.backlog)
+
+        while True:
+            try:
+                connection, _ = self._socket.accept()
+            except OSError:
+                break  # Closed by shutdown()
+            threading.Thread(target=self._serve_connection, args=(connection,), daemon=True).start()
+
+    def shutdown(self):
+        if self._socket is not None:
+            self._socket.close()
+        self._executor.shutdown(wait=False)
+
+    def _serve_connection(self, connection):
+        write_lock = threading.Lock()
+        try:
+            while True:
+                frame = recv_frame(connection)
+                if frame is None:
+                    break
+                self._executor.submit(self._respond, connection, write_lock, *frame)
+        except OSError:
+            pass
+        finally:
+            connection.close()
+
+    def _respond(self, connection, write_lock, header, payload):
+        try:
+            response = {'id': header.get('id'), 'ok': True, 'result': self.handler(header, payload)}
+        except Exception as e:
+            response = {'id': header.get('id'), 'ok': False, 'error': str(e)}
+
+        try:
+            with write_lock:
+                send_frame(connection, response)
+        except OSError:
+            pass  # The client went away; it has already failed the request
+
+
+class _Connection:
+    """One pipelined client connection with a reader thread resolving futures by request id"""
+
+    def __init__(self, address, connect_timeout):
+        family, connect_address = parse_address(address)
+        self._socket = socket.socket(family, socket.SOCK_STREAM)
+        self._socket.settimeout(connect_timeout)
+        self._socket.connect(connect_address)
+        self._socket.settimeout(None)
+        if family == socket.AF_INET:
+            self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        self._ids = itertools.count()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.closed = False
+        threading.Thread(target=self._read_responses, daemon=True).start()
+
+    @property
+    def in_flight(self):
+        return len(self._pending)
+
+    def submit(self, header, payload):
+        future = Future()
+        with self._lock:
+            if self.closed:
+                raise InferenceUnavailable('Connection to the inference server is closed')
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+            try:
+                send_frame(self._socket, dict(header, id=request_id), payload)
+            except OSError as e:
+                self._pending.pop(request_id, None)
+                self._close(e)
+                raise InferenceUnavailable(str(e))
+        return future
+
+    def _read_responses(self):
+        error = None
+        try:
+            while True:
+                frame = recv_frame(self._socket)
+                if frame is None:
+                    break
+                response, _ = frame
+                with self._lock:
+                    future = self._pending.pop(response['id'], None)
+                if future is None:
+                    continue
+                if response['ok']:
+                    future.set_result(response['result'])
+                else:
+                    future.set_exception(RemoteInferenceError(response['error']))
+        except OSError as e:
+            error = e
+        with self._lock:
+            self._close(error or 'closed by the server')
+
+    def _close(self, reason):
+        """Fail everything still waiting; callers hold ``_lock``"""
+        self.closed = True
+        try:
+            self._socket.close()
+        except OSError:
+            pass
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(InferenceUnavailable(f'Inference server connection lost: {reason}'))
+        self._pending.clear()
+
+
+class InferenceClient:
+    """Pool of pipelined connections to one inference server
+
+    Each request goes to the open connection with the fewest requests in
+    flight. After a failed connect the server is treated as down for
+    ``retry_seconds`` so callers fall back immediately instead of waiting on
+    every request.
+    """
+
+    def __init__(self, address, pool_size=4, timeout=30, connect_timeout=1, retry_seconds=5):
+        self.address = address
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.retry_seconds = retry_seconds
+        self._connections = [None] * pool_size
+        self._lock = threading.Lock()
+        self._down_until = 0.0
+
+    def _get_connection(self):
+        with self._lock:
+            open_connections = [c for c in self._connections if c is not None and not c.closed]
+            # Open another connection while the pool has room and every open one is busy
+            if len(open_connections) < len(self._connections) and not any(
+                c.in_flight == 0 for c in open_connections
+            ):
+                if time.monotonic() >= self._down_until:
+                    try:
+                        connection = _Connection(self.address, self.connect_timeout)
+                    except OSError as e:
+                        self._down_until = time.monotonic() + self.retry_seconds
+                        if not open_connections:
+                            raise InferenceUnavailable(f'Cannot connect to {self.address}: {e}')
+                    else:
+                        slot = next(i for i, c in enumerate(self._connections) if c is None or c.closed)
+                        self._connections[slot] = connection
+                        return connection
+            if not open_connections:
+                raise InferenceUnavailable(f'Inference server {self.address} is down')
+            return min(open_connections, key=lambda c: c.in_flight)
+
+    def call(self, op, payload=b'', **params):
+        future = self._get_connection().submit(dict(params, op=op), payload)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise InferenceTimeout(f'No answer from {self.address} within {self.timeout}s')
+
+    def ping(self):
+        return self.call('ping')
+
+    def predict(self, model_name, image_bytes, content_hash=None):
+        return self.call('predict', image_bytes, model=model_name, content_hash=content_hash)
+
+    def predict_ensemble(self, model_names, image_bytes, strategy='soft', content_hash=None):
+        return self.call('ensemble', image_bytes, models=model_names, strategy=strategy, content_hash=content_hash)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_inference_client():
+    """The process-wide client for settings.INFERENCE_SERVER, or None when inference runs in-process"""
+    global _client
+    address = getattr(settings, 'INFERENCE_SERVER', None)
+    if not address:
+        return None
+    with _client_lock:
+        if _client is None or _client.address != address:
+            _client = InferenceClient(
+                address,
+                pool_size=getattr(settings, 'INFERENCE_POOL_SIZE', 4),
+                timeout=getattr(settings, 'INFERENCE_TIMEOUT_SECONDS', 30),
+                retry_seconds=getattr(settings, 'INFERENCE_RETRY_SECONDS', 5)
+            )
+        return _client
@@ -0,0 +1,244 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; spans a cached lookup (sub-millisecond) up to a cold CNN load
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(label_names, label_values, extra=()):
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count per label set"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def render(self, snapshot, worker):
+        return [
+            f'{self.name}{_format_labels(self.label_names, key, [("worker", worker)])} {_format_value(value)}'
+            for key, value in sorted(snapshot)
+        ]
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label set"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [per-bucket counts (+Inf last), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.label_names)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of the ``with`` block, including when it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), list(counts), total] for key, (counts, total) in self._series.items()]
+
+    def render(self, snapshot, worker):
+        lines = []
+        for key, counts, total in sorted(snapshot):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = [('worker', worker), ('le', _format_value(bound))]
+                lines.append(f'{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}')
+            labels = _format_labels(self.label_names, key, [('worker', worker)])
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    """The metrics of one process, rendered in the Prometheus text exposition format
+
+    Every sample carries a ``worker`` label, the process id. Behind gunicorn a
+    scrape reaches whichever worker accepts it, so each worker also exports
+    its snapshot to a shared directory (``start_export``) and ``render_all``
+    serves every live worker's series from any one of them.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._export_pid = None
+
+    def counter(self, name, documentation, label_names=()):
+        return self._register(Counter(name, documentation, label_names))
+
+    def histogram(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, label_names, buckets))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def snapshot(self):
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+    def render(self, snapshots=None):
+        """Exposition text for {worker: snapshot}; by default this process's live metrics"""
+        if snapshots is None:
+            snapshots = {str(os.getpid()): self.snapshot()}
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for worker, snapshot in sorted(snapshots.items()):
+                lines.extend(metric.render(snapshot.get(metric.name, []), worker))
+        return '\n'.join(lines) + '\n'
+
+    def render_all(self, directory):
+        """render() over every live process that exports to ``directory``, this one read live"""
+        own = str(os.getpid())
+        snapshots = {own: self.snapshot()}
+        for filename in os.listdir(directory):
+            worker, extension = os.path.splitext(filename)
+            if extension != '.json' or worker == own:
+                continue
+            path = os.path.join(directory, filename)
+            if not _process_alive(int(worker)):
+                # A worker that exited or was recycled; its series end with it
+                _remove(path)
+                continue
+            try:
+                with open(path) as f:
+                    snapshots[worker] = json.load(f)
+            except (OSError, ValueError):
+                continue
+        return self.render(snapshots)
+
+    def start_export(self, directory, interval=5.0):
+        """Write this process's snapshot to ``directory`` every ``interval`` seconds
+
+        Call once per process after the fork; a thread started in the
+        gunicorn master does not survive into the workers, so each worker
+        starts its own.
+        """
+        if self._export_pid == os.getpid():
+            return
+        self._export_pid = os.getpid()
+        os.makedirs(directory, exist_ok=True)
+        threading.Thread(
+            target=self._export_loop, args=(directory, interval), name='metrics-export', daemon=True
+        ).start()
+
+    def _export_loop(self, directory, interval):
+        path = os.path.join(directory, f'{os.getpid()}.json')
+        while True:
+            try:
+                # Written aside and renamed, so a scrape never reads half a file
+                with open(f'{path}.tmp', 'w') as f:
+                    json.dump(self.snapshot(), f)
+                os.replace(f'{path}.tmp', path)
+            except OSError as e:
+                print(f"✗ Could not export metrics to {directory}: {str(e)}")
+            time.sleep(interval)
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+registry = MetricsRegistry()
+
+# Stages of one prediction: upload_save, decode, preprocess, feature_extract,
+# scaler_transform, inference and db_write
+PREDICTION_STAGE_SECONDS = registry.histogram(
+    'kidney_prediction_stage_seconds', 'Time spent in each stage of a prediction', ('stage', 'model')
+)
+PREDICTION_REQUEST_SECONDS = registry.histogram(
+    'kidney_prediction_request_seconds', 'End-to-end time of predict/ requests', ('model', 'status')
+)
+MODEL_LOAD_SECONDS = registry.histogram(
+    'kidney_model_load_seconds', 'Time to load a model artefact from disk', ('model',)
+)
+PREDICTION_CACHE_REQUESTS = registry.counter(
+    'kidney_prediction_cache_requests_total', 'Content-hash prediction cache lookups', ('model', 'result')
+)
+MODEL_LOADS = registry.counter(
+    'kidney_model_loads_total', 'Model loads from disk', ('model', 'result')
+)
+MODEL_EVICTIONS = registry.counter(
+    'kidney_model_evictions_total', 'Models dropped to stay within the memory budget', ('model',)
+)
+PREDICTION_ERRORS = registry.counter(
+    'kidney_prediction_errors_total', 'Predictions that raised', ('model',)
+)
+UPLOAD_WRITE_ERRORS = registry.counter(
+    'kidney_upload_write_errors_total', 'Failed writes of streamed uploads to MEDIA_ROOT', ('result',)
+)
+HISTORY_WRITE_SECONDS = registry.histogram(
+    'kidney_history_write_seconds', 'Time to insert and commit one batch of history rows', ('mode',)
+)
+HISTORY_WRITE_BATCH_ROWS = registry.histogram(
+    'kidney_history_write_batch_rows', 'History rows per bulk insert', ('mode',),
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
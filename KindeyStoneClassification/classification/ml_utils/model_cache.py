@@ -0,0 +1,128 @@
+import time
+import types
+import numpy as np
+
+# Objects that never hold model data and should not be walked into
+_SKIPPED_TYPES = (
+    str, int, float, complex, bool, type(None), type,
+    types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType,
+)
+
+
+def estimate_model_size(model):
+    """Approximate the resident size of a loaded model in bytes
+
+    Walks the object graph adding up numpy buffers and raw byte blobs, which
+    is where nearly all of the memory of Keras weights, sklearn trees, KNN
+    training sets and XGBoost boosters lives.
+    """
+    if hasattr(model, 'get_weights'):
+        # Keras models expose their weights directly
+        return int(sum(weight.nbytes for weight in model.get_weights()))
+
+    seen = {}  # id -> object, holding references so temporary state dicts keep unique ids
+    stack = [model]
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen[id(obj)] = obj
+
+        if isinstance(obj, _SKIPPED_TYPES):
+            continue
+        if isinstance(obj, np.memmap):
+            # File-backed pages are shared between workers, not private to this one
+            continue
+        if isinstance(obj, np.ndarray):
+            total += obj.nbytes
+            if obj.dtype == object:
+                stack.extend(obj.ravel())
+        elif isinstance(obj, (bytes, bytearray, memoryview)):
+            total += len(obj)
+        elif isinstance(obj, dict):
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        else:
+            # Cython objects such as sklearn's Tree only reveal their arrays through their state
+            try:
+                state = obj.__getstate__()
+            except Exception:
+                state = getattr(obj, '__dict__', None)
+            if state is not None:
+                stack.append(state)
+    return int(total)
+
+
+class ModelCache:
+    """Loaded models with a memory budget and least-recently-used eviction
+
+    Lookups only read dicts, so the hot path stays lock-free; callers are
+    responsible for serializing puts and evictions per model.
+    """
+
+    def __init__(self, max_bytes=None, pinned=()):
+        self.max_bytes = max_bytes
+        self.pinned = set(pinned)
+        self._models = {}
+        self._sizes = {}
+        self._last_used = {}
+        self.evictions = 0
+
+    def get(self, model_name):
+        model = self._models.get(model_name)
+        if model is not None:
+            self._last_used[model_name] = time.monotonic()
+        return model
+
+    def __contains__(self, model_name):
+        return model_name in self._models
+
+    def put(self, model_name, model, size):
+        self._models[model_name] = model
+        self._sizes[model_name] = size
+        self._last_used[model_name] = time.monotonic()
+
+    def pop(self, model_name):
+        self._sizes.pop(model_name, None)
+        self._last_used.pop(model_name, None)
+        return self._models.pop(model_name, None)
+
+    @property
+    def used_bytes(self):
+        return sum(list(self._sizes.values()))
+
+    def eviction_candidates(self, keep=()):
+        """Least recently used models to drop, in order, to get back under budget"""
+        if self.max_bytes is None:
+            return []
+
+        overflow = self.used_bytes - self.max_bytes
+        candidates = []
+        last_used = dict(self._last_used)
+        for model_name in sorted(last_used, key=last_used.get):
+            if overflow <= 0:
+                break
+            if model_name in self.pinned or model_name in keep:
+                continue
+            candidates.append(model_name)
+            overflow -= self._sizes.get(model_name, 0)
+        return candidates
+
+    def info(self, model_name):
+        """Cache details for one model, for the model listing API"""
+        last_used = self._last_used.get(model_name)
+        return {
+            'size_bytes': self._sizes.get(model_name),
+            'idle_seconds': round(time.monotonic() - last_used, 1) if last_used is not None else None,
+            'pinned': model_name in self.pinned
+        }
+
+    def summary(self):
+        return {
+            'max_bytes': self.max_bytes,
+            'used_bytes': self.used_bytes,
+            'loaded_models': len(self._models),
+            'evictions': self.evictions
+        }
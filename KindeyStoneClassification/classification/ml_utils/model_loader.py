@@ -1,17 +1,134 @@
 import threading
 import os
-import tensorflow as tf
-from tensorflow.keras.models import load_model
-import joblib
+import json
+import queue
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 import numpy as np
-from PIL import Image
 from django.conf import settings
+from .ann_index import IVFIndex
+from .metrics import (
+    MODEL_EVICTIONS, MODEL_LOAD_SECONDS, MODEL_LOADS, PREDICTION_CACHE_REQUESTS, PREDICTION_ERRORS,
+    PREDICTION_STAGE_SECONDS
+)
+from .model_cache import ModelCache, estimate_model_size
+from .prediction_cache import PredictionCache
+from .preprocessing import TARGET_SIZE, PreprocessedImage, as_preprocessed
+from .tflite_model import TFLiteModel
+from .tree_engine import compile_tree_model
+
+class MicroBatcher:
+    """Gather concurrent predict calls for one model into batches of at most max_batch_size rows"""
+    
+    def __init__(self, predict_fn, max_batch_size=64, window_ms=10):
+        self._predict_fn = predict_fn
+        self._max_batch_size = max_batch_size
+        self._window = window_ms / 1000.0
+        self._queue = queue.Queue()
+        # A request that did not fit in the last batch; it starts the next one
+        self._carried = None
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+    
+    def submit(self, inputs):
+        """Queue a batch of inputs and block until its own outputs are ready
+        
+        Inputs larger than max_batch_size are queued as several chunks, so
+        the model never sees more rows at once than it was configured for.
+        """
+        futures = []
+        # An empty submission still makes one (empty) call, as before chunking
+        for start in range(0, max(len(inputs), 1), self._max_batch_size):
+            future = Future()
+            self._queue.put((inputs[start:start + self._max_batch_size], future))
+            futures.append(future)
+        return np.concatenate([future.result() for future in futures])
+    
+    def _collect(self):
+        """Wait for the first request, then keep gathering until the batch is full or the window closes"""
+        first, self._carried = self._carried or self._queue.get(), None
+        pending = [first]
+        batch_size = len(first[0])
+        deadline = time.monotonic() + self._window
+        
+        while batch_size < self._max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if batch_size + len(item[0]) > self._max_batch_size:
+                self._carried = item
+                break
+            pending.append(item)
+            batch_size += len(item[0])
+        
+        return pending
+    
+    def _run(self):
+        while True:
+            pending = self._collect()
+            try:
+                outputs = self._predict_fn(np.concatenate([inputs for inputs, _ in pending]))
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+            
+            # Hand each caller back the slice that belongs to its inputs
+            offset = 0
+            for inputs, future in pending:
+                future.set_result(outputs[offset:offset + len(inputs)])
+                offset += len(inputs)
+
+
+NUM_CLASSES = 2
+
+# Keys used for each model in the training history accuracy records
+TRAINING_HISTORY_KEYS = {
+    'cnn_model': 'CNN',
+    'decision_tree': 'decision_tree',
+    'random_forest': 'random_forest',
+    'xgboost': 'xgboost',
+    'knn': 'knn',
+    'knn_ann': 'knn',
+}
+
+ENSEMBLE_STRATEGIES = ('soft', 'majority')
+
+# Model types that take 224x224 image batches rather than feature rows
+CNN_MODEL_TYPES = ('keras', 'tflite')
+
+# Artefacts used by the classical models that are not offered to users
+INTERNAL_MODELS = ('scaler', 'feature_extractor')
+
+# Offered to users only once their artefact has been built (knn_ann: the build_knn_index command)
+OPTIONAL_MODELS = ('knn_ann',)
+
+# Faster stand-ins for another model, left out of the default ensemble so that model does not vote twice
+ENSEMBLE_ALTERNATIVES = ('knn_ann',)
+
+# Lifecycle of a model inside one worker process
+MODEL_STATE_UNLOADED = 'unloaded'
+MODEL_STATE_LOADING = 'loading'
+MODEL_STATE_LOADED = 'loaded'
+MODEL_STATE_WARMING = 'warming'
+MODEL_STATE_READY = 'ready'
+MODEL_STATE_FAILED = 'failed'
+
 
 class ModelManager:
     _instance = None
-    _lock = threading.Lock()
-    _models = {}
-    _model_loaded_flags = {}  # Track which models are loaded
+    _lock = threading.Lock()  # Guards singleton creation and the small shared tables below
+    _model_locks = {}  # One loading lock per model
+    _eviction_lock = threading.Lock()
+    _model_states = {}  # Finer-grained lifecycle state, reported by the readiness endpoint
+    _warmed = set()  # Models warm-up ran successfully; unlike the state, survives eviction and reload
+    _warm_up_started = False  # Without a warm-up in this process models load on first use, and it is always ready
+    _batchers = {}  # One micro-batcher per CNN model
+    _ensemble_executor = None
     
     def __new__(cls):
         with cls._lock:
@@ -55,6 +172,12 @@ class ModelManager:
                 'name': 'K-Nearest Neighbors',
                 'description': 'Instance-based learning'
             },
+            'knn_ann': {
+                'path': os.path.join(models_dir, 'knn_ann', 'index.json'),
+                'type': 'ann_knn',
+                'name': 'K-Nearest Neighbors (ANN)',
+                'description': 'Instance-based learning over an approximate nearest-neighbour index'
+            },
             'scaler': {
                 'path': os.path.join(models_dir, 'scaler_chunk_final_consolidated.pkl'),
                 'type': 'sklearn',
@@ -63,129 +186,530 @@ class ModelManager:
             }
         }
         
+        # Classical models retrained on reduced features by train_reduced_models
+        if getattr(settings, 'ML_FEATURE_SET', 'raw') == 'reduced':
+            self._use_reduced_features(os.path.join(models_dir, 'reduced'))
+        
+        # Quantized CNN written by the export_tflite_model command, served instead of the .h5 when present
+        cnn_info = self.model_paths['cnn_model']
+        cnn_info['tflite_path'] = os.path.join(models_dir, 'tflite', 'cnn_model_chunk_final_consolidated.tflite')
+        if getattr(settings, 'CNN_PREFER_TFLITE', True) and os.path.exists(cnn_info['tflite_path']):
+            cnn_info['keras_path'] = cnn_info['path']
+            cnn_info['path'] = cnn_info['tflite_path']
+            cnn_info['type'] = 'tflite'
+        
+        # Memory-mappable copies written by the export_mmap_models command
+        for model_name, model_info in self.model_paths.items():
+            if model_info['type'] == 'sklearn':
+                artefact_name = os.path.splitext(os.path.basename(model_info['path']))[0]
+                model_info['mmap_path'] = os.path.join(models_dir, 'mmap', f'{artefact_name}.joblib')
+        
         # Initialize all models as not loaded
         for model_name in self.model_paths.keys():
-            self._model_loaded_flags[model_name] = False
+            self._model_states[model_name] = MODEL_STATE_UNLOADED
+        
+        # Results keyed on image content, model and the versions of the files it predicts from
+        self._prediction_cache = PredictionCache(
+            max_entries=getattr(settings, 'PREDICTION_CACHE_MAX_ENTRIES', 4096),
+            ttl_seconds=getattr(settings, 'PREDICTION_CACHE_TTL_SECONDS', 3600)
+        )
+        
+        # Loaded models live in a memory-bounded LRU cache
+        self._cache = ModelCache(
+            max_bytes=getattr(settings, 'MODEL_CACHE_MAX_BYTES', None),
+            pinned=getattr(settings, 'MODEL_CACHE_PINNED', ['scaler'])
+        )
+        
+        self.model_weights = self._load_model_weights(
+            os.path.join(models_dir, 'training_history_chunk_final_consolidated.json')
+        )
+    
+    def _use_reduced_features(self, reduced_dir):
+        """Point the scaler and classical models at their reduced-feature artefacts"""
+        extractor_path = os.path.join(reduced_dir, 'feature_extractor.joblib')
+        sklearn_models = [
+            model_name for model_name, model_info in self.model_paths.items()
+            if model_info['type'] == 'sklearn'
+        ]
+        
+        # Raw and reduced features cannot be mixed behind one scaler, so switch all or nothing
+        missing = [
+            model_name for model_name in sklearn_models
+            if not os.path.exists(os.path.join(reduced_dir, f'{model_name}.joblib'))
+        ]
+        if missing or not os.path.exists(extractor_path):
+            print(f"✗ Reduced feature artefacts incomplete (missing {missing or ['feature_extractor']}), using raw pixels")
+            return
+        
+        for model_name in sklearn_models:
+            model_info = self.model_paths[model_name]
+            model_info['raw_path'] = model_info['path']
+            model_info['path'] = os.path.join(reduced_dir, f'{model_name}.joblib')
+        
+        # The ANN index stores scaled features, so it has to be rebuilt for the reduced set too
+        ann_info = self.model_paths['knn_ann']
+        ann_info['raw_path'] = ann_info['path']
+        ann_info['path'] = os.path.join(reduced_dir, 'knn_ann', 'index.json')
+        
+        self.model_paths['feature_extractor'] = {
+            'path': extractor_path,
+            'type': 'sklearn',
+            'name': 'Feature Extractor',
+            'description': 'Downsampling/PCA feature reduction for the classical models'
+        }
+    
+    def _load_model_weights(self, history_path):
+        """Average each model's accuracy over the training chunks for ensemble weighting"""
+        weights = {model_id: 1.0 for model_id in TRAINING_HISTORY_KEYS}
+        try:
+            with open(history_path) as f:
+                history = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"✗ Could not read training history, using equal ensemble weights: {str(e)}")
+            return weights
+        
+        for model_id, history_key in TRAINING_HISTORY_KEYS.items():
+            accuracies = [
+                chunk['accuracy'][history_key] for chunk in history
+                if history_key in chunk.get('accuracy', {})
+            ]
+            if accuracies:
+                weights[model_id] = sum(accuracies) / len(accuracies)
+        return weights
     
     def get_available_models(self):
         """Return list of available models for user selection"""
         available_models = []
         for model_id, model_info in self.model_paths.items():
+            if model_id in OPTIONAL_MODELS and not os.path.exists(model_info['path']):
+                continue
             # Don't include scaler in user-facing options
-            if model_id != 'scaler':
+            if model_id not in INTERNAL_MODELS:
                 available_models.append({
                     'id': model_id,
                     'name': model_info['name'],
                     'description': model_info['description'],
                     'type': model_info['type'],
-                    'loaded': self._model_loaded_flags.get(model_id, False)
+                    'loaded': model_id in self._cache,
+                    'state': self._model_states.get(model_id, MODEL_STATE_UNLOADED),
+                    'cache': self._cache.info(model_id)
                 })
         return available_models
     
+    def get_default_ensemble_models(self):
+        """Models an ensemble runs when the caller does not pick a subset"""
+        return [
+            model['id'] for model in self.get_available_models()
+            if model['id'] not in ENSEMBLE_ALTERNATIVES
+        ]
+    
+    def get_cache_info(self):
+        """Return memory budget and usage of the loaded model cache"""
+        return self._cache.summary()
+    
+    def _get_model_lock(self, model_name):
+        """Return the lock that serializes loading of one model"""
+        with self._lock:
+            return self._model_locks.setdefault(model_name, threading.Lock())
+    
+    def _load_from_disk(self, model_info):
+        """Read a model artefact with the loader matching its type"""
+        if not os.path.exists(model_info['path']):
+            raise FileNotFoundError(f"Model file not found: {model_info['path']}")
+        
+        # ML frameworks are imported on the first load of a model that needs them,
+        # so processes that never predict (migrate, admin, user pages) do not pay for them
+        if model_info['type'] == 'keras':
+            from tensorflow.keras.models import load_model
+            return load_model(model_info['path'])
+        if model_info['type'] == 'tflite':
+            return TFLiteModel.load(model_info['path'], num_threads=getattr(settings, 'TFLITE_NUM_THREADS', None))
+        
+        mmap_mode = getattr(settings, 'MODEL_MMAP_MODE', None)
+        if model_info['type'] == 'ann_knn':
+            return IVFIndex.load(
+                os.path.dirname(model_info['path']),
+                mmap_mode=mmap_mode,
+                nprobe=getattr(settings, 'ANN_KNN_NPROBE', 8)
+            )
+        
+        import joblib  # Unpickling imports sklearn or xgboost as the model needs them
+        
+        # Memory-mapped arrays are shared through the page cache by every worker process
+        mmap_path = model_info.get('mmap_path')
+        if mmap_mode and mmap_path and os.path.exists(mmap_path):
+            model = joblib.load(mmap_path, mmap_mode=mmap_mode)
+        else:
+            model = joblib.load(model_info['path'])
+        
+        # Tree models are served from flat node tables instead of the pickled estimators
+        if getattr(settings, 'TREE_ENGINE_ENABLED', True):
+            compiled = compile_tree_model(model)
+            if compiled is not None:
+                return compiled
+        return model
+    
     def load_model(self, model_name):
         """Lazy load a specific model only when needed"""
-        with self._lock:
-            if model_name not in self.model_paths:
-                raise ValueError(f"Model {model_name} not found in available models")
-            
-            # If model already loaded, return it
-            if self._model_loaded_flags.get(model_name, False):
-                return self._models[model_name]
-            
-            model_info = self.model_paths[model_name]
-            model_path = model_info['path']
-            
-            if not os.path.exists(model_path):
-                raise FileNotFoundError(f"Model file not found: {model_path}")
+        if model_name not in self.model_paths:
+            raise ValueError(f"Model {model_name} not found in available models")
+        
+        # Lock-free fast path for models that are already loaded
+        model = self._cache.get(model_name)
+        if model is not None:
+            return model
+        
+        # Only loads of the same model wait on each other
+        with self._get_model_lock(model_name):
+            # Another thread may have finished the load while we waited
+            model = self._cache.get(model_name)
+            if model is not None:
+                return model
             
+            self._model_states[model_name] = MODEL_STATE_LOADING
             try:
-                if model_info['type'] == 'keras':
-                    self._models[model_name] = load_model(model_path)
-                elif model_info['type'] == 'sklearn':
-                    self._models[model_name] = joblib.load(model_path)
-                
-                self._model_loaded_flags[model_name] = True
+                with MODEL_LOAD_SECONDS.time(model=model_name):
+                    model = self._load_from_disk(self.model_paths[model_name])
+                self._cache.put(model_name, model, estimate_model_size(model))
+                self._model_states[model_name] = MODEL_STATE_LOADED
+                MODEL_LOADS.inc(model=model_name, result='success')
                 print(f"✓ Lazy loaded {model_name} successfully")
-                return self._models[model_name]
                 
             except Exception as e:
+                self._model_states[model_name] = MODEL_STATE_FAILED
+                MODEL_LOADS.inc(model=model_name, result='error')
                 print(f"✗ Error lazy loading {model_name}: {str(e)}")
                 raise
+        
+        # Evict outside the load lock so two loading threads never wait on each other
+        self._evict_to_budget(keep={model_name})
+        return model
+    
+    def unload_model(self, model_name):
+        """Drop a loaded model so the next request loads it again"""
+        with self._get_model_lock(model_name):
+            self._model_states[model_name] = MODEL_STATE_UNLOADED
+            self._cache.pop(model_name)
+    
+    def _evict_to_budget(self, keep=()):
+        """Drop least recently used models until the cache fits its memory budget"""
+        with self._eviction_lock:
+            for model_name in self._cache.eviction_candidates(keep=keep):
+                # Skip models that are busy loading; they are retried on the next load
+                lock = self._get_model_lock(model_name)
+                if not lock.acquire(blocking=False):
+                    continue
+                try:
+                    self._cache.pop(model_name)
+                    self._cache.evictions += 1
+                    MODEL_EVICTIONS.inc(model=model_name)
+                    self._model_states[model_name] = MODEL_STATE_UNLOADED
+                    print(f"✓ Evicted {model_name} to stay within the model memory budget")
+                finally:
+                    lock.release()
+    
+    def warm_up(self, model_names):
+        """Load each model and push a dummy 224x224 image through it
+        
+        The dummy prediction triggers TensorFlow graph tracing (and the scaler
+        for classical models) so the first real request does not pay for it.
+        """
+        self._warm_up_started = True
+        dummy_image = PreprocessedImage(np.zeros(TARGET_SIZE + (3,), dtype=np.float32))
+        for model_name in model_names:
+            try:
+                self.get_model(model_name)
+                self._model_states[model_name] = MODEL_STATE_WARMING
+                self.predict_with_model(model_name, dummy_image)
+                self._model_states[model_name] = MODEL_STATE_READY
+                self._warmed.add(model_name)
+                print(f"✓ Warmed up {model_name}")
+            except Exception as e:
+                self._model_states[model_name] = MODEL_STATE_FAILED
+                print(f"✗ Error warming up {model_name}: {str(e)}")
+    
+    def start_warm_up(self, model_names):
+        """Warm up models on a background thread so startup is not blocked"""
+        # Not ready from here on, rather than from whenever the thread gets to run
+        self._warm_up_started = True
+        thread = threading.Thread(target=self.warm_up, args=(list(model_names),), daemon=True)
+        thread.start()
+        return thread
+    
+    def get_readiness(self, model_names):
+        """Report each model's state and whether all of ``model_names`` are warm
+        
+        A warmed model that was later evicted still counts: it is reloaded on
+        demand, so the worker stays ready unless that reload fails. A process
+        that never started a warm-up loads models on first use and is ready.
+        """
+        return {
+            'ready': not self._warm_up_started or all(
+                name in self._warmed and self._model_states.get(name) != MODEL_STATE_FAILED
+                for name in model_names
+            ),
+            'models': dict(self._model_states)
+        }
+    
+    def preload(self, model_names):
+        """Load models up front, e.g. in the gunicorn master before workers fork"""
+        for model_name in model_names:
+            self.get_model(model_name)
     
     def get_model(self, model_name):
         """Get a model, loading it if necessary"""
-        if not self._model_loaded_flags.get(model_name, False):
+        model = self._cache.get(model_name)
+        if model is None:
             return self.load_model(model_name)
-        return self._models.get(model_name)
+        return model
     
-    def preprocess_image_for_cnn(self, image_path, target_size=(224, 224)):
-        """Preprocess image for CNN models"""
+    def _get_batcher(self, model_name):
+        """Get the micro-batcher for a CNN model, creating it on first use"""
+        with self._lock:
+            if model_name not in self._batchers:
+                self._batchers[model_name] = MicroBatcher(
+                    lambda batch: self.get_model(model_name).predict(batch, verbose=0),
+                    max_batch_size=getattr(settings, 'PREDICTION_MAX_BATCH_SIZE', 64),
+                    window_ms=getattr(settings, 'PREDICTION_BATCH_WINDOW_MS', 10)
+                )
+            return self._batchers[model_name]
+    
+    def preprocess(self, source, model_name=''):
+        """Decode an upload once into a PreprocessedImage every model can share"""
         try:
-            img = Image.open(image_path)
-            img = img.convert('RGB')
-            img = img.resize(target_size)
-            img_array = np.array(img) / 255.0
-            img_array = np.expand_dims(img_array, axis=0)
-            return img_array
+            image = as_preprocessed(source)
         except Exception as e:
-            print(f"Error preprocessing image for CNN: {str(e)}")
+            print(f"Error preprocessing image: {str(e)}")
             raise
+        
+        # Decode timings are reported once, under the model that first used the image
+        while image.timings:
+            try:
+                stage, seconds = image.timings.popitem()
+            except KeyError:
+                break  # Reported by a concurrent ensemble member
+            PREDICTION_STAGE_SECONDS.observe(seconds, stage=stage, model=model_name)
+        return image
+    
+    def preprocess_image_for_cnn(self, image, model_name=''):
+        """Preprocess image for CNN models"""
+        return self.preprocess(image, model_name).batch
     
-    def preprocess_image_for_ml(self, image_path, target_size=(224, 224)):
+    def preprocess_image_for_ml(self, image, model_name=''):
         """Preprocess image for traditional ML models"""
+        image = self.preprocess(image, model_name)
+        
+        # Scaled features are cached so every classical model reuses one transform
+        if image.scaled_features is None:
+            image.scaled_features = self._ml_features(image.batch, model_name)
+        
+        return image.scaled_features
+    
+    def _ml_features(self, pixels, model_name=''):
+        """Turn an (n, 224, 224, 3) batch into scaled feature rows for the classical models"""
+        if 'feature_extractor' in self.model_paths:
+            extractor = self.get_model('feature_extractor')
+            with PREDICTION_STAGE_SECONDS.time(stage='feature_extract', model=model_name):
+                features = extractor.transform(pixels)
+        else:
+            # Raw path: flatten every pixel
+            features = pixels.reshape(len(pixels), -1)
+        
+        # Scale features if scaler is available
+        scaler = self.get_model('scaler')
+        if scaler:
+            with PREDICTION_STAGE_SECONDS.time(stage='scaler_transform', model=model_name):
+                features = scaler.transform(features)
+        return features
+    
+    def get_model_version(self, model_name):
+        """Identify the model artefact on disk, so cached results expire when it is replaced"""
         try:
-            img = Image.open(image_path)
-            img = img.convert('RGB')
-            img = img.resize(target_size)
-            img_array = np.array(img) / 255.0
-            # Flatten image for ML models
-            img_array_flat = img_array.flatten().reshape(1, -1)
+            stat = os.stat(self.model_paths[model_name]['path'])
+        except OSError:
+            return None
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+    
+    def get_prediction_version(self, model_name):
+        """Versions of every artefact a model's predictions depend on
+        
+        Classical models also see the image through the feature extractor and
+        scaler, so replacing either of those must expire their cached results too.
+        """
+        artefacts = [model_name]
+        if self.model_paths[model_name]['type'] not in CNN_MODEL_TYPES:
+            artefacts += [name for name in INTERNAL_MODELS if name in self.model_paths]
+        return tuple(self.get_model_version(name) for name in artefacts)
+    
+    def get_prediction_cache_stats(self):
+        """Return hit/miss counters of the content-hash prediction cache"""
+        return self._prediction_cache.stats()
+    
+    def predict_with_model(self, model_name, image, content_hash=None):
+        """Make prediction using specified model with lazy loading
+        
+        ``image`` is a PreprocessedImage, an image path or an uploaded file.
+        When ``content_hash`` (the SHA-256 of the image bytes) is given, a
+        cached result for the same image and artefact versions skips both the
+        decode and the model. Returns the dict built by ``_prediction_result``.
+        """
+        cache_key = None
+        if content_hash is not None:
+            cache_key = (content_hash, model_name, self.get_prediction_version(model_name))
+            cached = self._prediction_cache.get(cache_key)
+            PREDICTION_CACHE_REQUESTS.inc(model=model_name, result='miss' if cached is None else 'hit')
+            if cached is not None:
+                return cached
+        
+        result = self._predict_uncached(model_name, image)
+        if cache_key is not None:
+            self._prediction_cache.set(cache_key, result)
+        return result
+    
+    def _predict_uncached(self, model_name, image):
+        try:
+            model_info = self.model_paths[model_name]
+            if model_info['type'] in CNN_MODEL_TYPES:
+                # CNN model prediction, batched with concurrent requests
+                inputs = self.preprocess_image_for_cnn(image, model_name)
+            else:
+                # Traditional ML model prediction
+                inputs = self.preprocess_image_for_ml(image, model_name)
             
-            # Scale features if scaler is available
-            scaler = self.get_model('scaler')
-            if scaler:
-                img_array_flat = scaler.transform(img_array_flat)
+            return self._prediction_result(self._predict_probabilities(model_name, inputs)[0])
             
-            return img_array_flat
         except Exception as e:
-            print(f"Error preprocessing image for ML: {str(e)}")
+            PREDICTION_ERRORS.inc(model=model_name)
+            print(f"Error during prediction with {model_name}: {str(e)}")
             raise
     
-    def predict_with_model(self, model_name, image_path):
-        """Make prediction using specified model with lazy loading"""
-        try:
-            # Get model (will load if not already loaded)
-            model = self.get_model(model_name)
-            if model is None:
-                raise ValueError(f"Model {model_name} could not be loaded")
+    def _predict_probabilities(self, model_name, inputs):
+        """Run one model call and return an (n, NUM_CLASSES) array indexed by class id
+        
+        ``inputs`` are CNN batches for CNN models and scaled feature rows for
+        the others. The predicted class is always the argmax of these rows,
+        so no model is asked for ``predict`` after ``predict_proba``.
+        """
+        # Get model (will load if not already loaded)
+        model = self.get_model(model_name)
+        if model is None:
+            raise ValueError(f"Model {model_name} could not be loaded")
+        
+        # CNN time includes waiting for the micro-batch to fill
+        with PREDICTION_STAGE_SECONDS.time(stage='inference', model=model_name):
+            if self.model_paths[model_name]['type'] in CNN_MODEL_TYPES:
+                return np.asarray(self._get_batcher(model_name).submit(inputs), dtype=np.float64)
             
+            probabilities = np.zeros((len(inputs), NUM_CLASSES))
+            if hasattr(model, 'predict_proba'):
+                # Columns follow the model's classes_, which may be a subset of the class ids
+                probabilities[:, np.asarray(model.classes_, dtype=int)] = model.predict_proba(inputs)
+            else:
+                # Models without probabilities put all of the mass on their predicted class
+                probabilities[np.arange(len(inputs)), np.asarray(model.predict(inputs), dtype=int)] = 1.0
+            return probabilities
+    
+    def _prediction_result(self, probabilities):
+        """The output contract shared by every prediction path"""
+        predicted_class = int(np.argmax(probabilities))
+        return {
+            'predicted_class': predicted_class,
+            'confidence': float(probabilities[predicted_class]),
+            'probabilities': [float(probability) for probability in probabilities]
+        }
+    
+    def predict_batch(self, model_name, images):
+        """Make predictions for many images with one model call"""
+        try:
             model_info = self.model_paths[model_name]
+            pixels = np.stack([self.preprocess(image, model_name).pixels for image in images])
             
-            if model_info['type'] == 'keras':
-                # CNN model prediction
-                processed_image = self.preprocess_image_for_cnn(image_path)
-                prediction = model.predict(processed_image)
-                confidence = float(np.max(prediction))
-                predicted_class = int(np.argmax(prediction))
-                
+            if model_info['type'] in CNN_MODEL_TYPES:
+                inputs = pixels
             else:
-                # Traditional ML model prediction
-                processed_image = self.preprocess_image_for_ml(image_path)
-                
-                if hasattr(model, 'predict_proba'):
-                    prediction = model.predict_proba(processed_image)
-                    confidence = float(np.max(prediction))
-                    predicted_class = int(model.predict(processed_image)[0])
-                else:
-                    prediction = model.predict(processed_image)
-                    confidence = 1.0  # Default confidence
-                    predicted_class = int(prediction[0])
+                # Same features as preprocess_image_for_ml, extracted and scaled in one call
+                inputs = self._ml_features(pixels, model_name)
             
-            return predicted_class, confidence
+            return [
+                self._prediction_result(probabilities)
+                for probabilities in self._predict_probabilities(model_name, inputs)
+            ]
             
         except Exception as e:
-            print(f"Error during prediction with {model_name}: {str(e)}")
+            PREDICTION_ERRORS.inc(model=model_name)
+            print(f"Error during batch prediction with {model_name}: {str(e)}")
             raise
 
+    def _get_ensemble_executor(self):
+        with self._lock:
+            if self._ensemble_executor is None:
+                self._ensemble_executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'ENSEMBLE_MAX_WORKERS', 5),
+                    thread_name_prefix='ensemble'
+                )
+            return self._ensemble_executor
+    
+    def _timed_prediction(self, model_name, image, content_hash=None):
+        start = time.perf_counter()
+        try:
+            # Copied so the shared cached result is never modified
+            result = dict(self.predict_with_model(model_name, image, content_hash))
+        except Exception as e:
+            result = {'error': str(e)}
+        result['latency_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        return result
+    
+    def predict_ensemble(self, model_names, image, strategy='soft', content_hash=None):
+        """Run several models in parallel on one image and combine their votes
+        
+        ``strategy`` is ``'majority'`` (one vote per model) or ``'soft'``
+        (class probabilities weighted by each model's training accuracy).
+        """
+        if strategy not in ENSEMBLE_STRATEGIES:
+            raise ValueError(f"Unknown ensemble strategy {strategy}")
+        for model_name in model_names:
+            if model_name not in self.model_paths or model_name in INTERNAL_MODELS:
+                raise ValueError(f"Model {model_name} not found in available models")
+        
+        image = self.preprocess(image, 'ensemble')
+        if any(self.model_paths[name]['type'] not in CNN_MODEL_TYPES for name in model_names):
+            # Scale once up front so the classical models share the features
+            self.preprocess_image_for_ml(image, 'ensemble')
+        
+        executor = self._get_ensemble_executor()
+        futures = {
+            name: executor.submit(self._timed_prediction, name, image, content_hash)
+            for name in model_names
+        }
+        
+        results = []
+        scores = np.zeros(NUM_CLASSES)
+        tiebreak = np.zeros(NUM_CLASSES)  # Summed weights, settles tied majority votes
+        for name, future in futures.items():
+            result = future.result()
+            result['model'] = name
+            result['weight'] = round(self.model_weights.get(name, 1.0), 4)
+            results.append(result)
+            
+            if 'error' in result:
+                continue
+            if strategy == 'majority':
+                scores[result['predicted_class']] += 1
+                tiebreak[result['predicted_class']] += result['weight']
+            else:
+                scores += result['weight'] * np.asarray(result['probabilities'])
+        
+        if not scores.any():
+            raise ValueError("No model in the ensemble produced a prediction")
+        
+        predicted_class = max(range(NUM_CLASSES), key=lambda c: (scores[c], tiebreak[c]))
+        return {
+            'predicted_class': predicted_class,
+            'confidence': float(scores[predicted_class] / scores.sum()),
+            'probabilities': [float(score) for score in scores / scores.sum()],
+            'strategy': strategy,
+            'models': results
+        }
+
 # Global model manager instance
 model_manager = ModelManager()
\ No newline at end of file
@@ -0,0 +1,123 @@
+import time
+import numpy as np
+from django.conf import settings
+from PIL import Image
+
+TARGET_SIZE = (224, 224)
+
+# Names accepted by settings.PREPROCESSING_RESAMPLE
+RESAMPLE_FILTERS = {
+    'nearest': Image.Resampling.NEAREST,
+    'box': Image.Resampling.BOX,
+    'bilinear': Image.Resampling.BILINEAR,
+    'hamming': Image.Resampling.HAMMING,
+    'bicubic': Image.Resampling.BICUBIC,
+    'lanczos': Image.Resampling.LANCZOS,
+}
+
+# Fast decode keeps at least this many source pixels per target pixel before the final filter
+REDUCING_GAP = 2.0
+
+# Modes that give the same pixels whether they are resized before or after convert('RGB')
+RESIZE_BEFORE_CONVERT_MODES = ('L', 'RGB')
+
+
+def resample_filter():
+    """The filter every model is trained and served with (settings.PREPROCESSING_RESAMPLE)"""
+    return RESAMPLE_FILTERS[getattr(settings, 'PREPROCESSING_RESAMPLE', 'bicubic')]
+
+
+def fast_decode_enabled():
+    return getattr(settings, 'PREPROCESSING_FAST_DECODE', False)
+
+
+def draft_for_target(img, target_size=TARGET_SIZE):
+    """Before load(): have a JPEG decode at the smallest 1/2, 1/4 or 1/8 DCT scale that stays this big
+
+    A no-op for formats without draft() support.
+    """
+    img.draft('RGB', (int(target_size[0] * REDUCING_GAP), int(target_size[1] * REDUCING_GAP)))
+
+
+class PreprocessedImage:
+    """An upload decoded once and shared by every model that classifies it
+
+    ``pixels`` is a single float32 (224, 224, 3) array scaled to [0, 1].
+    ``batch`` and ``flat`` are views onto it, so handing the image to the
+    CNN and to the classical models never copies the pixel data.
+    """
+
+    def __init__(self, pixels):
+        self.pixels = pixels
+        self.scaled_features = None  # Filled in by ModelManager on first ML use
+        self.timings = {}  # Seconds spent in 'decode' and 'preprocess', reported once by ModelManager
+
+    @classmethod
+    def from_file(cls, source, target_size=TARGET_SIZE, fast=None):
+        """Decode a path or file-like object (e.g. a Django UploadedFile)
+
+        With ``fast`` (default: settings.PREPROCESSING_FAST_DECODE) JPEGs are
+        decoded with DCT scaling close to the target size instead of at full
+        resolution.
+        """
+        if hasattr(source, 'seek'):
+            # Uploaded files are left at EOF after being written to disk
+            source.seek(0)
+
+        if fast is None:
+            fast = fast_decode_enabled()
+
+        start = time.perf_counter()
+        img = Image.open(source)
+        if fast:
+            draft_for_target(img, target_size)
+        img.load()
+        decode_seconds = time.perf_counter() - start
+
+        image = cls.from_image(img, target_size, fast=fast)
+        image.timings['decode'] = decode_seconds
+        return image
+
+    @classmethod
+    def from_image(cls, img, target_size=TARGET_SIZE, fast=None):
+        """Preprocess a PIL image
+
+        ``fast`` lets resize() box-reduce by an integer factor before the
+        final filter, which is much cheaper than filtering from full size.
+        """
+        if fast is None:
+            fast = fast_decode_enabled()
+
+        start = time.perf_counter()
+        convert_first = img.mode not in RESIZE_BEFORE_CONVERT_MODES
+        if convert_first:
+            img = img.convert('RGB')
+        img = img.resize(target_size, resample=resample_filter(), reducing_gap=REDUCING_GAP if fast else None)
+        if not convert_first:
+            img = img.convert('RGB')
+        pixels = np.asarray(img, dtype=np.float32)
+        pixels /= 255.0
+        image = cls(pixels)
+        image.timings['preprocess'] = time.perf_counter() - start
+        return image
+
+    @property
+    def batch(self):
+        """4-D (1, H, W, 3) view for Keras models"""
+        return self.pixels[np.newaxis]
+
+    @property
+    def flat(self):
+        """(1, H*W*3) row view for sklearn models"""
+        return self.pixels.reshape(1, -1)
+
+
+def as_preprocessed(image):
+    """Accept either a PreprocessedImage or anything PreprocessedImage.from_file reads"""
+    if isinstance(image, PreprocessedImage):
+        return image
+    # Streamed uploads are preprocessed while the request body is still being read
+    preprocessed = getattr(image, 'preprocessed', None)
+    if preprocessed is not None:
+        return preprocessed
+    return PreprocessedImage.from_file(image)
@@ -0,0 +1,72 @@
+import threading
+import numpy as np
+
+
+def _interpreter_class():
+    """Prefer the standalone tflite-runtime wheel, which does not pull in TensorFlow"""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        from tensorflow.lite import Interpreter
+    return Interpreter
+
+
+class TFLiteModel:
+    """A converted CNN run through the TensorFlow Lite interpreter
+
+    Mirrors the ``predict(batch, verbose=0)`` call of a Keras model, so the
+    micro-batcher and warm-up treat both the same way. Inputs and outputs are
+    quantized and dequantized when the model was exported with int8 tensors.
+    """
+
+    def __init__(self, model_content, num_threads=None):
+        self.model_content = model_content
+        self.num_threads = num_threads
+        self._lock = threading.Lock()  # The interpreter must not be invoked concurrently
+        self._interpreter = _interpreter_class()(model_content=model_content, num_threads=num_threads)
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._batch_size = None
+
+    @classmethod
+    def load(cls, path, num_threads=None):
+        with open(path, 'rb') as f:
+            return cls(f.read(), num_threads=num_threads)
+
+    def __getstate__(self):
+        # The interpreter is rebuilt from the flatbuffer; this is also what the size estimate walks
+        return {'model_content': self.model_content, 'num_threads': self.num_threads}
+
+    def __setstate__(self, state):
+        self.__init__(state['model_content'], num_threads=state['num_threads'])
+
+    @property
+    def input_dtype(self):
+        return np.dtype(self._input['dtype'])
+
+    def _resize(self, batch_size):
+        if batch_size != self._batch_size:
+            shape = list(self._input['shape'])
+            shape[0] = batch_size
+            self._interpreter.resize_tensor_input(self._input['index'], shape)
+            self._interpreter.allocate_tensors()
+            self._batch_size = batch_size
+
+    def predict(self, batch, verbose=0):
+        batch = np.asarray(batch, dtype=np.float32)
+        scale, zero_point = self._input['quantization']
+        if self.input_dtype != np.float32 and scale:
+            info = np.iinfo(self.input_dtype)
+            batch = np.clip(np.round(batch / scale + zero_point), info.min, info.max)
+        batch = batch.astype(self.input_dtype)
+
+        with self._lock:
+            self._resize(len(batch))
+            self._interpreter.set_tensor(self._input['index'], batch)
+            self._interpreter.invoke()
+            outputs = self._interpreter.get_tensor(self._output['index']).copy()
+
+        scale, zero_point = self._output['quantization']
+        if outputs.dtype != np.float32 and scale:
+            outputs = (outputs.astype(np.float32) - zero_point) * scale
+        return outputs
@@ -0,0 +1,211 @@
+import json
+import numpy as np
+
+
+class TreeEnsemble:
+    """Decision trees flattened into shared node tables for batched numpy traversal
+
+    Every tree of the model is appended to the same arrays. Leaves point to
+    themselves, so stepping a whole ``(samples, trees)`` matrix of node ids
+    ``max_depth`` times leaves every entry on its leaf without per-tree Python
+    loops. Leaf ``values`` are summed over the trees and passed through the
+    model's link function, which gives the class probabilities in one pass.
+    """
+
+    def __init__(self, feature, threshold, left, right, default_left, values, roots, max_depth,
+                 classes, link='mean', base_margin=0.0, strict=False):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.default_left = default_left  # Branch taken for NaN features
+        self.values = values  # (n_nodes, n_outputs), zero on internal nodes
+        self.roots = roots
+        self.max_depth = max_depth
+        self.classes_ = classes
+        self.link = link  # 'mean' (sklearn probabilities), 'sigmoid' or 'softmax' (XGBoost margins)
+        self.base_margin = base_margin
+        self.strict = strict  # XGBoost goes left on x < threshold, sklearn on x <= threshold
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def apply(self, X):
+        """Leaf node id reached in every tree, shape (n_samples, n_trees)"""
+        X = np.asarray(X, dtype=np.float32).reshape(len(X), -1)
+        rows = np.arange(len(X))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(X), self.n_trees))
+
+        for _ in range(self.max_depth):
+            values = X[rows, self.feature[nodes]]
+            if self.strict:
+                go_left = values < self.threshold[nodes]
+            else:
+                go_left = values <= self.threshold[nodes]
+            go_left = np.where(np.isnan(values), self.default_left[nodes], go_left)
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    def predict_proba(self, X):
+        scores = self.values[self.apply(X)].sum(axis=1)
+
+        if self.link == 'mean':
+            return scores / self.n_trees
+        if self.link == 'sigmoid':
+            positive = 1.0 / (1.0 + np.exp(-(scores[:, 0] + self.base_margin)))
+            return np.column_stack([1.0 - positive, positive])
+
+        margins = scores + self.base_margin
+        margins = np.exp(margins - margins.max(axis=1, keepdims=True))
+        return margins / margins.sum(axis=1, keepdims=True)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def _max_depth(left, right, roots):
+    """Number of steps from the roots to the deepest leaf"""
+    depth = 0
+    frontier = roots
+    while True:
+        internal = frontier[left[frontier] != frontier]
+        if not len(internal):
+            return depth
+        frontier = np.concatenate([left[internal], right[internal]])
+        depth += 1
+
+
+def _assemble(trees, n_outputs, classes, **kwargs):
+    """Concatenate per-tree node arrays, offsetting child ids into the shared tables"""
+    columns = {name: [] for name in ('feature', 'threshold', 'left', 'right', 'default_left', 'values')}
+    roots = []
+    offset = 0
+    for tree in trees:
+        n_nodes = len(tree['left'])
+        is_leaf = tree['left'] < 0
+        node_ids = np.arange(n_nodes)
+
+        roots.append(offset)
+        columns['feature'].append(np.where(is_leaf, 0, tree['feature']))
+        columns['threshold'].append(tree['threshold'])
+        columns['left'].append(np.where(is_leaf, node_ids, tree['left']) + offset)
+        columns['right'].append(np.where(is_leaf, node_ids, tree['right']) + offset)
+        columns['default_left'].append(tree['default_left'])
+        values = np.zeros((n_nodes, n_outputs))
+        values[is_leaf] = tree['values'][is_leaf]
+        columns['values'].append(values)
+        offset += n_nodes
+
+    table = {name: np.concatenate(parts) for name, parts in columns.items()}
+    table['feature'] = table['feature'].astype(np.intp)
+    table['left'] = table['left'].astype(np.intp)
+    table['right'] = table['right'].astype(np.intp)
+    table['default_left'] = table['default_left'].astype(bool)
+    roots = np.array(roots, dtype=np.intp)
+    return TreeEnsemble(
+        roots=roots,
+        max_depth=_max_depth(table['left'], table['right'], roots),
+        classes=np.asarray(classes),
+        **table,
+        **kwargs
+    )
+
+
+def _sklearn_tree(estimator):
+    tree = estimator.tree_
+    values = tree.value[:, 0, :].astype(np.float64)
+    totals = values.sum(axis=1, keepdims=True)
+    totals[totals == 0] = 1.0
+    missing_go_to_left = getattr(tree, 'missing_go_to_left', None)
+    return {
+        'feature': tree.feature,
+        'threshold': tree.threshold,
+        'left': tree.children_left,
+        'right': tree.children_right,
+        'default_left': (
+            missing_go_to_left.astype(bool) if missing_go_to_left is not None
+            else np.zeros(tree.node_count, dtype=bool)
+        ),
+        'values': values / totals,
+    }
+
+
+def _compile_sklearn(model):
+    if getattr(model, 'n_outputs_', 1) != 1:
+        return None
+    estimators = getattr(model, 'estimators_', None)
+    if estimators is None:
+        estimators = [model]
+    return _assemble(
+        [_sklearn_tree(estimator) for estimator in estimators],
+        n_outputs=len(model.classes_),
+        classes=model.classes_,
+    )
+
+
+def _compile_xgboost(model):
+    booster = model.get_booster()
+    learner = json.loads(booster.save_raw(raw_format='json'))['learner']
+    objective = learner['objective']['name']
+    if objective not in ('binary:logistic', 'multi:softprob', 'multi:softmax'):
+        return None
+
+    gbtree = learner['gradient_booster']
+    if gbtree['name'] != 'gbtree':
+        return None
+    trees = gbtree['model']['trees']
+    tree_groups = gbtree['model']['tree_info']
+
+    # predict_proba stops at the best iteration when the model was early-stopped
+    best_iteration = getattr(model, 'best_iteration', None)
+    iteration_indptr = gbtree['model'].get('iteration_indptr')
+    if best_iteration is not None and iteration_indptr:
+        trees = trees[:iteration_indptr[best_iteration + 1]]
+
+    n_classes = int(learner['learner_model_param'].get('num_class', '0')) or 1
+    # A scalar before XGBoost 3, a per-class vector such as "[5E-1]" from then on
+    base_score = np.array([
+        float(score) for score in learner['learner_model_param']['base_score'].strip('[]').split(',')
+    ])
+    if objective == 'binary:logistic':
+        # Stored as a probability; the trees add to its logit
+        link, base_margin = 'sigmoid', float(np.log(base_score[0] / (1.0 - base_score[0])))
+    else:
+        link, base_margin = 'softmax', base_score
+
+    compiled = []
+    for tree, group in zip(trees, tree_groups):
+        left = np.array(tree['left_children'], dtype=np.int64)
+        split_conditions = np.array(tree['split_conditions'], dtype=np.float32)
+        values = np.zeros((len(left), n_classes))
+        # Leaves keep their output in split_conditions
+        values[left < 0, group] = split_conditions[left < 0]
+        compiled.append({
+            'feature': np.array(tree['split_indices'], dtype=np.int64),
+            'threshold': split_conditions,
+            'left': left,
+            'right': np.array(tree['right_children'], dtype=np.int64),
+            'default_left': np.array(tree['default_left'], dtype=bool),
+            'values': values,
+        })
+
+    classes = getattr(model, 'classes_', np.arange(max(n_classes, 2)))
+    return _assemble(compiled, n_outputs=n_classes, classes=classes, link=link, base_margin=base_margin, strict=True)
+
+
+def compile_tree_model(model):
+    """Flatten a fitted decision tree, random forest or XGBoost classifier
+
+    Returns None for anything else (or unsupported objectives), so callers
+    can keep using the original model.
+    """
+    if hasattr(model, 'get_booster'):
+        return _compile_xgboost(model)
+    if hasattr(model, 'tree_') or (
+        hasattr(model, 'estimators_') and all(hasattr(estimator, 'tree_') for estimator in model.estimators_)
+    ):
+        if not hasattr(model, 'predict_proba'):
+            return None
+        return _compile_sklearn(model)
+    return None
@@ -1,20 +1,121 @@
-from django.db import models
+import uuid
+from django.db import models, transaction
 from django.conf import settings
 
+def normalize_confidence(confidence):
+    """A confidence as a 0-1 fraction; the dashboard sends percentages, predictions record fractions"""
+    return confidence / 100 if confidence > 1 else confidence
+
+class ClassificationHistoryQuerySet(models.QuerySet):
+    def delete(self):
+        """Delete the rows and take them out of the analytics rollups in one transaction"""
+        from .analytics import remove_history_rows  # analytics imports this module
+        with transaction.atomic(using=self.db):
+            remove_history_rows(self)
+            return super().delete()
+
+
 class ClassificationHistory(models.Model):
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # No index of its own: (user, timestamp, id) below serves every lookup by user
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_index=False)
     uploaded_image = models.ImageField(upload_to='uploads/')
     predicted_class = models.CharField(max_length=100)
     model_used = models.CharField(max_length=100)
     prediction_confidence = models.FloatField()
     timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the prediction runs, so saving the same analysis again does not add a second row
+    prediction_id = models.UUIDField(unique=True, blank=True, null=True, editable=False)
     
     # Additional fields for medical context
     clinical_notes = models.TextField(blank=True, null=True)
     
+    objects = ClassificationHistoryQuerySet.as_manager()
+    
     def __str__(self):
         return f"{self.user.username} - {self.predicted_class}"
     
+    def delete(self, *args, **kwargs):
+        from .analytics import remove_history_rows
+        with transaction.atomic(using=kwargs.get('using') or self._state.db):
+            remove_history_rows(ClassificationHistory.objects.filter(pk=self.pk))
+            return super().delete(*args, **kwargs)
+    
+    @property
+    def confidence_percent(self):
+        # Rows saved from the dashboard before normalize_confidence hold percentages already
+        return normalize_confidence(self.prediction_confidence) * 100
+    
+    class Meta:
+        ordering = ['-timestamp', '-id']
+        verbose_name_plural = 'Classification Histories'
+        indexes = [
+            # Dashboard sidebar and the history API: a user's newest rows, seeking on (timestamp, id)
+            models.Index(fields=['user', '-timestamp', '-id'], name='history_user_recent_idx'),
+            # Counts by model and predicted class, per user or overall
+            models.Index(fields=['user', 'model_used', 'predicted_class'], name='history_user_model_class_idx'),
+            models.Index(fields=['model_used', 'predicted_class'], name='history_model_class_idx'),
+        ]
+
+class DailyHistoryRollup(models.Model):
+    """Running totals of ClassificationHistory per day and model, kept up to date by analytics.py"""
+    # None holds the totals across all users; the unique constraint below indexes the rest
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, blank=True, null=True,
+                             db_index=False)
+    day = models.DateField()
+    model_used = models.CharField(max_length=100)
+    analyses = models.PositiveIntegerField(default=0)
+    stone_positive = models.PositiveIntegerField(default=0)
+    confidence_sum = models.FloatField(default=0)
+    
+    def __str__(self):
+        return f"{self.user or 'All users'} - {self.day} - {self.model_used}"
+    
+    class Meta:
+        ordering = ['day', 'model_used']
+        constraints = [
+            # Also the index for a user's date range
+            models.UniqueConstraint(
+                fields=['user', 'day', 'model_used'], condition=models.Q(user__isnull=False),
+                name='rollup_user_day_model_uniq'
+            ),
+            models.UniqueConstraint(
+                fields=['day', 'model_used'], condition=models.Q(user__isnull=True),
+                name='rollup_all_users_day_model_uniq'
+            ),
+        ]
+
+class PredictionJob(models.Model):
+    """A prediction queued for the background worker pool"""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    model_choice = models.CharField(max_length=50)
+    # Only used when model_choice is 'ensemble'; an empty list runs every default ensemble member
+    ensemble_models = models.JSONField(default=list, blank=True)
+    ensemble_strategy = models.CharField(max_length=20, default='soft')
+    uploaded_image = models.ImageField(upload_to='uploads/')
+    original_name = models.CharField(max_length=255)
+    image_size = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    progress = models.PositiveSmallIntegerField(default=0)
+    result = models.JSONField(blank=True, null=True)
+    error = models.TextField(blank=True, null=True)
+    history = models.ForeignKey(ClassificationHistory, on_delete=models.SET_NULL, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.user.email} - {self.model_choice} ({self.status})"
+    
     class Meta:
-        ordering = ['-timestamp']
-        verbose_name_plural = 'Classification Histories'
\ No newline at end of file
+        ordering = ['-created_at']
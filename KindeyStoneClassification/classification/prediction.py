@@ -0,0 +1,350 @@
+import asyncio
+import functools
+import hashlib
+import os
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.utils import timezone
+from .history_writer import get_history_writer
+from .models import ClassificationHistory
+from .ml_utils.inference_rpc import InferenceUnavailable, get_inference_client
+from .ml_utils.metrics import PREDICTION_STAGE_SECONDS, UPLOAD_WRITE_ERRORS
+from .ml_utils.model_loader import model_manager
+from .ml_utils.preprocessing import PreprocessedImage
+from .uploads import StreamedImageUpload
+
+
+# SIMPLIFIED: Only two classes now
+CLASS_DETAILS = {
+    0: {
+        'name': 'Normal (no stone)',
+        'description': 'No kidney stones detected. The kidney appears healthy and normal.',
+        'risk_level': 'Low',
+        'recommendation': 'Maintain regular checkups and healthy hydration. Continue with routine kidney health monitoring.'
+    },
+    1: {
+        'name': 'Stone',
+        'description': 'Kidney stone detected. Further medical evaluation recommended.',
+        'risk_level': 'Medium-High',
+        'recommendation': 'Consult with a urologist for proper diagnosis and treatment plan. Increase fluid intake and follow medical advice.'
+    }
+}
+
+
+def get_prediction_details(predicted_class):
+    """Return display details for a predicted class index"""
+    return CLASS_DETAILS.get(predicted_class, {
+        'name': f'Class {predicted_class}',
+        'description': 'Kidney analysis completed.',
+        'risk_level': 'Unknown',
+        'recommendation': 'Consult healthcare professional for proper diagnosis.'
+    })
+
+
+ENSEMBLE_MODEL_ID = 'ensemble'
+
+
+def is_valid_model_choice(model_choice):
+    """Check a requested model id against the available models and the ensemble mode"""
+    if model_choice == ENSEMBLE_MODEL_ID:
+        return True
+    return model_choice in [model['id'] for model in model_manager.get_available_models()]
+
+
+def get_model_display_name(model_choice, ensemble_strategy='soft'):
+    """Return the user-facing name of a model id"""
+    if model_choice == ENSEMBLE_MODEL_ID:
+        return f'Ensemble ({ensemble_strategy} vote)'
+    return next(
+        (model['name'] for model in model_manager.get_available_models()
+         if model['id'] == model_choice),
+        model_choice
+    )
+
+
+def save_uploaded_image(image_file):
+    """Save an uploaded image under MEDIA_ROOT/uploads and return its filename
+
+    Files are named after the SHA-256 of their bytes, so re-uploading the same
+    image reuses the stored copy instead of writing another one. Streamed
+    uploads were hashed as they arrived; their bytes are written by a
+    background thread and the name is returned straight away, so call
+    wait_for_upload before recording anything that points at the file.
+    """
+    # Create upload directory if it doesn't exist
+    upload_dir = os.path.join(settings.MEDIA_ROOT, 'uploads')
+    os.makedirs(upload_dir, exist_ok=True)
+    file_extension = os.path.splitext(image_file.name)[1].lower()
+
+    if isinstance(image_file, StreamedImageUpload):
+        unique_filename = f"{image_file.sha256}{file_extension}"
+        if unique_filename not in _pending_uploads:
+            future = _upload_writer.submit(
+                _write_upload, image_file.file.getvalue(), upload_dir, os.path.join(upload_dir, unique_filename)
+            )
+            _pending_uploads[unique_filename] = future
+            # A failed write is forgotten too, so the next upload of the image tries again
+            future.add_done_callback(lambda _: _pending_uploads.pop(unique_filename, None))
+        return unique_filename
+
+    # Hash while writing to a temporary file, then move it into place
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(dir=upload_dir, suffix='.part', delete=False) as destination:
+        for chunk in image_file.chunks():
+            digest.update(chunk)
+            destination.write(chunk)
+
+    unique_filename = f"{digest.hexdigest()}{file_extension}"
+    image_path = os.path.join(upload_dir, unique_filename)
+
+    if os.path.exists(image_path):
+        os.remove(destination.name)
+    else:
+        os.replace(destination.name, image_path)
+
+    return unique_filename
+
+
+# Persists streamed uploads so inference does not wait on the disk
+_upload_writer = ThreadPoolExecutor(max_workers=2, thread_name_prefix='upload-writer')
+
+# Filename -> future of its write, while the write is in flight
+_pending_uploads = {}
+
+UPLOAD_WRITE_ATTEMPTS = 3
+
+
+def _write_upload(data, upload_dir, image_path):
+    for attempt in range(1, UPLOAD_WRITE_ATTEMPTS + 1):
+        if os.path.exists(image_path):
+            return
+        destination = None
+        try:
+            with tempfile.NamedTemporaryFile(dir=upload_dir, suffix='.part', delete=False) as destination:
+                destination.write(data)
+            os.replace(destination.name, image_path)
+            return
+        except OSError as e:
+            if destination is not None and os.path.exists(destination.name):
+                os.remove(destination.name)
+            if attempt == UPLOAD_WRITE_ATTEMPTS:
+                UPLOAD_WRITE_ERRORS.inc(result='failed')
+                print(f"✗ Could not save upload {os.path.basename(image_path)}: {str(e)}")
+                raise
+            UPLOAD_WRITE_ERRORS.inc(result='retried')
+            time.sleep(0.1 * attempt)
+
+
+def wait_for_upload(unique_filename):
+    """Block until a saved upload is on disk; raises OSError if it could not be written"""
+    future = _pending_uploads.get(unique_filename)
+    if future is not None:
+        future.result()
+    _check_upload(unique_filename)
+
+
+async def await_upload(unique_filename):
+    """wait_for_upload() for async callers"""
+    future = _pending_uploads.get(unique_filename)
+    if future is not None:
+        await asyncio.wrap_future(future)
+    _check_upload(unique_filename)
+
+
+def _check_upload(unique_filename):
+    if not os.path.exists(os.path.join(settings.MEDIA_ROOT, 'uploads', unique_filename)):
+        raise OSError(f'Upload {unique_filename} was not saved')
+
+
+def get_content_hash(unique_filename):
+    """Return the SHA-256 of an upload saved by save_uploaded_image"""
+    return os.path.splitext(unique_filename)[0]
+
+
+def format_probabilities(probabilities):
+    """Per-class probabilities, as percentages, for the JSON response"""
+    return [
+        {
+            'class_name': get_prediction_details(class_index)['name'],
+            'probability': round(probability * 100, 2)
+        }
+        for class_index, probability in enumerate(probabilities)
+    ]
+
+
+def read_image_bytes(image):
+    """Raw bytes of an upload or saved image path, or None for an already decoded image"""
+    if isinstance(image, PreprocessedImage):
+        return None
+    if hasattr(image, 'read'):
+        image.seek(0)
+        return image.read()
+    with open(image, 'rb') as f:
+        return f.read()
+
+
+def predict_image(model_choice, image, content_hash=None, ensemble_models=None, ensemble_strategy='soft'):
+    """Predict with one model or the ensemble, on the inference server when one is configured
+
+    Falls back to in-process inference when the server cannot be reached or
+    drops the connection, so a down server degrades throughput rather than
+    availability. A server that is only slow raises InferenceTimeout instead.
+    """
+    client = get_inference_client()
+    image_bytes = read_image_bytes(image) if client is not None else None
+    if image_bytes is not None:
+        try:
+            if model_choice == ENSEMBLE_MODEL_ID:
+                return client.predict_ensemble(ensemble_models, image_bytes, ensemble_strategy, content_hash)
+            return client.predict(model_choice, image_bytes, content_hash)
+        except InferenceUnavailable as e:
+            print(f"✗ Inference server unavailable, predicting in-process: {str(e)}")
+
+    if model_choice == ENSEMBLE_MODEL_ID:
+        return model_manager.predict_ensemble(
+            ensemble_models, image, strategy=ensemble_strategy, content_hash=content_hash
+        )
+    # Make prediction with lazy loading
+    return model_manager.predict_with_model(model_choice, image, content_hash=content_hash)
+
+
+def summarize_ensemble_member(member):
+    """Shape one model's ensemble result for the JSON response"""
+    summary = {
+        'id': member['model'],
+        'name': get_model_display_name(member['model']),
+        'weight': member['weight'],
+        'latency_ms': member['latency_ms'],
+    }
+    if 'error' in member:
+        summary['error'] = member['error']
+    else:
+        summary['class_name'] = get_prediction_details(member['predicted_class'])['name']
+        summary['confidence'] = round(member['confidence'] * 100, 2)
+        summary['probabilities'] = format_probabilities(member['probabilities'])
+    return summary
+
+
+def _prediction_inputs(model_choice, unique_filename, image, ensemble_models):
+    """Resolve the image source, cache key and ensemble members of one prediction"""
+    if image is None:
+        image = os.path.join(settings.MEDIA_ROOT, 'uploads', unique_filename)
+
+    if model_choice == ENSEMBLE_MODEL_ID:
+        # Every user-facing model unless the caller picked a subset
+        ensemble_models = ensemble_models or model_manager.get_default_ensemble_models()
+
+    # Re-uploads of the same image are answered from the prediction cache
+    return image, get_content_hash(unique_filename), ensemble_models
+
+
+def history_fields(user, model_choice, unique_filename, prediction, ensemble_strategy='soft'):
+    """ClassificationHistory field values recording one prediction"""
+    return {
+        'prediction_id': uuid.uuid4(),
+        'user': user,
+        'uploaded_image': f'uploads/{unique_filename}',
+        'predicted_class': get_prediction_details(prediction['predicted_class'])['name'],
+        'model_used': get_model_display_name(model_choice, ensemble_strategy),
+        'prediction_confidence': prediction['confidence']
+    }
+
+
+def build_result_data(prediction, model_choice, unique_filename, image_name, image_size, history_entry,
+                      ensemble_strategy='soft'):
+    """Shape a prediction and its history entry into the PredictView JSON response
+
+    ``history_id`` is None while the entry is still queued (HISTORY_WRITE_MODE = 'deferred');
+    ``prediction_id`` identifies it either way.
+    """
+    predicted_class, confidence = prediction['predicted_class'], prediction['confidence']
+    prediction_details = get_prediction_details(predicted_class)
+
+    # Prepare response data
+    result_data = {
+        'status': 'success',
+        'prediction': {
+            'class_name': prediction_details['name'],
+            'confidence': round(confidence * 100, 2),
+            'probabilities': format_probabilities(prediction['probabilities']),
+            'description': prediction_details['description'],
+            'risk_level': prediction_details['risk_level'],
+            'recommendation': prediction_details['recommendation'],
+            'model_used': get_model_display_name(model_choice, ensemble_strategy),
+            'timestamp': timezone.now().strftime("%Y-%m-%d %H:%M:%S")
+        },
+        'image': {
+            'url': f'/media/uploads/{unique_filename}',
+            'name': image_name,
+            'size': image_size
+        },
+        # Add history entry ID for frontend tracking
+        'history_id': history_entry.id,
+        'prediction_id': str(history_entry.prediction_id)
+    }
+
+    if model_choice == ENSEMBLE_MODEL_ID:
+        result_data['ensemble'] = {
+            'strategy': prediction['strategy'],
+            'models': [summarize_ensemble_member(member) for member in prediction['models']]
+        }
+
+    print(f"✓ Prediction completed: {prediction_details['name']} with {confidence:.2f} confidence")
+
+    return result_data
+
+
+def run_prediction(user, model_choice, unique_filename, image_name, image_size, image=None,
+                   ensemble_models=None, ensemble_strategy='soft'):
+    """Classify a saved upload, record it in history and return the response data
+
+    ``image`` is the upload itself (or an already decoded PreprocessedImage)
+    when the caller still has it in memory; otherwise the saved file is
+    decoded. Decoding only happens on a prediction cache miss.
+    """
+    image, content_hash, ensemble_models = _prediction_inputs(model_choice, unique_filename, image, ensemble_models)
+    prediction = predict_image(model_choice, image, content_hash, ensemble_models, ensemble_strategy)
+
+    # The history row and the response point at the file, so it must be on disk first
+    wait_for_upload(unique_filename)
+
+    # Save to history, batched with concurrent predictions (see history_writer.py)
+    history_entry = ClassificationHistory(**history_fields(user, model_choice, unique_filename, prediction, ensemble_strategy))
+    with PREDICTION_STAGE_SECONDS.time(stage='db_write', model=model_choice):
+        history_entry.id = get_history_writer().save(history_entry)
+    return build_result_data(
+        prediction, model_choice, unique_filename, image_name, image_size, history_entry, ensemble_strategy
+    )
+
+
+# Async views hand inference to these threads; the event loop only awaits them
+_inference_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'ASYNC_INFERENCE_WORKERS', 4),
+    thread_name_prefix='async-inference'
+)
+
+
+async def arun_prediction(user, model_choice, unique_filename, image_name, image_size, image=None,
+                          ensemble_models=None, ensemble_strategy='soft'):
+    """Async run_prediction: inference runs on a bounded executor, history is awaited without a thread
+
+    The event loop only waits on the executor, so under ASGI a slow model
+    holds one executor thread rather than the connection's request thread.
+    """
+    image, content_hash, ensemble_models = _prediction_inputs(model_choice, unique_filename, image, ensemble_models)
+    prediction = await asyncio.get_running_loop().run_in_executor(
+        _inference_executor,
+        functools.partial(predict_image, model_choice, image, content_hash, ensemble_models, ensemble_strategy)
+    )
+
+    await await_upload(unique_filename)
+
+    history_entry = ClassificationHistory(**history_fields(user, model_choice, unique_filename, prediction, ensemble_strategy))
+    with PREDICTION_STAGE_SECONDS.time(stage='db_write', model=model_choice):
+        history_entry.id = await get_history_writer().asave(history_entry)
+    return build_result_data(
+        prediction, model_choice, unique_filename, image_name, image_size, history_entry, ensemble_strategy
+    )
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+from .analytics import record_history_rows, remove_user_from_rollups
+from .models import ClassificationHistory
+
+
+# Rows written one at a time (admin, shell); the history writer's bulk inserts send no signals and update the rollups itself
+@receiver(post_save, sender=ClassificationHistory)
+def add_to_rollups(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        record_history_rows([instance])
+
+
+# Deleted history rows are taken out by ClassificationHistory.delete() and its queryset's delete():
+# a delete signal receiver would make a user's cascade load and signal every one of their rows
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def remove_user_rollups(sender, instance, **kwargs):
+    remove_user_from_rollups(instance)
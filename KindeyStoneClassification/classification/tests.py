@@ -1,3 +1,1052 @@
-from django.test import TestCase
+import importlib.util
+import io
+import itertools
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+import uuid
+from datetime import timedelta
+from unittest import mock
+import numpy as np
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db.models.signals import post_delete, pre_delete
+from django.test import AsyncRequestFactory, Client, SimpleTestCase, TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.tree import DecisionTreeClassifier
+from . import analytics, jobs, prediction, views
+from .analytics import history_statistics, rebuild_rollups
+from .history import ahistory_page, history_page
+from .history_writer import HISTORY_WRITE_MODES, HistoryWriter, PredictionOwnerMismatch
+from .ml_utils.ann_index import IVFIndex
+from .ml_utils.inference_rpc import InferenceTimeout, recv_frame, send_frame
+from .ml_utils.metrics import PREDICTION_REQUEST_SECONDS, MetricsRegistry
+from .ml_utils.model_cache import ModelCache
+from .ml_utils.model_loader import MODEL_STATE_FAILED, MODEL_STATE_READY, MODEL_STATE_UNLOADED, MicroBatcher, model_manager
+from .ml_utils.prediction_cache import PredictionCache
+from .ml_utils.preprocessing import TARGET_SIZE, PreprocessedImage
+from .ml_utils.tree_engine import compile_tree_model
+from .models import ClassificationHistory, DailyHistoryRollup, PredictionJob
+from .views import AsyncHistoryApiView
 
-# Create your tests here.
+HAS_XGBOOST = importlib.util.find_spec('xgboost') is not None
+
+
+class TreeEngineParityTests(SimpleTestCase):
+    """The compiled node tables must reproduce the original estimators exactly"""
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.X_train = rng.normal(size=(400, 20))
+        self.y_train = (self.X_train[:, 0] + self.X_train[:, 1] ** 2 > 1).astype(int)
+        self.X_test = rng.normal(size=(200, 20))
+        # Rows that sit exactly on split thresholds exercise the <= / < comparison
+        self.X_test[:20] = self.X_train[:20]
+
+    def assert_parity(self, model, X):
+        compiled = compile_tree_model(model)
+        self.assertIsNotNone(compiled)
+        np.testing.assert_allclose(compiled.predict_proba(X), model.predict_proba(X), rtol=1e-6, atol=1e-6)
+        np.testing.assert_array_equal(compiled.predict(X), model.predict(X))
+
+    def test_decision_tree(self):
+        model = DecisionTreeClassifier(random_state=0).fit(self.X_train, self.y_train)
+        self.assert_parity(model, self.X_test)
+
+    def test_random_forest(self):
+        model = RandomForestClassifier(n_estimators=25, max_depth=8, random_state=0).fit(self.X_train, self.y_train)
+        self.assert_parity(model, self.X_test)
+
+    def test_multiclass_random_forest(self):
+        y = np.digitize(self.X_train[:, 0], [-0.5, 0.5])
+        model = RandomForestClassifier(n_estimators=10, random_state=0).fit(self.X_train, y)
+        self.assert_parity(model, self.X_test)
+
+    def test_missing_values(self):
+        X_train = self.X_train.copy()
+        X_train[::7, 0] = np.nan
+        X_test = self.X_test.copy()
+        X_test[::5, 0] = np.nan
+        model = DecisionTreeClassifier(random_state=0).fit(X_train, self.y_train)
+        self.assert_parity(model, X_test)
+
+    @unittest.skipUnless(HAS_XGBOOST, 'xgboost is not installed')
+    def test_xgboost_binary(self):
+        from xgboost import XGBClassifier
+        model = XGBClassifier(n_estimators=30, max_depth=4).fit(self.X_train, self.y_train)
+        self.assert_parity(model, self.X_test)
+
+    @unittest.skipUnless(HAS_XGBOOST, 'xgboost is not installed')
+    def test_xgboost_multiclass(self):
+        from xgboost import XGBClassifier
+        y = np.digitize(self.X_train[:, 0], [-0.5, 0.5])
+        model = XGBClassifier(n_estimators=20, max_depth=3).fit(self.X_train, y)
+        self.assert_parity(model, self.X_test)
+
+    def test_unsupported_model(self):
+        self.assertIsNone(compile_tree_model(object()))
+
+
+def create_user(email):
+    return get_user_model().objects.create(email=email, first_name='Test', last_name='User')
+
+
+def image_upload(name='scan.png', size=(64, 64), image_format='PNG', noise=False):
+    buffer = io.BytesIO()
+    # Noise does not compress, so the file is about 3 bytes per pixel
+    if noise:
+        image = Image.frombytes('RGB', size, os.urandom(size[0] * size[1] * 3))
+    else:
+        image = Image.new('RGB', size, (120, 80, 40))
+    image.save(buffer, image_format)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f'image/{image_format.lower()}')
+
+
+def history_entry(user, prediction_id=None, predicted_class='Stone', confidence=0.9):
+    return ClassificationHistory(
+        prediction_id=prediction_id,
+        user=user,
+        uploaded_image='uploads/test.png',
+        predicted_class=predicted_class,
+        model_used='Random Forest',
+        prediction_confidence=confidence
+    )
+
+
+class HistoryWriterTests(TransactionTestCase):
+    """Saving one prediction twice keeps one row, and only for the user it was recorded for"""
+
+    def setUp(self):
+        self.alice = create_user('alice@example.com')
+        self.bob = create_user('bob@example.com')
+
+    def writer(self, mode):
+        writer = HistoryWriter(mode, max_batch_size=10, flush_interval_ms=20)
+        self.addCleanup(writer.close)
+        return writer
+
+    def rows(self, prediction_id):
+        return ClassificationHistory.objects.filter(prediction_id=prediction_id)
+
+    def test_dedup_within_a_batch(self):
+        for mode in HISTORY_WRITE_MODES:
+            with self.subTest(mode=mode):
+                writer = self.writer(mode)
+                prediction_id = uuid.uuid4()
+                ids = writer.save_many([history_entry(self.alice, prediction_id), history_entry(self.alice, prediction_id)])
+                writer.close()
+                row = self.rows(prediction_id).get()
+                if mode != 'deferred':
+                    self.assertEqual(ids, [row.pk, row.pk])
+
+    def test_dedup_across_batches(self):
+        for mode in HISTORY_WRITE_MODES:
+            with self.subTest(mode=mode):
+                writer = self.writer(mode)
+                prediction_id = uuid.uuid4()
+                first = writer.save(history_entry(self.alice, prediction_id))
+                writer.close()
+                second = writer.save(history_entry(self.alice, prediction_id))
+                writer.close()
+                row = self.rows(prediction_id).get()
+                if mode != 'deferred':
+                    self.assertEqual((first, second), (row.pk, row.pk))
+
+    def test_prediction_id_of_another_user(self):
+        for mode in HISTORY_WRITE_MODES:
+            with self.subTest(mode=mode):
+                writer = self.writer(mode)
+                prediction_id = uuid.uuid4()
+                writer.save(history_entry(self.alice, prediction_id))
+                writer.close()
+                if mode == 'deferred':
+                    writer.save(history_entry(self.bob, prediction_id))
+                else:
+                    with self.assertRaises(PredictionOwnerMismatch):
+                        writer.save(history_entry(self.bob, prediction_id))
+                writer.close()
+                self.assertEqual(self.rows(prediction_id).get().user, self.alice)
+
+    def test_prediction_id_of_another_user_in_the_same_batch(self):
+        writer = self.writer('immediate')
+        prediction_id = uuid.uuid4()
+        with self.assertRaises(PredictionOwnerMismatch):
+            writer.save_many([history_entry(self.alice, prediction_id), history_entry(self.bob, prediction_id)])
+        self.assertEqual(self.rows(prediction_id).get().user, self.alice)
+        self.assertFalse(ClassificationHistory.objects.filter(user=self.bob).exists())
+
+
+class SaveHistoryViewTests(TransactionTestCase):
+    def setUp(self):
+        self.alice = create_user('alice@example.com')
+        self.bob = create_user('bob@example.com')
+
+    def save(self, user, **data):
+        self.client.force_login(user)
+        return self.client.post(
+            reverse('classification:save_history'),
+            json.dumps({'predicted_class': 'Stone', 'model_used': 'Random Forest', 'confidence': 0.9, **data}),
+            content_type='application/json'
+        )
+
+    def test_saving_a_recorded_prediction_again(self):
+        with self.settings(HISTORY_WRITE_MODE='immediate'):
+            first = self.save(self.alice).json()
+            second = self.save(self.alice, prediction_id=first['prediction_id']).json()
+        self.assertEqual(first['history_id'], second['history_id'])
+        self.assertEqual(ClassificationHistory.objects.count(), 1)
+
+    def test_prediction_id_of_another_user_is_rejected(self):
+        with self.settings(HISTORY_WRITE_MODE='immediate'):
+            prediction_id = self.save(self.alice).json()['prediction_id']
+            response = self.save(self.bob, prediction_id=prediction_id)
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(ClassificationHistory.objects.filter(user=self.bob).exists())
+
+    def test_invalid_prediction_id(self):
+        self.assertEqual(self.save(self.alice, prediction_id='not-a-uuid').status_code, 400)
+
+
+class AnalyticsRollupTests(TestCase):
+    """The rollups behind the analytics API must match the history they summarise"""
+
+    def setUp(self):
+        self.alice = create_user('alice@example.com')
+        self.bob = create_user('bob@example.com')
+        self.writer = HistoryWriter('immediate')
+
+    def totals(self, user=None):
+        return history_statistics(user)['totals']
+
+    def test_writes_are_added(self):
+        self.writer.save_many([history_entry(self.alice, confidence=0.8), history_entry(self.bob, confidence=0.6)])
+        # Single saves go through the post_save receiver
+        history_entry(self.alice, predicted_class='Normal (no stone)', confidence=0.5).save()
+
+        self.assertEqual(self.totals(self.alice), {
+            'analyses': 2, 'stone_positive': 1, 'stone_positive_rate': 50.0, 'average_confidence': 0.65
+        })
+        self.assertEqual(self.totals()['analyses'], 3)
+        self.assertEqual(self.totals()['average_confidence'], round(1.9 / 3, 4))
+
+    def test_percentages_are_normalized(self):
+        self.writer.save(history_entry(self.alice, confidence=90))
+        self.writer.save(history_entry(self.alice, confidence=0.7))
+        self.assertEqual(self.totals(self.alice)['average_confidence'], 0.8)
+
+    def test_deleting_a_row(self):
+        kept, deleted = history_entry(self.alice, confidence=0.8), history_entry(self.alice, confidence=0.4)
+        self.writer.save_many([kept, deleted])
+        ClassificationHistory.objects.get(pk=deleted.pk).delete()
+        self.assertEqual(self.totals(self.alice)['analyses'], 1)
+        self.assertEqual(self.totals()['average_confidence'], 0.8)
+
+    def test_deleting_rows_with_a_queryset(self):
+        self.writer.save_many([
+            history_entry(self.alice, confidence=0.8),
+            history_entry(self.alice, predicted_class='Normal (no stone)', confidence=40),
+            history_entry(self.bob, confidence=0.6),
+        ])
+        ClassificationHistory.objects.filter(prediction_confidence__gt=1).delete()
+        self.assertEqual(self.totals(self.alice), {
+            'analyses': 1, 'stone_positive': 1, 'stone_positive_rate': 100.0, 'average_confidence': 0.8
+        })
+        self.assertEqual(self.totals()['analyses'], 2)
+
+    def test_deleting_a_user(self):
+        self.writer.save_many([history_entry(self.alice), history_entry(self.alice), history_entry(self.bob, confidence=0.5)])
+        alice_id = self.alice.pk
+        self.alice.delete()
+        self.assertFalse(DailyHistoryRollup.objects.filter(user_id=alice_id).exists())
+        self.assertFalse(ClassificationHistory.objects.filter(user_id=alice_id).exists())
+        self.assertEqual(self.totals(), self.totals(self.bob))
+        self.assertEqual(self.totals()['analyses'], 1)
+
+    def test_user_cascade_does_not_signal_every_history_row(self):
+        # A delete receiver would make Django load and signal each row instead of collecting primary keys
+        self.assertFalse(pre_delete.has_listeners(ClassificationHistory))
+        self.assertFalse(post_delete.has_listeners(ClassificationHistory))
+
+    def test_rebuild_matches_incremental_updates(self):
+        self.writer.save_many([
+            history_entry(self.alice, confidence=0.9),
+            history_entry(self.alice, predicted_class='Normal (no stone)', confidence=75),
+            history_entry(self.bob, confidence=0.6),
+        ])
+        expected = [history_statistics(user) for user in (self.alice, self.bob, None)]
+        DailyHistoryRollup.objects.update(analyses=0, stone_positive=0, confidence_sum=0)
+
+        rebuild_rollups(chunk_size=2)
+        self.assertEqual([history_statistics(user) for user in (self.alice, self.bob, None)], expected)
+
+    def test_failed_rebuild_leaves_the_rollups_untouched(self):
+        self.writer.save_many([history_entry(self.alice) for _ in range(3)])
+        expected = history_statistics()
+        apply = analytics.apply_rollup_increments
+        calls = []
+
+        def apply_then_fail(increments):
+            calls.append(increments)
+            if len(calls) == 2:
+                raise RuntimeError('disk full')
+            apply(increments)
+
+        with mock.patch.object(analytics, 'apply_rollup_increments', apply_then_fail), \
+                self.assertRaises(RuntimeError):
+            rebuild_rollups(chunk_size=2)
+        # Cleared and partly rebuilt in the same transaction, so all of it was rolled back
+        self.assertEqual(history_statistics(), expected)
+
+
+class HistoryPageTests(TestCase):
+    """Keyset pages of the history API, through the sync and the async views"""
+
+    def setUp(self):
+        self.alice = create_user('alice@example.com')
+        self.bob = create_user('bob@example.com')
+        for _ in range(5):
+            history_entry(self.alice).save()
+        history_entry(self.bob).save()
+        # Minutes ago per row, oldest first; rows 2-4 share a timestamp, so only the id orders them
+        now = timezone.now()
+        rows = list(ClassificationHistory.objects.filter(user=self.alice).order_by('id'))
+        for row, minutes in zip(rows, (20, 10, 10, 10, 5)):
+            row.timestamp = now - timedelta(minutes=minutes)
+        ClassificationHistory.objects.bulk_update(rows, ['timestamp'])
+        self.newest_first = [row.id for row in sorted(rows, key=lambda row: (row.timestamp, row.id), reverse=True)]
+        self.client.force_login(self.alice)
+
+    def ids(self, page):
+        return [item['id'] for item in page['items']]
+
+    def get(self, headers=None, **params):
+        return self.client.get(reverse('classification:history'), params, headers=headers)
+
+    async def aget(self, headers=None, **params):
+        request = AsyncRequestFactory().get('/history/', params, headers=headers)
+
+        async def auser():
+            return self.alice
+        request.auser = auser
+        return await AsyncHistoryApiView.as_view()(request)
+
+    def test_pages_before_a_cursor(self):
+        first = history_page(self.alice, limit=2)
+        second = history_page(self.alice, before=first['next_cursor'], limit=2)
+        third = history_page(self.alice, before=second['next_cursor'], limit=2)
+        self.assertEqual(self.ids(first) + self.ids(second) + self.ids(third), self.newest_first)
+        self.assertTrue(second['has_more'])
+        self.assertFalse(third['has_more'])
+        self.assertIsNone(third['next_cursor'])
+
+    def test_rows_since_a_cursor(self):
+        cursor = history_page(self.alice, limit=5)['items'][3]['cursor']
+        page = history_page(self.alice, since=cursor, limit=2)
+        # The two rows just newer than the cursor, then the rest on the next call
+        self.assertEqual(self.ids(page), self.newest_first[1:3])
+        self.assertTrue(page['has_more'])
+        rest = history_page(self.alice, since=page['latest_cursor'], limit=2)
+        self.assertEqual(self.ids(rest), self.newest_first[:1])
+        self.assertFalse(rest['has_more'])
+
+    def test_ties_on_timestamp_break_on_id(self):
+        pages = [history_page(self.alice, limit=1)]
+        while pages[-1]['next_cursor']:
+            pages.append(history_page(self.alice, before=pages[-1]['next_cursor'], limit=1))
+        self.assertEqual([item for page in pages for item in self.ids(page)], self.newest_first)
+
+    def test_only_the_users_rows(self):
+        self.assertEqual(len(history_page(self.bob)['items']), 1)
+
+    def test_invalid_parameters(self):
+        for params in ({'before': 'not a cursor'}, {'since': 'bm9w'}, {'limit': 'x'}, {'limit': 0}):
+            with self.subTest(params=params):
+                self.assertEqual(self.get(**params).status_code, 400)
+
+    def test_etag_and_not_modified(self):
+        response = self.get(limit=2)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get(limit=2, headers={'If-None-Match': response['ETag']}).status_code, 304)
+        # Another page is another tag, and a new row changes every tag
+        self.assertNotEqual(self.get(limit=3)['ETag'], response['ETag'])
+        history_entry(self.alice).save()
+        self.assertEqual(self.get(limit=2, headers={'If-None-Match': response['ETag']}).status_code, 200)
+
+    async def test_async_page_matches_sync(self):
+        first = await ahistory_page(self.alice, limit=2)
+        self.assertEqual(self.ids(first), self.newest_first[:2])
+        response = await self.aget(limit=2, before=first['next_cursor'])
+        self.assertEqual(self.ids(json.loads(response.content)), self.newest_first[2:4])
+
+    async def test_async_etag_and_errors(self):
+        response = await self.aget(limit=2)
+        self.assertEqual((await self.aget(headers={'If-None-Match': response['ETag']}, limit=2)).status_code, 304)
+        self.assertEqual((await self.aget(before='not a cursor')).status_code, 400)
+
+
+class MetricsRegistryTests(SimpleTestCase):
+    """Any worker's scrape must return the series of every live worker"""
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+        self.loads = self.registry.counter('loads_total', 'Loads', ('model',))
+        self.seconds = self.registry.histogram('load_seconds', 'Load time', buckets=(1.0,))
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def export(self, pid, snapshot):
+        with open(os.path.join(self.directory, f'{pid}.json'), 'w') as f:
+            json.dump(snapshot, f)
+
+    def test_samples_carry_the_worker(self):
+        self.loads.inc(model='cnn')
+        self.seconds.observe(0.5)
+        text = self.registry.render()
+        self.assertIn(f'loads_total{{model="cnn",worker="{os.getpid()}"}} 1', text)
+        self.assertIn(f'load_seconds_bucket{{worker="{os.getpid()}",le="1.0"}} 1', text)
+
+    def test_render_all_merges_live_workers(self):
+        self.loads.inc(model='cnn')
+        other = os.getppid()
+        self.export(other, {'loads_total': [[['knn'], 3]], 'load_seconds': [[[], [2, 0], 0.25]]})
+        # Above the largest pid Linux hands out
+        self.export(2 ** 22 + 1, {'loads_total': [[['knn'], 9]]})
+
+        text = self.registry.render_all(self.directory)
+        self.assertIn(f'loads_total{{model="cnn",worker="{os.getpid()}"}} 1', text)
+        self.assertIn(f'loads_total{{model="knn",worker="{other}"}} 3', text)
+        self.assertIn(f'load_seconds_count{{worker="{other}"}} 2', text)
+        # The exited worker's file is dropped with its series
+        self.assertNotIn(' 9', text)
+        self.assertEqual(os.listdir(self.directory), [f'{other}.json'])
+        self.assertEqual(text.count('# TYPE loads_total'), 1)
+
+
+class MicroBatcherTests(SimpleTestCase):
+    def test_batches_never_exceed_max_batch_size(self):
+        batch_sizes = []
+
+        def predict(batch):
+            batch_sizes.append(len(batch))
+            return batch * 2
+
+        batcher = MicroBatcher(predict, max_batch_size=8, window_ms=50)
+        submissions = [np.arange(rows, dtype=float) + 100 * index for index, rows in enumerate((20, 5, 6))]
+        outputs = [None] * len(submissions)
+
+        def submit(index):
+            outputs[index] = batcher.submit(submissions[index])
+
+        threads = [threading.Thread(target=submit, args=(index,)) for index in range(len(submissions))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertLessEqual(max(batch_sizes), 8)
+        self.assertEqual(sum(batch_sizes), 31)
+        for inputs, output in zip(submissions, outputs):
+            np.testing.assert_array_equal(output, inputs * 2)
+
+
+class PredictionRequestMetricsTests(TestCase):
+    def test_unknown_model_choice_adds_no_series(self):
+        self.client.force_login(create_user('alice@example.com'))
+        for model_choice in ('evil0', 'evil1', 'evil2'):
+            response = self.client.post(reverse('classification:predict'), {
+                'image': image_upload(), 'model_choice': model_choice
+            })
+            self.assertEqual(response.status_code, 400)
+
+        models = {key[0] for key, *_ in PREDICTION_REQUEST_SECONDS.snapshot()}
+        self.assertNotIn('evil0', models)
+        self.assertIn('invalid', models)
+
+
+class BatchPredictViewTests(TestCase):
+    def test_more_than_django_default_file_count_reaches_the_view(self):
+        self.client.force_login(create_user('alice@example.com'))
+        response = self.client.post(reverse('classification:predict_batch'), {
+            'images': [image_upload(f'scan{index}.png', size=(8, 8)) for index in range(101)],
+            'model_choice': 'not-a-model'
+        })
+        # The view's own validation answered, rather than Django's TooManyFilesSent
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Invalid model selected'})
+
+
+class PredictionJobTests(TransactionTestCase):
+    """jobs/ queues a prediction on the worker pool; jobs/<id>/ reports it to its owner"""
+
+    def setUp(self):
+        self.alice = create_user('alice@example.com')
+        self.client.force_login(self.alice)
+
+    def queue_job(self):
+        # The ensemble id is always valid, so no model artefact is needed to get past validation
+        return self.client.post(reverse('classification:predict_job'), {
+            'image': image_upload(), 'model_choice': 'ensemble'
+        })
+
+    def wait_for(self, job_id, timeout=10):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            status = self.client.get(reverse('classification:job_status', args=[job_id])).json()
+            if status['status'] in (PredictionJob.STATUS_COMPLETED, PredictionJob.STATUS_FAILED):
+                return status
+            time.sleep(0.02)
+        self.fail(f'Job {job_id} did not finish')
+
+    def test_completed_job(self):
+        result = {'status': 'success', 'history_id': None}
+        with mock.patch.object(jobs, 'run_prediction', return_value=result) as run_prediction:
+            response = self.queue_job()
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.json()['status'], PredictionJob.STATUS_PENDING)
+            status = self.wait_for(response.json()['job_id'])
+
+        self.assertEqual((status['status'], status['progress'], status['result']), ('completed', 100, result))
+        # The worker predicts from the upload decoded while it streamed in
+        self.assertIsNotNone(run_prediction.call_args.kwargs['image'].preprocessed)
+
+    def test_failed_job(self):
+        with mock.patch.object(jobs, 'run_prediction', side_effect=RuntimeError('model exploded')):
+            status = self.wait_for(self.queue_job().json()['job_id'])
+        self.assertEqual((status['status'], status['error']), ('failed', 'model exploded'))
+
+    def test_full_queue(self):
+        with mock.patch.object(jobs, '_slots', threading.Semaphore(0)):
+            response = self.queue_job()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(PredictionJob.objects.get().status, PredictionJob.STATUS_FAILED)
+
+    def test_oversized_upload_is_refused(self):
+        with self.settings(PREDICTION_MAX_UPLOAD_BYTES=1024):
+            response = self.client.post(reverse('classification:predict_job'), {
+                'image': image_upload(size=(64, 64), noise=True), 'model_choice': 'ensemble'
+            })
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(PredictionJob.objects.exists())
+
+    def test_stale_job_fails(self):
+        job = PredictionJob.objects.create(user=self.alice, model_choice='ensemble', original_name='scan.png')
+        fresh = PredictionJob.objects.create(user=self.alice, model_choice='ensemble', original_name='scan.png')
+        PredictionJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(jobs.fail_if_stale(PredictionJob.objects.get(pk=job.pk)).status, 'failed')
+        self.assertEqual(jobs.fail_if_stale(PredictionJob.objects.get(pk=fresh.pk)).status, 'pending')
+
+    def test_only_the_owner_sees_a_job(self):
+        job = PredictionJob.objects.create(user=self.alice, model_choice='ensemble', original_name='scan.png')
+        self.client.force_login(create_user('bob@example.com'))
+        self.assertEqual(self.client.get(reverse('classification:job_status', args=[job.id])).status_code, 404)
+
+
+class StreamingUploadTests(TransactionTestCase):
+    """predict/ decodes the upload as it streams in and refuses bad ones early"""
+
+    def setUp(self):
+        self.alice = create_user('alice@example.com')
+        self.client.force_login(self.alice)
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_settings = self.settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+    def predict(self, image, client=None, **data):
+        return (client or self.client).post(reverse('classification:predict'), {
+            'image': image, 'model_choice': 'ensemble', **data
+        })
+
+    def test_too_many_bytes(self):
+        with self.settings(PREDICTION_MAX_UPLOAD_BYTES=1024):
+            response = self.predict(image_upload(noise=True))
+        self.assertEqual(response.status_code, 413)
+        self.assertIn('larger than', response.json()['error'])
+
+    def test_too_many_pixels(self):
+        with self.settings(PREDICTION_MAX_IMAGE_PIXELS=1000):
+            response = self.predict(image_upload(size=(64, 64)))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('pixels', response.json()['error'])
+
+    def test_not_an_image(self):
+        response = self.predict(SimpleUploadedFile('scan.png', b'not an image at all', content_type='image/png'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Uploaded file is not a valid image'})
+
+    def test_anonymous_request_is_refused_before_the_body_is_parsed(self):
+        self.client.logout()
+        with mock.patch.object(views, 'StreamingImageUploadHandler') as handler:
+            response = self.predict(image_upload())
+        self.assertEqual(response.status_code, 302)
+        handler.assert_not_called()
+
+    def test_csrf_is_still_checked(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.alice)
+        self.assertEqual(self.predict(image_upload(), client=client).status_code, 403)
+
+        token = 'a' * 32
+        client.cookies['csrftoken'] = token
+        response = self.predict(image_upload(), client=client, model_choice='not-a-model', csrfmiddlewaretoken=token)
+        self.assertEqual(response.status_code, 400)
+
+    def test_upload_is_on_disk_before_its_history_row(self):
+        ensemble_result = {
+            'predicted_class': 1, 'confidence': 0.9, 'probabilities': [0.1, 0.9], 'strategy': 'soft', 'models': []
+        }
+        write_upload = prediction._write_upload
+
+        def slow_write(*args):
+            time.sleep(0.3)
+            write_upload(*args)
+
+        on_disk_at_save = []
+
+        def save(entry):
+            on_disk_at_save.append(os.path.exists(os.path.join(settings.MEDIA_ROOT, entry.uploaded_image.name)))
+
+        with mock.patch.object(prediction, 'predict_image', return_value=ensemble_result), \
+                mock.patch.object(prediction, '_write_upload', slow_write), \
+                mock.patch.object(HistoryWriter, 'save', side_effect=save):
+            response = self.predict(image_upload())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(on_disk_at_save, [True])
+
+
+class MetricsViewTests(SimpleTestCase):
+    def get(self, **headers):
+        return self.client.get(reverse('classification:metrics'), headers=headers)
+
+    def test_allowed_ips_without_a_token(self):
+        with self.settings(METRICS_TOKEN=None, METRICS_DIR=None):
+            self.assertEqual(self.get().status_code, 200)
+            # Relayed by a proxy, so REMOTE_ADDR is the proxy's
+            self.assertEqual(self.get(x_forwarded_for='203.0.113.9').status_code, 403)
+
+    def test_token_is_required_when_set(self):
+        with self.settings(METRICS_TOKEN='s3cret', METRICS_DIR=None):
+            self.assertEqual(self.get().status_code, 403)
+            self.assertEqual(self.get(authorization='Bearer wrong').status_code, 403)
+            self.assertEqual(self.get(authorization='Bearer s3cret', x_forwarded_for='203.0.113.9').status_code, 200)
+
+
+class StubModel:
+    """A classifier with fixed probabilities whose weights give it a known size"""
+    classes_ = np.array([0, 1])
+
+    def __init__(self, probabilities=(0.5, 0.5), size=1000):
+        self.probabilities = np.asarray(probabilities, dtype=np.float64)
+        self.weights = np.zeros(size, dtype=np.uint8)
+        self.calls = 0
+
+    def predict_proba(self, inputs):
+        self.calls += 1
+        return np.tile(self.probabilities, (len(inputs), 1))
+
+
+class IdentityTransformer:
+    """Stands in for the scaler and feature extractor"""
+
+    def transform(self, features):
+        return features
+
+
+class ModelManagerTestCase(SimpleTestCase):
+    """Runs the shared model_manager over stub models, restoring its real state afterwards
+
+    Each stub has a file in a temporary directory, which is what its version is read from.
+    """
+    max_bytes = None
+
+    def setUp(self):
+        self.manager = model_manager
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.loads = []
+        self.broken = set()
+        state = {
+            'model_paths': {},
+            'model_weights': {},
+            '_model_states': {},
+            '_model_locks': {},
+            '_warmed': set(),
+            '_warm_up_started': False,
+            '_cache': ModelCache(max_bytes=self.max_bytes, pinned=['scaler']),
+            '_prediction_cache': PredictionCache(),
+            '_load_from_disk': self.load_from_disk,
+        }
+        for name, value in state.items():
+            patcher = mock.patch.object(self.manager, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.add_model('scaler', IdentityTransformer())
+
+    def add_model(self, name, model, weight=1.0):
+        path = os.path.join(self.directory.name, f'{name}.joblib')
+        self.write_artefact(name, b'v1')
+        self.manager.model_paths[name] = {'path': path, 'type': 'sklearn', 'name': name, 'stub': model}
+        self.manager.model_weights[name] = weight
+        self.manager._model_states[name] = MODEL_STATE_UNLOADED
+
+    def write_artefact(self, name, content):
+        with open(os.path.join(self.directory.name, f'{name}.joblib'), 'wb') as f:
+            f.write(content)
+
+    def load_from_disk(self, model_info):
+        self.loads.append(model_info['name'])
+        if model_info['name'] in self.broken:
+            raise OSError(f"{model_info['name']} is unreadable")
+        return model_info['stub']
+
+
+class ReadinessTests(ModelManagerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_model('stones', StubModel((0.2, 0.8)))
+
+    def test_ready_without_warm_up(self):
+        # Models load on first use, so a worker that never warms up must not report 503 forever
+        self.assertTrue(self.manager.get_readiness(['stones'])['ready'])
+
+    def test_not_ready_until_warm_up_finishes(self):
+        with mock.patch.object(self.manager, 'warm_up'):
+            self.manager.start_warm_up(['stones']).join()
+        self.assertFalse(self.manager.get_readiness(['stones'])['ready'])
+
+        self.manager.warm_up(['stones'])
+        readiness = self.manager.get_readiness(['stones'])
+        self.assertTrue(readiness['ready'])
+        self.assertEqual(readiness['models']['stones'], MODEL_STATE_READY)
+
+    def test_failed_warm_up_is_not_ready(self):
+        self.broken.add('stones')
+        self.manager.warm_up(['stones'])
+        readiness = self.manager.get_readiness(['stones'])
+        self.assertFalse(readiness['ready'])
+        self.assertEqual(readiness['models']['stones'], MODEL_STATE_FAILED)
+
+    def test_evicted_model_stays_ready_until_its_reload_fails(self):
+        self.manager.warm_up(['stones'])
+        self.manager._cache.max_bytes = 0
+        self.manager._evict_to_budget()
+        readiness = self.manager.get_readiness(['stones'])
+        self.assertEqual(readiness['models']['stones'], MODEL_STATE_UNLOADED)
+        self.assertTrue(readiness['ready'])
+
+        self.broken.add('stones')
+        with self.assertRaises(OSError):
+            self.manager.get_model('stones')
+        self.assertFalse(self.manager.get_readiness(['stones'])['ready'])
+
+
+
+class PredictionCacheTests(SimpleTestCase):
+    def test_entries_expire_after_their_ttl(self):
+        cache = PredictionCache(ttl_seconds=60)
+        with mock.patch('classification.ml_utils.prediction_cache.time') as clock:
+            clock.monotonic.return_value = 1000.0
+            cache.set('key', 'result')
+            clock.monotonic.return_value = 1059.0
+            self.assertEqual(cache.get('key'), 'result')
+            clock.monotonic.return_value = 1061.0
+            self.assertIsNone(cache.get('key'))
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_least_recently_used_entry_is_dropped_beyond_max_entries(self):
+        cache = PredictionCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+        self.assertEqual(cache.stats()['entries'], 2)
+
+
+class ContentHashCacheTests(ModelManagerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.model = StubModel((0.3, 0.7))
+        self.add_model('stones', self.model)
+        self.image = PreprocessedImage(np.zeros(TARGET_SIZE + (3,), dtype=np.float32))
+
+    def predict(self, content_hash):
+        return self.manager.predict_with_model('stones', self.image, content_hash)
+
+    def test_same_content_hash_skips_the_model(self):
+        first = self.predict('a' * 64)
+        self.assertEqual(self.predict('a' * 64), first)
+        self.assertEqual(self.model.calls, 1)
+
+        self.predict('b' * 64)
+        self.assertEqual(self.model.calls, 2)
+        # Without a hash nothing is cached
+        self.manager.predict_with_model('stones', self.image)
+        self.manager.predict_with_model('stones', self.image)
+        self.assertEqual(self.model.calls, 4)
+
+    def test_replacing_the_model_file_expires_its_results(self):
+        self.predict('a' * 64)
+        self.write_artefact('stones', b'retrained')
+        self.predict('a' * 64)
+        self.assertEqual(self.model.calls, 2)
+
+    def test_replacing_the_scaler_or_feature_extractor_expires_results(self):
+        self.add_model('feature_extractor', IdentityTransformer())
+        self.predict('a' * 64)
+        self.write_artefact('scaler', b'refitted')
+        self.predict('a' * 64)
+        self.write_artefact('feature_extractor', b'refitted')
+        self.predict('a' * 64)
+        self.assertEqual(self.model.calls, 3)
+
+
+
+class ModelCacheEvictionTests(ModelManagerTestCase):
+    max_bytes = 2500  # Room for two of the 1000 byte stubs below
+
+    def setUp(self):
+        super().setUp()
+        for name in ('a', 'b', 'c'):
+            self.add_model(name, StubModel(size=1000))
+        # A strictly increasing clock, so no two uses of the cache tie
+        clock = mock.patch('classification.ml_utils.model_cache.time')
+        clock.start().monotonic.side_effect = itertools.count()
+        self.addCleanup(clock.stop)
+
+    def loaded(self):
+        return {name for name in ('scaler', 'a', 'b', 'c') if name in self.manager._cache}
+
+    def test_least_recently_used_model_is_evicted_and_reloaded_on_demand(self):
+        self.manager.get_model('scaler')
+        self.manager.get_model('a')
+        self.manager.get_model('b')
+        self.manager.get_model('a')  # b is now the least recently used
+        self.manager.get_model('c')
+
+        self.assertEqual(self.loaded(), {'scaler', 'a', 'c'})
+        self.assertEqual(self.manager._model_states['b'], MODEL_STATE_UNLOADED)
+        self.assertLessEqual(self.manager._cache.used_bytes, self.max_bytes)
+        self.assertEqual(self.manager.get_cache_info()['evictions'], 1)
+
+        # b comes back from disk, and pushes out a, now the least recently used
+        self.assertIs(self.manager.get_model('b'), self.manager.model_paths['b']['stub'])
+        self.assertEqual(self.loads, ['scaler', 'a', 'b', 'c', 'b'])
+        self.assertEqual(self.loaded(), {'scaler', 'b', 'c'})
+        self.assertEqual(self.manager.get_cache_info()['evictions'], 2)
+
+    def test_pinned_and_just_loaded_models_are_kept_over_budget(self):
+        self.manager._cache.max_bytes = 0
+        self.manager.get_model('scaler')
+        self.manager.get_model('a')
+        self.assertEqual(self.loaded(), {'scaler', 'a'})
+        self.manager.get_model('b')
+        self.assertEqual(self.loaded(), {'scaler', 'b'})
+
+
+
+class EnsembleTests(ModelManagerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_model('a', StubModel((0.2, 0.8)), weight=0.9)
+        self.add_model('b', StubModel((0.6, 0.4)), weight=0.5)
+        self.add_model('c', StubModel((0.7, 0.3)), weight=0.6)
+        self.image = PreprocessedImage(np.zeros(TARGET_SIZE + (3,), dtype=np.float32))
+
+    def predict(self, model_names, strategy):
+        return self.manager.predict_ensemble(model_names, self.image, strategy)
+
+    def test_soft_vote_weights_probabilities_by_accuracy(self):
+        result = self.predict(['a', 'b', 'c'], 'soft')
+        # 0.9 * [0.2, 0.8] + 0.5 * [0.6, 0.4] + 0.6 * [0.7, 0.3] = [0.9, 1.1]
+        self.assertEqual(result['predicted_class'], 1)
+        self.assertAlmostEqual(result['confidence'], 0.55)
+        np.testing.assert_allclose(result['probabilities'], [0.45, 0.55])
+        self.assertEqual(result['strategy'], 'soft')
+
+    def test_majority_vote_counts_one_vote_per_model(self):
+        result = self.predict(['a', 'b', 'c'], 'majority')
+        self.assertEqual(result['predicted_class'], 0)
+        self.assertAlmostEqual(result['confidence'], 2 / 3)
+
+        # A tied vote goes to the class backed by the larger summed weight
+        self.assertEqual(self.predict(['a', 'b'], 'majority')['predicted_class'], 1)
+
+    def test_breakdown_reports_every_member(self):
+        models = self.predict(['a', 'b', 'c'], 'soft')['models']
+        self.assertEqual([member['model'] for member in models], ['a', 'b', 'c'])
+        self.assertEqual([member['predicted_class'] for member in models], [1, 0, 0])
+        self.assertEqual([member['weight'] for member in models], [0.9, 0.5, 0.6])
+        np.testing.assert_allclose(models[0]['probabilities'], [0.2, 0.8])
+        self.assertTrue(all(member['latency_ms'] >= 0 for member in models))
+
+    def test_failing_member_is_reported_and_left_out_of_the_vote(self):
+        self.broken.add('c')
+        result = self.predict(['a', 'b', 'c'], 'soft')
+        # 0.9 * [0.2, 0.8] + 0.5 * [0.6, 0.4] = [0.48, 0.92]
+        self.assertEqual(result['predicted_class'], 1)
+        self.assertAlmostEqual(result['confidence'], 0.92 / 1.4)
+        failed = result['models'][2]
+        self.assertEqual(failed['model'], 'c')
+        self.assertEqual(failed['error'], 'c is unreadable')
+        self.assertNotIn('predicted_class', failed)
+
+    def test_no_member_succeeding_is_an_error(self):
+        self.broken.update({'a', 'b'})
+        with self.assertRaises(ValueError):
+            self.predict(['a', 'b'], 'majority')
+
+
+
+class IVFIndexTests(SimpleTestCase):
+    """The approximate KNN index against an exact search over the same rows"""
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        centres = rng.normal(scale=10, size=(20, 16))
+        blobs = rng.integers(len(centres), size=3000)
+        vectors = centres[blobs] + rng.normal(size=(len(blobs), 16))
+        self.index = IVFIndex.build(vectors, blobs % 2, n_lists=32)
+        self.queries = centres[rng.integers(len(centres), size=200)] + rng.normal(size=(200, 16))
+
+    def exact_neighbours(self, k=5):
+        vectors = self.index.vectors.astype(np.float64)
+        distances = ((self.queries[:, None, :] - vectors[None, :, :]) ** 2).sum(axis=2)
+        return np.argsort(distances, axis=1)[:, :k]
+
+    def test_probing_every_list_is_an_exact_search(self):
+        _, indices = self.index.search(self.queries, nprobe=self.index.n_lists)
+        for found, expected in zip(indices, self.exact_neighbours()):
+            self.assertEqual(set(found), set(expected))
+
+        exact = KNeighborsClassifier(n_neighbors=5).fit(self.index.vectors, self.index.labels)
+        self.index.nprobe = self.index.n_lists
+        np.testing.assert_allclose(self.index.predict_proba(self.queries), exact.predict_proba(self.queries))
+
+    def test_recall_at_the_default_nprobe(self):
+        _, indices = self.index.search(self.queries, nprobe=settings.ANN_KNN_NPROBE)
+        found = sum(len(set(row) & set(expected)) for row, expected in zip(indices, self.exact_neighbours()))
+        self.assertGreaterEqual(found / indices.size, 0.9)
+
+    def test_saved_index_loads_memory_mapped(self):
+        with tempfile.TemporaryDirectory() as index_dir:
+            self.index.save(index_dir)
+            loaded = IVFIndex.load(index_dir, mmap_mode='r', nprobe=4)
+            self.assertIsInstance(loaded.vectors, np.memmap)
+            np.testing.assert_array_equal(
+                loaded.search(self.queries, nprobe=4)[1], self.index.search(self.queries, nprobe=4)[1]
+            )
+            del loaded  # Releases the mapped files before the directory is removed
+
+
+
+class FakeInferenceServer:
+    """A Unix socket server that reads one request per connection, then answers, hangs or hangs up"""
+
+    def __init__(self, behaviour):
+        self.behaviour = behaviour
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'inference.sock')
+        self.requests = []
+        self.release = threading.Event()
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.bind(self.path)
+        self._socket.listen(8)
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    @property
+    def address(self):
+        return f'unix:{self.path}'
+
+    def _serve(self):
+        while True:
+            try:
+                connection, _ = self._socket.accept()
+            except OSError:
+                return
+            with connection:
+                header, payload = recv_frame(connection)
+                self.requests.append(header)
+                if self.behaviour == 'answer':
+                    send_frame(connection, {'id': header['id'], 'ok': True, 'result': {'predicted_class': 1}})
+                    recv_frame(connection)  # Until the client hangs up
+                elif self.behaviour == 'hang':
+                    self.release.wait()
+
+    def close(self):
+        self.release.set()
+        self._socket.close()
+        self.directory.cleanup()
+
+
+class InferenceFallbackTests(SimpleTestCase):
+    """predict_image falls back to the web worker only when the server cannot be reached"""
+
+    def setUp(self):
+        patcher = mock.patch.object(prediction.model_manager, 'predict_with_model', return_value={'predicted_class': 0})
+        self.local = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def predict(self, address):
+        with self.settings(INFERENCE_SERVER=address, INFERENCE_TIMEOUT_SECONDS=0.5):
+            return prediction.predict_image('knn', io.BytesIO(b'image bytes'), content_hash='a' * 64)
+
+    def serve(self, behaviour):
+        server = FakeInferenceServer(behaviour)
+        self.addCleanup(server.close)
+        return server
+
+    def test_answer_from_the_server_is_used(self):
+        server = self.serve('answer')
+        self.assertEqual(self.predict(server.address), {'predicted_class': 1})
+        self.local.assert_not_called()
+        self.assertEqual(server.requests[0]['model'], 'knn')
+
+    def test_unreachable_server_falls_back_to_local_inference(self):
+        with tempfile.TemporaryDirectory() as directory:
+            result = self.predict(f"unix:{os.path.join(directory, 'missing.sock')}")
+        self.assertEqual(result, {'predicted_class': 0})
+        self.local.assert_called_once()
+
+    def test_dropped_connection_falls_back_to_local_inference(self):
+        server = self.serve('drop')
+        self.assertEqual(self.predict(server.address), {'predicted_class': 0})
+        self.local.assert_called_once()
+        self.assertEqual(len(server.requests), 1)
+
+    def test_slow_server_times_out_without_falling_back(self):
+        server = self.serve('hang')
+        with self.assertRaises(InferenceTimeout):
+            self.predict(server.address)
+        self.local.assert_not_called()
+        self.assertEqual(len(server.requests), 1)
+
+
+class StartupTests(SimpleTestCase):
+    def test_startup_work_is_opt_in(self):
+        config = apps.get_app_config('classification')
+        with mock.patch('classification.ml_utils.metrics.registry.start_export') as start_export, \
+                mock.patch.object(model_manager, 'start_warm_up') as start_warm_up:
+            with self.settings(METRICS_DIR=None, MODEL_WARMUP_ON_STARTUP=False):
+                config.ready()
+            start_export.assert_not_called()
+            start_warm_up.assert_not_called()
+
+            with self.settings(METRICS_DIR='/tmp/metrics', MODEL_WARMUP_ON_STARTUP=True):
+                config.ready()
+            start_export.assert_called_once()
+            start_warm_up.assert_called_once_with(settings.MODEL_WARMUP_MODELS)
@@ -0,0 +1,136 @@
+import hashlib
+import io
+import time
+from django.conf import settings
+from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers, StopUpload
+from PIL import Image, ImageFile
+from .ml_utils.preprocessing import PreprocessedImage, draft_for_target, fast_decode_enabled
+
+# Give up on incremental decoding if no image header was recognised in this many bytes
+HEADER_PROBE_BYTES = 1 << 20
+
+
+class StreamedImageUpload(InMemoryUploadedFile):
+    """An upload decoded and preprocessed while the request body was read
+
+    ``sha256`` names the file in MEDIA_ROOT/uploads before it is written and
+    ``preprocessed`` is handed to the models instead of decoding the bytes again.
+    """
+
+    def __init__(self, file, field_name, name, content_type, size, charset,
+                 content_type_extra=None, sha256=None, preprocessed=None):
+        super().__init__(file, field_name, name, content_type, size, charset, content_type_extra)
+        self.sha256 = sha256
+        self.preprocessed = preprocessed
+
+
+class StreamingImageUploadHandler(FileUploadHandler):
+    """Decode image uploads chunk by chunk as the multipart body arrives
+
+    Each chunk is hashed and fed to a PIL ``ImageFile.Parser``, so decoding
+    overlaps the upload and oversized files are refused as soon as the byte
+    count or the dimensions in the image header exceed the limits. With
+    PREPROCESSING_FAST_DECODE on, a JPEG is only parsed up to its header and
+    decoded at a reduced DCT scale once complete, which costs less than
+    decoding it at full resolution while it streams in. A refused
+    upload stops the parser without buffering the rest of the body; the reason
+    is left on ``request.upload_error`` for the view to report.
+
+    Must be installed before anything reads request.POST or request.FILES.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.max_bytes = getattr(settings, 'PREDICTION_MAX_UPLOAD_BYTES', 20 * 1024 * 1024)
+        self.max_pixels = getattr(settings, 'PREDICTION_MAX_IMAGE_PIXELS', 50_000_000)
+        self.fast = fast_decode_enabled()
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = io.BytesIO()
+        self.digest = hashlib.sha256()
+        self.parser = ImageFile.Parser()
+        self.incremental = True
+        self.decode_seconds = 0.0
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.max_bytes:
+            self._reject(413, f'Image is larger than {self.max_bytes / (1024 * 1024):g} MB')
+
+        self.file.write(raw_data)
+        self.digest.update(raw_data)
+
+        if self.incremental:
+            start = time.perf_counter()
+            try:
+                self.parser.feed(raw_data)
+            except Image.DecompressionBombError:
+                self._reject(400, 'Image has too many pixels')
+            except (OSError, SyntaxError, ValueError):
+                # Corrupt for the incremental decoder; retried from the full bytes in file_complete
+                self.incremental = False
+            else:
+                self.decode_seconds += time.perf_counter() - start
+                if self.parser.image is not None:
+                    width, height = self.parser.image.size
+                    if width * height > self.max_pixels:
+                        self._reject(400, f'Image has more than {self.max_pixels} pixels')
+                    if self.fast and self.parser.image.format == 'JPEG':
+                        # draft() has to be set before decoding starts; decoded from the buffer in file_complete
+                        self.incremental = False
+                elif self.file.tell() > HEADER_PROBE_BYTES:
+                    self.incremental = False
+        return None
+
+    def file_complete(self, file_size):
+        start = time.perf_counter()
+        image, error = self._decoded_image()
+        if image is None:
+            self.request.upload_error = error
+            return None
+        self.decode_seconds += time.perf_counter() - start
+
+        preprocessed = PreprocessedImage.from_image(image, fast=self.fast)
+        preprocessed.timings['decode'] = self.decode_seconds
+        self.file.seek(0)
+        return StreamedImageUpload(
+            file=self.file,
+            field_name=self.field_name,
+            name=self.file_name,
+            content_type=self.content_type,
+            size=file_size,
+            charset=self.charset,
+            content_type_extra=self.content_type_extra,
+            sha256=self.digest.hexdigest(),
+            preprocessed=preprocessed
+        )
+
+    def _decoded_image(self):
+        """Return (image, None), or (None, (status, message)) when the upload cannot be used"""
+        if self.incremental:
+            try:
+                return self.parser.close(), None
+            except (OSError, SyntaxError, ValueError):
+                pass
+
+        # Formats the parser cannot decode incrementally are read from the buffered bytes
+        try:
+            image = Image.open(io.BytesIO(self.file.getvalue()))
+            width, height = image.size
+            if width * height > self.max_pixels:
+                return None, (400, f'Image has more than {self.max_pixels} pixels')
+            if self.fast:
+                draft_for_target(image)
+            image.load()
+            return image, None
+        except Image.DecompressionBombError:
+            return None, (400, 'Image has too many pixels')
+        except (OSError, SyntaxError, ValueError):
+            return None, (400, 'Uploaded file is not a valid image')
+
+    def _reject(self, status, message):
+        self.request.upload_error = (status, message)
+        # Consume the rest of the body without buffering it, so the client still gets the response
+        raise StopUpload(connection_reset=False)
@@ -1,11 +1,29 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
 app_name = 'classification'
 
+# Under an ASGI server the async views keep slow uploads and inference off the request threads
+if getattr(settings, 'ASYNC_VIEWS', False):
+    predict_view = views.AsyncPredictView
+    get_models_view = views.AsyncGetModelsView
+    history_view = views.AsyncHistoryApiView
+else:
+    predict_view = views.PredictView
+    get_models_view = views.GetModelsView
+    history_view = views.HistoryApiView
+
 urlpatterns = [
     path('', views.HomeView.as_view(), name='home'),
-    path('predict/', views.PredictView.as_view(), name='predict'),
-    path('models/', views.GetModelsView.as_view(), name='get_models'),
-    path('refresh-history/', views.RefreshHistoryView.as_view(), name='refresh_history'),
+    path('predict/', predict_view.as_view(), name='predict'),
+    path('predict-batch/', views.BatchPredictView.as_view(), name='predict_batch'),
+    path('jobs/', views.PredictJobView.as_view(), name='predict_job'),
+    path('jobs/<uuid:job_id>/', views.JobStatusView.as_view(), name='job_status'),
+    path('models/', get_models_view.as_view(), name='get_models'),
+    path('ready/', views.ReadinessView.as_view(), name='ready'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
+    path('history/', history_view.as_view(), name='history'),
+    path('save-history/', views.SaveHistoryView.as_view(), name='save_history'),
+    path('analytics/', views.AnalyticsView.as_view(), name='analytics'),
 ]
\ No newline at end of file
@@ -1,14 +1,34 @@
 import threading
+import hmac
 import os
 import json
-from django.shortcuts import render
+import time
+import uuid
+from asgiref.sync import sync_to_async
+from django.shortcuts import get_object_or_404, render
 from django.views import View
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.conf import settings
-from django.utils import timezone
-from .models import ClassificationHistory
-from .ml_utils.model_loader import model_manager
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.views.decorators.http import condition
+from .analytics import history_statistics
+from .history import HISTORY_ORDERING, ahistory_etag, ahistory_page, encode_cursor, history_etag, history_page
+from .history_writer import PredictionOwnerMismatch, get_history_writer
+from .models import ClassificationHistory, PredictionJob, normalize_confidence
+from .jobs import JobQueueFull, fail_if_stale, submit_prediction_job
+from .ml_utils.inference_rpc import InferenceTimeout
+from .ml_utils.metrics import PREDICTION_REQUEST_SECONDS, PREDICTION_STAGE_SECONDS, registry
+from .ml_utils.model_loader import ENSEMBLE_STRATEGIES, model_manager
+from .prediction import (
+    ENSEMBLE_MODEL_ID, arun_prediction, format_probabilities, get_model_display_name,
+    get_prediction_details, history_fields, is_valid_model_choice, run_prediction, save_uploaded_image
+)
+from .uploads import StreamingImageUploadHandler
 
 
 class HomeView(LoginRequiredMixin, View):
@@ -17,216 +37,462 @@ class HomeView(LoginRequiredMixin, View):
         available_models = model_manager.get_available_models()
         
         # Get user's recent history for sidebar
-        user_history = ClassificationHistory.objects.filter(
+        user_history = list(ClassificationHistory.objects.filter(
             user=request.user
-        ).order_by('-timestamp')[:10]
+        ).order_by(*HISTORY_ORDERING)[:10])
         
         return render(request, 'classification/dashboard.html', {
             'available_models': available_models,
-            'history': user_history
+            'history': user_history,
+            # The sidebar asks the history API for rows newer than this
+            'history_cursor': encode_cursor(user_history[0]) if user_history else ''
         })
 
-class PredictView(LoginRequiredMixin, View):
+class StreamingUploadMixin:
+    """Decode the upload while the request body streams in (see uploads.py)
+
+    Upload handlers can only be replaced before the body is parsed, and
+    CsrfViewMiddleware parses it to find the token, so the CSRF check runs
+    here instead, after the handler is installed. Comes before
+    LoginRequiredMixin, so it checks the login itself: anonymous requests are
+    refused before anything reads, let alone decodes, the body.
+    """
+    @method_decorator(csrf_exempt)
+    def dispatch(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+        request.upload_handlers = [StreamingImageUploadHandler(request)]
+        return csrf_protect(super().dispatch)(request, *args, **kwargs)
+
+
+def parse_prediction_request(request):
+    """Validate a prediction form, returning (options, None) or (None, error response)"""
+    # Parsing the body sets request.upload_error when StreamingImageUploadHandler refused the upload
+    files = request.FILES
+    upload_error = getattr(request, 'upload_error', None)
+    if upload_error is not None:
+        status, message = upload_error
+        return None, JsonResponse({'error': message}, status=status)
+    
+    if 'image' not in files:
+        return None, JsonResponse({'error': 'No image uploaded'}, status=400)
+    
+    # Get selected model from form
+    model_choice = request.POST.get('model_choice', 'cnn_model')
+    
+    # Validate model choice
+    if not is_valid_model_choice(model_choice):
+        return None, JsonResponse({'error': 'Invalid model selected'}, status=400)
+    
+    # Ensemble mode runs a subset of models (all by default) and combines their votes
+    ensemble_models = request.POST.getlist('ensemble_models')
+    if any(model_id == ENSEMBLE_MODEL_ID or not is_valid_model_choice(model_id)
+           for model_id in ensemble_models):
+        return None, JsonResponse({'error': 'Invalid ensemble model selected'}, status=400)
+    
+    ensemble_strategy = request.POST.get('ensemble_strategy', 'soft')
+    if ensemble_strategy not in ENSEMBLE_STRATEGIES:
+        return None, JsonResponse({'error': 'Invalid ensemble strategy'}, status=400)
+    
+    return {
+        'model_choice': model_choice,
+        'ensemble_models': ensemble_models,
+        'ensemble_strategy': ensemble_strategy
+    }, None
+
+
+def record_prediction_request(request, response, start):
+    """Observe one predict/ request, timed from when the view received the parsed upload"""
+    model_choice = request.POST.get('model_choice', 'cnn_model')
+    PREDICTION_REQUEST_SECONDS.observe(
+        time.perf_counter() - start,
+        # Only known ids become label values, or any client could add series without bound
+        model=model_choice if is_valid_model_choice(model_choice) else 'invalid',
+        status=response.status_code
+    )
+
+
+class PredictView(StreamingUploadMixin, LoginRequiredMixin, View):
     def post(self, request):
-        if 'image' not in request.FILES:
-            return JsonResponse({'error': 'No image uploaded'}, status=400)
-        
-        # Get selected model from form
-        model_choice = request.POST.get('model_choice', 'cnn_model')
-        
-        # Validate model choice
-        available_models = [model['id'] for model in model_manager.get_available_models()]
-        if model_choice not in available_models:
-            return JsonResponse({'error': 'Invalid model selected'}, status=400)
+        start = time.perf_counter()
+        response = self._predict(request)
+        record_prediction_request(request, response, start)
+        return response
+
+    def _predict(self, request):
+        options, error_response = parse_prediction_request(request)
+        if error_response is not None:
+            return error_response
         
         # Process prediction immediately (for demo) or use threading for large files
         try:
-            return self._process_prediction_immediate(request.FILES['image'], request.user, model_choice)
+            return self._process_prediction_immediate(request.FILES['image'], request.user, **options)
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
 
-    def _process_prediction_immediate(self, image_file, user, model_choice):
+    def _process_prediction_immediate(self, image_file, user, model_choice,
+                                      ensemble_models=None, ensemble_strategy='soft'):
         """Process prediction immediately and return results"""
         try:
-            # Create upload directory if it doesn't exist
-            upload_dir = os.path.join(settings.MEDIA_ROOT, 'uploads')
-            os.makedirs(upload_dir, exist_ok=True)
-            
-            # Generate unique filename
-            timestamp = timezone.now().strftime("%Y%m%d_%H%M%S")
-            file_extension = os.path.splitext(image_file.name)[1]
-            unique_filename = f"{timestamp}_{user.id}{file_extension}"
-            image_path = os.path.join(upload_dir, unique_filename)
-            
-            # Save uploaded image
-            with open(image_path, 'wb+') as destination:
-                for chunk in image_file.chunks():
-                    destination.write(chunk)
+            # Streamed uploads are written in the background; the models use the copy decoded in memory
+            with PREDICTION_STAGE_SECONDS.time(stage='upload_save', model=model_choice):
+                unique_filename = save_uploaded_image(image_file)
             
-            # Make prediction with lazy loading
-            predicted_class, confidence = model_manager.predict_with_model(
-                model_choice, 
-                image_path
+            result_data = run_prediction(
+                user, model_choice, unique_filename, image_file.name, image_file.size, image=image_file,
+                ensemble_models=ensemble_models, ensemble_strategy=ensemble_strategy
             )
+            return JsonResponse(result_data)
             
-            # SIMPLIFIED: Only two classes now
-            class_details = {
-                0: {
-                    'name': 'Normal (no stone)',
-                    'description': 'No kidney stones detected. The kidney appears healthy and normal.',
-                    'risk_level': 'Low',
-                    'recommendation': 'Maintain regular checkups and healthy hydration. Continue with routine kidney health monitoring.'
-                },
-                1: {
-                    'name': 'Stone',
-                    'description': 'Kidney stone detected. Further medical evaluation recommended.',
-                    'risk_level': 'Medium-High',
-                    'recommendation': 'Consult with a urologist for proper diagnosis and treatment plan. Increase fluid intake and follow medical advice.'
-                }
-            }
+        except InferenceTimeout as e:
+            print(f"✗ Prediction timed out: {str(e)}")
+            return JsonResponse({'error': 'Prediction is taking too long, please try again'}, status=504)
+        except Exception as e:
+            print(f"✗ Prediction error: {str(e)}")
+            return JsonResponse({'error': f'Prediction failed: {str(e)}'}, status=500)
+
+
+class BatchPredictView(LoginRequiredMixin, View):
+    """API endpoint to classify many images with one model in a single request"""
+    def post(self, request):
+        image_files = request.FILES.getlist('images')
+        if not image_files:
+            return JsonResponse({'error': 'No images uploaded'}, status=400)
+        
+        max_files = getattr(settings, 'PREDICTION_MAX_BATCH_FILES', 200)
+        if len(image_files) > max_files:
+            return JsonResponse({'error': f'At most {max_files} images can be uploaded at once'}, status=400)
+        
+        model_choice = request.POST.get('model_choice', 'cnn_model')
+        available_models = model_manager.get_available_models()
+        if model_choice not in [model['id'] for model in available_models]:
+            return JsonResponse({'error': 'Invalid model selected'}, status=400)
+        
+        model_display_name = get_model_display_name(model_choice)
+        
+        try:
+            filenames = [save_uploaded_image(image_file) for image_file in image_files]
+            predictions = model_manager.predict_batch(model_choice, image_files)
             
-            prediction_details = class_details.get(predicted_class, {
-                'name': f'Class {predicted_class}',
-                'description': 'Kidney analysis completed.',
-                'risk_level': 'Unknown',
-                'recommendation': 'Consult healthcare professional for proper diagnosis.'
-            })
+            # One bulk insert for the whole batch rather than a transaction per image
+            history_entries = [
+                ClassificationHistory(**history_fields(request.user, model_choice, filename, prediction))
+                for filename, prediction in zip(filenames, predictions)
+            ]
+            history_ids = get_history_writer().save_many(history_entries)
             
-            # Get model display name
-            model_display_name = next(
-                (model['name'] for model in model_manager.get_available_models() 
-                 if model['id'] == model_choice),
-                model_choice
-            )
+            results = []
+            for image_file, filename, prediction, history_entry, history_id in zip(
+                    image_files, filenames, predictions, history_entries, history_ids):
+                predicted_class, confidence = prediction['predicted_class'], prediction['confidence']
+                prediction_details = get_prediction_details(predicted_class)
+                results.append({
+                    'prediction': {
+                        'class_name': prediction_details['name'],
+                        'confidence': round(confidence * 100, 2),
+                        'probabilities': format_probabilities(prediction['probabilities']),
+                        'risk_level': prediction_details['risk_level'],
+                    },
+                    'image': {
+                        'url': f'/media/uploads/{filename}',
+                        'name': image_file.name,
+                        'size': image_file.size
+                    },
+                    'history_id': history_id,
+                    'prediction_id': str(history_entry.prediction_id)
+                })
             
-            # Save to history
-            history_entry = ClassificationHistory.objects.create(
-                user=user,
-                uploaded_image=f'uploads/{unique_filename}',
-                predicted_class=prediction_details['name'],
-                model_used=model_display_name,
-                prediction_confidence=confidence
-            )
+            print(f"✓ Batch prediction completed: {len(results)} images with {model_choice}")
             
-            # Prepare response data
-            result_data = {
+            return JsonResponse({
                 'status': 'success',
-                'prediction': {
-                    'class_name': prediction_details['name'],
-                    'confidence': round(confidence * 100, 2),
-                    'description': prediction_details['description'],
-                    'risk_level': prediction_details['risk_level'],
-                    'recommendation': prediction_details['recommendation'],
-                    'model_used': model_display_name,
-                    'timestamp': timezone.now().strftime("%Y-%m-%d %H:%M:%S")
-                },
-                'image': {
-                    'url': f'/media/uploads/{unique_filename}',
-                    'name': image_file.name,
-                    'size': image_file.size
-                },
-                # Add history entry ID for frontend tracking
-                'history_id': history_entry.id
-            }
-            
-            print(f"✓ Prediction completed: {prediction_details['name']} with {confidence:.2f} confidence")
-            
-            return JsonResponse(result_data)
+                'model_used': model_display_name,
+                'count': len(results),
+                'results': results
+            })
             
         except Exception as e:
-            print(f"✗ Prediction error: {str(e)}")
-            return JsonResponse({'error': f'Prediction failed: {str(e)}'}, status=500)
+            print(f"✗ Batch prediction error: {str(e)}")
+            return JsonResponse({'error': f'Batch prediction failed: {str(e)}'}, status=500)
+
+class PredictJobView(StreamingUploadMixin, LoginRequiredMixin, View):
+    """API endpoint to queue a prediction and return its job id straight away
+    
+    Uploads go through the same streaming handler and limits as predict/, and
+    the job predicts from the image decoded while the body arrived.
+    """
+    def post(self, request):
+        start = time.perf_counter()
+        response = self._queue(request)
+        record_prediction_request(request, response, start)
+        return response
+    
+    def _queue(self, request):
+        options, error_response = parse_prediction_request(request)
+        if error_response is not None:
+            return error_response
+        
+        image_file = request.FILES['image']
+        try:
+            with PREDICTION_STAGE_SECONDS.time(stage='upload_save', model=options['model_choice']):
+                unique_filename = save_uploaded_image(image_file)
+            job = PredictionJob.objects.create(
+                user=request.user,
+                **options,
+                uploaded_image=f'uploads/{unique_filename}',
+                original_name=image_file.name,
+                image_size=image_file.size
+            )
+            submit_prediction_job(job, image=image_file)
+        except JobQueueFull as e:
+            PredictionJob.objects.filter(pk=job.pk).update(
+                status=PredictionJob.STATUS_FAILED, error=str(e)
+            )
+            return JsonResponse({'error': str(e)}, status=503)
+        except Exception as e:
+            print(f"✗ Could not queue prediction: {str(e)}")
+            return JsonResponse({'error': f'Could not queue prediction: {str(e)}'}, status=500)
+        
+        return JsonResponse({
+            'job_id': str(job.id),
+            'status': job.status,
+            'status_url': reverse('classification:job_status', args=[job.id])
+        }, status=202)
+
+
+class JobStatusView(LoginRequiredMixin, View):
+    """API endpoint to poll the progress and result of a prediction job"""
+    def get(self, request, job_id):
+        job = fail_if_stale(get_object_or_404(PredictionJob, pk=job_id, user=request.user))
+        return JsonResponse({
+            'job_id': str(job.id),
+            'status': job.status,
+            'progress': job.progress,
+            'result': job.result,
+            'error': job.error
+        })
 
 # REMOVED: HistoryView class (no longer needed)
 
+class ReadinessView(View):
+    """Health check for the load balancer: 200 only once every warm-up model is ready"""
+    def get(self, request):
+        readiness = model_manager.get_readiness(getattr(settings, 'MODEL_WARMUP_MODELS', []))
+        return JsonResponse(readiness, status=200 if readiness['ready'] else 503)
+
+class MetricsView(View):
+    """Prometheus text metrics for scrapers holding METRICS_TOKEN, or on METRICS_ALLOWED_IPS without one
+    
+    Every worker's series, labelled worker="<pid>", when METRICS_DIR is set;
+    otherwise only those of the worker that took the scrape.
+    """
+    def get(self, request):
+        if not self._allowed(request):
+            return HttpResponse(status=403)
+        metrics_dir = getattr(settings, 'METRICS_DIR', None)
+        body = registry.render_all(metrics_dir) if metrics_dir and os.path.isdir(metrics_dir) else registry.render()
+        return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+    
+    def _allowed(self, request):
+        token = getattr(settings, 'METRICS_TOKEN', None)
+        if token:
+            return hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+        # Behind a reverse proxy on the same host every request comes from 127.0.0.1
+        if 'X-Forwarded-For' in request.headers:
+            return False
+        return request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1', '::1'])
+
 class GetModelsView(LoginRequiredMixin, View):
     """API endpoint to get available models"""
     def get(self, request):
         available_models = model_manager.get_available_models()
-        return JsonResponse({'models': available_models})
+        return JsonResponse({
+            'models': available_models,
+            'cache': model_manager.get_cache_info(),
+            'prediction_cache': model_manager.get_prediction_cache_stats()
+        })
+
+def history_request_etag(request):
+    # Parameters are part of the tag: ?since=<cursor> and the first page change at different times
+    return history_etag(request.user, request.GET.urlencode())
+
+
+def history_page_options(request):
+    """history_page keyword arguments from the query string; raises ValueError for bad ones"""
+    try:
+        limit = min(int(request.GET.get('limit', 10)), getattr(settings, 'HISTORY_PAGE_MAX_SIZE', 100))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    return {'before': request.GET.get('before'), 'since': request.GET.get('since'), 'limit': limit}
+
 
-from django.utils.timesince import timesince  # Add this import at the top
+@condition(etag_func=history_request_etag)
+def history_response(request):
+    """JSON page of the user's history; see history.history_page for the parameters"""
+    try:
+        # An invalid cursor raises InvalidCursor, a ValueError
+        page = history_page(request.user, **history_page_options(request))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(page)
 
-class RefreshHistoryView(LoginRequiredMixin, View):
-    """API endpoint to refresh history data for sidebar"""
+
+class HistoryApiView(LoginRequiredMixin, View):
+    """API endpoint for the history sidebar: cursor pages, ?since= deltas and ETag/304"""
     def get(self, request):
-        user_history = ClassificationHistory.objects.filter(
-            user=request.user
-        ).order_by('-timestamp')[:10]
+        return history_response(request)
+
+
+class AnalyticsView(LoginRequiredMixin, View):
+    """API endpoint for dashboard statistics, read from the daily rollups rather than the history
+    
+    ?days= sets the window (default 30); staff can ask for ?scope=all, the totals across all users.
+    """
+    def get(self, request):
+        max_days = getattr(settings, 'ANALYTICS_MAX_DAYS', 365)
+        try:
+            days = int(request.GET.get('days', 30))
+        except ValueError:
+            return JsonResponse({'error': 'days must be an integer'}, status=400)
+        if not 1 <= days <= max_days:
+            return JsonResponse({'error': f'days must be between 1 and {max_days}'}, status=400)
         
-        # Return HTML snippet for history items in sidebar
-        history_html = ""
-        for item in user_history:
-            # Use the timesince function properly
-            time_ago = timesince(item.timestamp)
-            
-            history_html += f"""
-            <div class="history-item" data-history-id="{item.id}">
-                <div class="history-main">
-                    <div class="history-class">{item.predicted_class}</div>
-                    <div class="history-meta">
-                        <span class="history-model">{item.model_used}</span>
-                        <span class="history-confidence">{item.prediction_confidence:.1f}%</span>
-                    </div>
-                </div>
-                <div class="history-time">{time_ago} ago</div>
-            </div>
-            """
+        scope = request.GET.get('scope', 'user')
+        if scope == 'user':
+            statistics = history_statistics(request.user, days)
+        elif scope == 'all':
+            if not request.user.is_staff:
+                return JsonResponse({'error': 'Only staff can see statistics across all users'}, status=403)
+            statistics = history_statistics(days=days)
+        else:
+            return JsonResponse({'error': "scope must be 'user' or 'all'"}, status=400)
         
-        return JsonResponse({'history_html': history_html})
-    
+        return JsonResponse({'scope': scope, **statistics})
 
 
 class SaveHistoryView(LoginRequiredMixin, View):
-    """API endpoint to save current analysis to history"""
+    """API endpoint to save current analysis to history
+    
+    Predictions are recorded when they run, so an analysis that carries its
+    prediction_id resolves to that row instead of being stored twice. Only the
+    user the prediction was recorded for can resolve to it.
+    """
     def post(self, request):
         try:
             data = json.loads(request.body)
+            try:
+                prediction_id = uuid.UUID(data['prediction_id']) if data.get('prediction_id') else None
+            except (TypeError, ValueError):
+                return JsonResponse({'status': 'error', 'message': 'Invalid prediction_id'}, status=400)
             
             # Create new history entry
-            history_entry = ClassificationHistory.objects.create(
+            history_entry = ClassificationHistory(
+                prediction_id=prediction_id,
                 user=request.user,
                 uploaded_image=data.get('image_url', ''),
                 predicted_class=data.get('predicted_class', 'Unknown'),
                 model_used=data.get('model_used', 'Unknown Model'),
-                prediction_confidence=data.get('confidence', 0)
+                prediction_confidence=normalize_confidence(float(data.get('confidence', 0)))
             )
+            history_id = get_history_writer().save(history_entry)
             
             return JsonResponse({
                 'status': 'success',
                 'message': 'Analysis saved to history',
-                'history_id': history_entry.id
+                'history_id': history_id,
+                'prediction_id': str(history_entry.prediction_id)
             })
             
+        except PredictionOwnerMismatch as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=403)
         except Exception as e:
             return JsonResponse({
                 'status': 'error',
                 'message': str(e)
             }, status=500)
 
-class RefreshHistoryView(LoginRequiredMixin, View):
-    """API endpoint to refresh history data for sidebar"""
-    def get(self, request):
-        user_history = ClassificationHistory.objects.filter(
-            user=request.user
-        ).order_by('-timestamp')[:10]
+# Async variants for ASGI servers, routed instead of the views above when ASYNC_VIEWS is on
+
+class AsyncLoginRequiredMixin(LoginRequiredMixin):
+    """LoginRequiredMixin for async views: the user is loaded with request.auser()"""
+    async def dispatch(self, request, *args, **kwargs):
+        # Replaces the lazy request.user, which would query the session synchronously
+        request.user = await request.auser()
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+        return await super(LoginRequiredMixin, self).dispatch(request, *args, **kwargs)
+
+
+class AsyncStreamingUploadMixin:
+    """StreamingUploadMixin for async views: the body is parsed on a worker thread"""
+    @method_decorator(csrf_exempt)
+    async def dispatch(self, request, *args, **kwargs):
+        request.user = await request.auser()
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+        request.upload_handlers = [StreamingImageUploadHandler(request)]
+        # Multipart parsing decodes the image, so it runs off the event loop before the CSRF check reads the form
+        await sync_to_async(lambda: request.FILES, thread_sensitive=False)()
+        return await csrf_protect(super().dispatch)(request, *args, **kwargs)
+
+
+class AsyncPredictView(AsyncStreamingUploadMixin, AsyncLoginRequiredMixin, View):
+    async def post(self, request):
+        start = time.perf_counter()
+        response = await self._predict(request)
+        record_prediction_request(request, response, start)
+        return response
+
+    async def _predict(self, request):
+        options, error_response = parse_prediction_request(request)
+        if error_response is not None:
+            return error_response
         
-        # Return HTML snippet for history items in sidebar
-        history_html = ""
-        for item in user_history:
-            time_ago = timezone.timesince(item.timestamp)
+        image_file = request.FILES['image']
+        try:
+            with PREDICTION_STAGE_SECONDS.time(stage='upload_save', model=options['model_choice']):
+                unique_filename = await sync_to_async(save_uploaded_image, thread_sensitive=False)(image_file)
+            result_data = await arun_prediction(
+                request.user, options['model_choice'], unique_filename, image_file.name, image_file.size,
+                image=image_file,
+                ensemble_models=options['ensemble_models'],
+                ensemble_strategy=options['ensemble_strategy']
+            )
+            return JsonResponse(result_data)
             
-            history_html += f"""
-            <div class="history-item" data-history-id="{item.id}">
-                <div class="history-main">
-                    <div class="history-class">{item.predicted_class}</div>
-                    <div class="history-meta">
-                        <span class="history-model">{item.model_used}</span>
-                        <span class="history-confidence">{item.prediction_confidence:.1f}%</span>
-                    </div>
-                </div>
-                <div class="history-time">{time_ago} ago</div>
-            </div>
-            """
-        
-        return JsonResponse({'history_html': history_html})
\ No newline at end of file
+        except InferenceTimeout as e:
+            print(f"✗ Prediction timed out: {str(e)}")
+            return JsonResponse({'error': 'Prediction is taking too long, please try again'}, status=504)
+        except Exception as e:
+            print(f"✗ Prediction error: {str(e)}")
+            return JsonResponse({'error': f'Prediction failed: {str(e)}'}, status=500)
+
+
+class AsyncGetModelsView(AsyncLoginRequiredMixin, View):
+    """Async API endpoint to get available models"""
+    async def get(self, request):
+        return JsonResponse({
+            'models': model_manager.get_available_models(),
+            'cache': model_manager.get_cache_info(),
+            'prediction_cache': model_manager.get_prediction_cache_stats()
+        })
+
+
+class AsyncHistoryApiView(AsyncLoginRequiredMixin, View):
+    """Async API endpoint for the history sidebar, read with the async ORM
+    
+    The ETag/304 handling of history_response, done here because condition()
+    calls its etag_func synchronously.
+    """
+    async def get(self, request):
+        etag = quote_etag(await ahistory_etag(request.user, request.GET.urlencode()))
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            try:
+                response = JsonResponse(await ahistory_page(request.user, **history_page_options(request)))
+            except ValueError as e:
+                response = JsonResponse({'error': str(e)}, status=400)
+        response.headers.setdefault('ETag', etag)
+        return response
@@ -0,0 +1,54 @@
+"""
+Gunicorn configuration for KindeyStoneClassification.
+
+Run with ``gunicorn -c gunicorn.conf.py``. Each worker warms up the models in
+``MODEL_WARMUP_MODELS`` after it has loaded the Django application; point the
+load balancer's health check at ``/classification/ready/`` so a worker only
+receives traffic once every model is warm.
+
+Each worker keeps its own metrics. Set ``METRICS_DIR`` in the environment to a
+directory the workers share and each exports them there, so a scrape of
+``/classification/metrics/`` through the shared port returns every worker's
+series (labelled ``worker="<pid>"``) whichever worker answers it. Behind a
+reverse proxy, set ``METRICS_TOKEN`` too: the proxy's address would otherwise
+pass ``METRICS_ALLOWED_IPS``.
+
+With ``GUNICORN_PRELOAD=1`` the master loads the application and the
+scikit-learn/XGBoost models in ``MODEL_PRELOAD_BEFORE_FORK`` before forking, so
+workers share those pages copy-on-write. The CNN is loaded per worker, so keep
+it out of ``MODEL_PRELOAD_BEFORE_FORK``: TensorFlow's threads do not survive a
+fork. TensorFlow is only imported when the CNN first loads, so with the default
+list the master never initialises it.
+"""
+import gc
+import os
+
+wsgi_app = 'KindeyStoneClassification.wsgi:application'
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 3))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+preload_app = os.environ.get('GUNICORN_PRELOAD') == '1'
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+
+    from django.conf import settings
+    from classification.ml_utils.model_loader import model_manager
+
+    model_manager.preload(getattr(settings, 'MODEL_PRELOAD_BEFORE_FORK', []))
+    # Move everything loaded so far out of the collector's reach, so GC passes in the
+    # workers do not write to (and so copy) the shared model pages
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    from django.conf import settings
+    from classification.ml_utils.metrics import registry
+    from classification.ml_utils.model_loader import model_manager
+
+    # With preload_app the export thread started in the master did not survive the fork
+    if getattr(settings, 'METRICS_DIR', None):
+        registry.start_export(settings.METRICS_DIR, getattr(settings, 'METRICS_EXPORT_INTERVAL_SECONDS', 5))
+    model_manager.start_warm_up(getattr(settings, 'MODEL_WARMUP_MODELS', []))
@@ -25,7 +25,6 @@ document.addEventListener('DOMContentLoaded', function() {
     const modelDropdown = document.getElementById('modelDropdown');
     const currentModel = document.getElementById('currentModel');
     const historyItemsContainer = document.getElementById('historyItems');
-    const historyItems = document.querySelectorAll('.history-item');
     
     // Model selection
     const modelOptions = document.querySelectorAll('.model-option');
@@ -33,6 +32,11 @@ document.addEventListener('DOMContentLoaded', function() {
     let isSidebarCollapsed = false;
     let currentPredictionData = null; // Store current prediction data
 
+    // History sidebar: only entries newer than latestHistoryCursor are fetched
+    const HISTORY_SIDEBAR_SIZE = 10;
+    let latestHistoryCursor = historyItemsContainer ? historyItemsContainer.dataset.latestCursor : '';
+    let historyEtag = null;
+
     // Initialize the application
     initializeApp();
 
@@ -88,18 +92,22 @@ document.addEventListener('DOMContentLoaded', function() {
             });
         });
 
-        // History item click handlers - FIXED: Load data directly without loading message
-        historyItems.forEach(item => {
-            item.addEventListener('click', function() {
-                const historyId = this.dataset.historyId;
-                const predictedClass = this.querySelector('.history-class').textContent;
-                const modelUsed = this.querySelector('.history-model').textContent;
-                const confidence = this.querySelector('.history-confidence').textContent;
-                const timestamp = this.querySelector('.history-time').textContent;
+        // History item clicks, delegated so items added later need no listeners of their own
+        if (historyItemsContainer) {
+            historyItemsContainer.addEventListener('click', function(e) {
+                const item = e.target.closest('.history-item');
+                if (!item) {
+                    return;
+                }
+                const historyId = item.dataset.historyId;
+                const predictedClass = item.querySelector('.history-class').textContent;
+                const modelUsed = item.querySelector('.history-model').textContent;
+                const confidence = item.querySelector('.history-confidence').textContent;
+                const timestamp = item.querySelector('.history-time').textContent;
                 
                 loadHistoryResult(historyId, predictedClass, modelUsed, confidence, timestamp);
             });
-        });
+        }
 
         // File input handler
         fileInput.addEventListener('change', function(e) {
@@ -253,7 +261,8 @@ document.addEventListener('DOMContentLoaded', function() {
         const controller = new AbortController();
         currentAnalysisRequest = controller;
 
-        fetch(uploadForm.action, {
+        // Queue the prediction as a background job, then poll until it finishes
+        fetch(uploadForm.dataset.jobUrl, {
             method: 'POST',
             body: formData,
             signal: controller.signal,
@@ -262,6 +271,12 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         })
         .then(response => response.json())
+        .then(job => {
+            if (job.error) {
+                return job;
+            }
+            return pollPredictionJob(job.status_url, controller.signal);
+        })
         .then(data => {
             if (data.error) {
                 alert('Error: ' + data.error);
@@ -269,6 +284,7 @@ document.addEventListener('DOMContentLoaded', function() {
             } else {
                 // Store the prediction data for potential saving later
                 currentPredictionData = {
+                    predictionId: data.prediction_id,
                     predictedClass: data.prediction.class_name,
                     confidence: data.prediction.confidence,
                     modelUsed: data.prediction.model_used,
@@ -294,6 +310,38 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    // Give up on a job that has not finished after this long
+    const JOB_POLL_TIMEOUT_MS = 2 * 60 * 1000;
+
+    // Poll a prediction job until it completes, fails or times out
+    function pollPredictionJob(statusUrl, signal) {
+        const deadline = Date.now() + JOB_POLL_TIMEOUT_MS;
+        return new Promise((resolve, reject) => {
+            function poll() {
+                fetch(statusUrl, {
+                    signal: signal,
+                    headers: {
+                        'X-Requested-With': 'XMLHttpRequest'
+                    }
+                })
+                .then(response => response.json())
+                .then(job => {
+                    if (job.status === 'completed') {
+                        resolve(job.result);
+                    } else if (job.status === 'failed') {
+                        resolve({ error: job.error || 'Prediction failed' });
+                    } else if (Date.now() > deadline) {
+                        resolve({ error: 'Prediction is taking too long, please try again' });
+                    } else {
+                        setTimeout(poll, 500);
+                    }
+                })
+                .catch(reject);
+            }
+            poll();
+        });
+    }
+
     // FIXED: Load history data directly without loading message
     function loadHistoryResult(historyId, predictedClass, modelUsed, confidence, timestamp) {
         // For demo purposes, we'll create sample data based on the history item
@@ -344,28 +392,39 @@ document.addEventListener('DOMContentLoaded', function() {
         return recommendations[condition] || 'Consult healthcare professional for proper diagnosis.';
     }
 
-    // NEW FUNCTION: Refresh recent activities section
+    // Fetch only the history entries added since the newest one shown
     function refreshRecentActivities() {
-        fetch('/classification/refresh-history/')
-            .then(response => response.json())
+        if (!historyItemsContainer) {
+            return;
+        }
+        const params = new URLSearchParams({limit: HISTORY_SIDEBAR_SIZE});
+        if (latestHistoryCursor) {
+            params.set('since', latestHistoryCursor);
+        }
+        const headers = {'X-Requested-With': 'XMLHttpRequest'};
+        if (historyEtag) {
+            headers['If-None-Match'] = historyEtag;
+        }
+
+        fetch(`${historyItemsContainer.dataset.historyUrl}?${params}`, {headers: headers})
+            .then(response => {
+                if (response.status === 304) {
+                    return null;
+                }
+                historyEtag = response.headers.get('ETag');
+                return response.json();
+            })
             .then(data => {
-                // Update the history items container with new HTML
-                if (historyItemsContainer && data.history_html) {
-                    historyItemsContainer.innerHTML = data.history_html;
-                    
-                    // Re-attach click event listeners to the new history items
-                    const newHistoryItems = document.querySelectorAll('.history-item');
-                    newHistoryItems.forEach(item => {
-                        item.addEventListener('click', function() {
-                            const historyId = this.dataset.historyId;
-                            const predictedClass = this.querySelector('.history-class').textContent;
-                            const modelUsed = this.querySelector('.history-model').textContent;
-                            const confidence = this.querySelector('.history-confidence').textContent;
-                            const timestamp = this.querySelector('.history-time').textContent;
-                            
-                            loadHistoryResult(historyId, predictedClass, modelUsed, confidence, timestamp);
-                        });
-                    });
+                refreshHistoryTimes();
+                if (!data || !data.items) {
+                    return;
+                }
+                prependHistoryItems(data.items);
+                if (data.latest_cursor) {
+                    latestHistoryCursor = data.latest_cursor;
+                }
+                if (data.has_more) {
+                    refreshRecentActivities();
                 }
             })
             .catch(error => {
@@ -373,6 +432,76 @@ document.addEventListener('DOMContentLoaded', function() {
             });
     }
 
+    // Items arrive newest first; the sidebar keeps the newest HISTORY_SIDEBAR_SIZE
+    function prependHistoryItems(items) {
+        if (!items.length) {
+            return;
+        }
+        const emptyState = historyItemsContainer.querySelector('.history-empty');
+        if (emptyState) {
+            emptyState.remove();
+        }
+
+        const fragment = document.createDocumentFragment();
+        items.forEach(item => fragment.appendChild(createHistoryItem(item)));
+        historyItemsContainer.prepend(fragment);
+
+        const shown = historyItemsContainer.querySelectorAll('.history-item');
+        for (let i = HISTORY_SIDEBAR_SIZE; i < shown.length; i++) {
+            shown[i].remove();
+        }
+    }
+
+    function createHistoryItem(item) {
+        const element = document.createElement('div');
+        element.className = 'history-item';
+        element.dataset.historyId = item.id;
+        element.dataset.timestamp = item.timestamp;
+        element.innerHTML = `
+            <div class="history-main">
+                <div class="history-class"></div>
+                <div class="history-meta">
+                    <span class="history-model"></span>
+                    <span class="history-confidence"></span>
+                </div>
+            </div>
+            <div class="history-time"></div>
+        `;
+        // Text content, so stored values are never parsed as HTML
+        element.querySelector('.history-class').textContent = item.predicted_class;
+        element.querySelector('.history-model').textContent = item.model_used;
+        element.querySelector('.history-confidence').textContent = `${item.confidence.toFixed(1)}%`;
+        element.querySelector('.history-time').textContent = `${timeSince(item.timestamp)} ago`;
+        return element;
+    }
+
+    // Keep the "... ago" labels current without asking the server again
+    function refreshHistoryTimes() {
+        historyItemsContainer.querySelectorAll('.history-item[data-timestamp]').forEach(item => {
+            item.querySelector('.history-time').textContent = `${timeSince(item.dataset.timestamp)} ago`;
+        });
+    }
+
+    // Largest whole unit, like Django's timesince filter
+    function timeSince(isoTimestamp) {
+        const seconds = Math.max(0, (Date.now() - new Date(isoTimestamp).getTime()) / 1000);
+        const units = [
+            ['year', 365 * 24 * 3600],
+            ['month', 30 * 24 * 3600],
+            ['week', 7 * 24 * 3600],
+            ['day', 24 * 3600],
+            ['hour', 3600],
+            ['minute', 60]
+        ];
+        for (const [name, size] of units) {
+            const count = Math.floor(seconds / size);
+            if (count >= 1) {
+                return `${count} ${name}${count === 1 ? '' : 's'}`;
+            }
+        }
+        return '0 minutes';
+    }
+
     // NEW FUNCTION: Add current analysis to recent history
     function addToRecentHistory(predictionData) {
         // Make an API call to save this analysis to the database
@@ -384,6 +513,8 @@ document.addEventListener('DOMContentLoaded', function() {
                 'X-Requested-With': 'XMLHttpRequest'
             },
             body: JSON.stringify({
+                // Already recorded when the prediction ran; the server resolves it to that row
+                prediction_id: predictionData.predictionId,
                 predicted_class: predictionData.predictedClass,
                 confidence: predictionData.confidence,
                 model_used: predictionData.modelUsed,
@@ -418,6 +549,36 @@ document.addEventListener('DOMContentLoaded', function() {
         return csrfToken ? csrfToken.value : '';
     }
 
+    // Per-model breakdown for ensemble predictions
+    function renderEnsembleSection(ensemble) {
+        const section = document.createElement('div');
+        section.className = 'report-section';
+        section.innerHTML = `
+            <h4><i class="fas fa-layer-group"></i> <span class="ensemble-title"></span></h4>
+            <div class="report-grid"></div>
+        `;
+        section.querySelector('.ensemble-title').textContent = `Ensemble Breakdown (${ensemble.strategy} vote)`;
+        
+        const grid = section.querySelector('.report-grid');
+        ensemble.models.forEach(model => {
+            const row = document.createElement('div');
+            row.className = 'report-item';
+            row.innerHTML = `
+                <strong></strong>
+                <div class="ensemble-result" style="margin-top: 8px;"></div>
+                <div class="ensemble-meta" style="margin-top: 4px; color: #718096; font-size: 0.9em;"></div>
+            `;
+            // Text content, so model names and error messages are never parsed as HTML
+            row.querySelector('strong').textContent = model.name;
+            row.querySelector('.ensemble-result').textContent = model.error
+                ? `Failed: ${model.error}`
+                : `${model.class_name} (${model.confidence}%)`;
+            row.querySelector('.ensemble-meta').textContent = `Weight ${model.weight} | ${model.latency_ms} ms`;
+            grid.appendChild(row);
+        });
+        return section;
+    }
+
     function displayPredictionResults(data) {
         const prediction = data.prediction;
         const image = data.image;
@@ -472,6 +633,8 @@ document.addEventListener('DOMContentLoaded', function() {
                 </div>
             </div>
             
+            ${data.ensemble ? '<div class="ensemble-breakdown"></div>' : ''}
+            
             <div class="report-section">
                 <h4><i class="fas fa-info-circle"></i> Condition Description</h4>
                 <p style="font-size: 1.1em; line-height: 1.6; color: #4a5568;">${prediction.description}</p>
@@ -488,6 +651,10 @@ document.addEventListener('DOMContentLoaded', function() {
             </div>
         `;
         
+        if (data.ensemble) {
+            resultsContent.querySelector('.ensemble-breakdown').replaceWith(renderEnsembleSection(data.ensemble));
+        }
+        
         // Store the current prediction data for potential saving
         if (!currentPredictionData) {
             currentPredictionData = {